@@ -0,0 +1,80 @@
+"""Print-sheet throughput: pages/sec for PDF and TIFF, against the one-PNG-per-request path
+
+Usage:
+    python benchmarks/bench_imposition.py --pages 4
+    python benchmarks/bench_imposition.py --pages 20 --workers 8 --output imposition.json
+"""
+import argparse
+import io
+import json
+import time
+
+from PIL import Image
+
+from bench_pipeline import peak_rss_mb
+from corpus import PRINT_SIZE_PX
+
+from imposition import SHEET_FORMATS, SheetImposer, SheetLayout, render_ticket
+from ticket_generator import TicketGenerator
+
+
+def bench_single_ticket(generator, tickets=50):
+    """ms per ticket: /generate's render, PNG, LANCZOS downscale, PNG; and drawing at print size"""
+    payloads = []
+    for i in range(tickets):
+        ticket_data = generator.generate_ticket_data(f"ONE{i:06d}")
+        inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+        payloads.append((ticket_data, inner_data))
+
+    started = time.perf_counter()
+    for ticket_data, inner_data in payloads:
+        buffer = io.BytesIO()
+        generator.render_composite(ticket_data, inner_data).save(buffer, format='PNG')
+        buffer.seek(0)
+        image = Image.open(buffer).resize((PRINT_SIZE_PX, PRINT_SIZE_PX), Image.Resampling.LANCZOS)
+        image.save(io.BytesIO(), format='PNG')
+    render_then_shrink = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for ticket_data, inner_data in payloads:
+        render_ticket(*generator.encode_payloads(ticket_data, inner_data), PRINT_SIZE_PX)
+    direct = time.perf_counter() - started
+    return {'generate_ms': render_then_shrink / tickets * 1000, 'direct_ms': direct / tickets * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=4, help='A4 pages per format')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--ticket-mm', type=float, default=10)
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--output', '-o', help='Write results as JSON')
+    args = parser.parse_args()
+
+    generator = TicketGenerator(bytes(range(32)))
+    layout = SheetLayout.a4(ticket_mm=args.ticket_mm, dpi=args.dpi)
+    imposer = SheetImposer(generator, layout)
+    results = {'layout': {'per_page': layout.per_page, 'width_px': layout.width, 'height_px': layout.height},
+               'single_ticket': bench_single_ticket(generator), 'formats': {}}
+    for sheet_format in SHEET_FORMATS:
+        specs = (f"SHEET{i:07d}" for i in range(layout.per_page * args.pages))
+        for _ in imposer.stream(specs, sheet_format, workers=args.workers):
+            pass
+        results['formats'][sheet_format] = imposer.last_stats
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    single = results['single_ticket']
+    print(f"\n{layout.per_page} tickets per A4 page ({layout.width}x{layout.height} px)")
+    print(f"per ticket: {single['generate_ms']:.1f} ms render+shrink, {single['direct_ms']:.1f} ms at print size")
+    for sheet_format, stats in results['formats'].items():
+        print(f"{sheet_format:>5}: {stats['pages_per_sec']:6.2f} pages/sec, {stats['tickets_per_sec']:7.1f} tickets/sec, "
+              f"{stats['bytes'] / stats['pages'] / 1024:6.0f} KiB/page")
+    print(f"peak RSS: {results['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
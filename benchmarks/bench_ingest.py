@@ -0,0 +1,129 @@
+"""Image ingestion cost: latency and traced memory per verification of phone-sized JPEGs
+
+Each photo is a composite ticket placed on a noisy background and JPEG encoded,
+like an upload from a handheld. Three ingestion paths are compared:
+
+    rgb      upload decoded to a full-colour PIL image, then converted to gray
+    gray     decoded straight to grayscale at full resolution (ingest_min_side=None)
+    reduced  decoded straight to grayscale, downscaled in the decoder when large
+
+Memory is the tracemalloc peak during one verification (NumPy and OpenCV output
+arrays are traced; OpenCV's internal scratch buffers are not). Latency is
+measured in a separate pass with tracing off.
+
+Usage:
+    python benchmarks/bench_ingest.py --photos 5
+    python benchmarks/bench_ingest.py --sizes 4032x3024 1920x1080 --output ingest.json
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+MODES = ('rgb', 'gray', 'reduced')
+
+
+def build_photos(generator, size, count, seed=1234):
+    """JPEG photos of size (width, height) with a ticket a quarter of the width across"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    photos = []
+    for i in range(count):
+        ticket_id = f"INGEST{i:05d}"
+        buffer = io.BytesIO()
+        generator.generate_composite_qr(ticket_id, buffer)
+        side = width // 4
+        ticket = np.asarray(Image.open(io.BytesIO(buffer.getvalue())).convert('RGB').resize(
+            (side, side), Image.Resampling.BILINEAR))
+        frame = rng.normal(170, 25, size=(height, width, 3)).clip(0, 255).astype(np.uint8)
+        left = int(rng.integers(0, width - side))
+        top = int(rng.integers(0, height - side))
+        frame[top:top + side, left:left + side] = ticket
+        encoded = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                               [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        photos.append((ticket_id, encoded))
+    return photos
+
+
+def verify(verifier, mode, data):
+    if mode == 'rgb':
+        data = verifier.load_image(data)
+    return verifier.verify_composite_qr(data, redeem=False)
+
+
+def bench_mode(secret_key, mode, photos):
+    verifier = TicketVerifier(secret_key, verbose=False, ingest_min_side=None if mode == 'gray' else 1500)
+    # Warm up codecs and template caches
+    verify(verifier, mode, photos[0][1])
+
+    valid = 0
+    latencies = []
+    for ticket_id, data in photos:
+        started = time.perf_counter()
+        is_valid, result = verify(verifier, mode, data)
+        latencies.append(time.perf_counter() - started)
+        valid += is_valid and result['ticket_id'] == ticket_id
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _, data in photos:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            verify(verifier, mode, data)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'valid': valid,
+        'photos': len(photos),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'peak_traced_mb': statistics.median(peaks) / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photos', type=int, default=5, help='Photos per size')
+    parser.add_argument('--sizes', nargs='+', default=['4032x3024', '1920x1080'],
+                        help='Photo sizes as WIDTHxHEIGHT')
+    parser.add_argument('--output', '-o', help='Write results as JSON')
+    args = parser.parse_args()
+
+    generator = TicketGenerator(bytes(range(32)))
+    results = {}
+    for size_arg in args.sizes:
+        size = tuple(int(side) for side in size_arg.split('x'))
+        photos = build_photos(generator, size, args.photos)
+        results[size_arg] = {mode: bench_mode(generator.secret_key, mode, photos) for mode in MODES}
+
+    print(f"{'size':>10} {'mode':>8} {'valid':>7} {'p50 ms':>8} {'peak MB':>8}")
+    for size_arg, modes in results.items():
+        for mode, stats in modes.items():
+            print(f"{size_arg:>10} {mode:>8} {stats['valid']:>3}/{stats['photos']:<3} "
+                  f"{stats['p50_ms']:8.1f} {stats['peak_traced_mb']:8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
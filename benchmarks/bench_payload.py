@@ -0,0 +1,119 @@
+"""Compare JSON and compact ticket payloads: symbol size, decode time and success rate
+
+Print size is swept separately: each clean ticket is shrunk to several widths in
+pixels, which stand in for the printed size at a fixed camera resolution.
+
+Usage:
+    python benchmarks/bench_payload.py --tickets 20
+    python benchmarks/bench_payload.py --degradations clean print_size --output payload.json
+"""
+import argparse
+import io
+import json
+import time
+
+from pyzbar.pyzbar import decode
+from PIL import Image
+
+from bench_pipeline import bench_verification, percentile
+from corpus import DEGRADATIONS, build_corpus
+
+import qr_template
+from ticket_generator import PAYLOAD_FORMATS, TicketGenerator
+from ticket_verifier import TicketVerifier
+
+PRINT_WIDTHS = (118, 160, 200, 240, 300, 400)
+
+
+def symbol_stats(payload_format):
+    """Payload lengths and modules per side for a typical ticket"""
+    generator = TicketGenerator(bytes(range(32)), payload_format=payload_format)
+    ticket_data = generator.generate_ticket_data("BENCH000001", ticket_price=100, draw_number=7)
+    inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+    outer, inner = generator.encode_payloads(ticket_data, inner_data)
+    image = generator.render_composite(ticket_data, inner_data)
+    return {
+        'outer_chars': len(outer),
+        'outer_modules': qr_template.symbol_size(outer),
+        'inner_chars': len(inner),
+        'inner_modules': qr_template.symbol_size(inner, version=1),
+        'image_px': image.width,
+    }
+
+
+def bench_decode(samples, rounds=3):
+    """Raw pyzbar time on the clean images, without the verifier's fallbacks"""
+    images = [Image.open(io.BytesIO(sample['image'])).convert('L')
+              for sample in samples if sample['degradation'] == 'clean']
+    latencies = []
+    for _ in range(rounds):
+        for image in images:
+            started = time.perf_counter()
+            decode(image)
+            latencies.append(time.perf_counter() - started)
+    return {'p50_ms': percentile(latencies, 0.5) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+def bench_print_sizes(secret_key, samples, widths, clock):
+    """Valid rate per width for the clean tickets shrunk to that many pixels"""
+    verifier = TicketVerifier(secret_key, verbose=False, clock=clock)
+    images = [Image.open(io.BytesIO(sample['image'])).convert('RGB')
+              for sample in samples if sample['degradation'] == 'clean']
+    rates = {}
+    for width in widths:
+        valid = sum(verifier.verify_composite_qr(image.resize((width, width), Image.Resampling.LANCZOS),
+                                                 redeem=False)[0] for image in images)
+        rates[width] = valid / len(images)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=20, help='Tickets per degradation')
+    parser.add_argument('--degradations', nargs='+', choices=list(DEGRADATIONS),
+                        default=['clean', 'blur', 'jpeg', 'print_size', 'print_size_upscaled'])
+    parser.add_argument('--print-widths', type=int, nargs='+', default=list(PRINT_WIDTHS))
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--profile', default='balanced', choices=['fast', 'balanced', 'robust'])
+    parser.add_argument('--output', '-o', help='Write results as JSON')
+    args = parser.parse_args()
+
+    degradations = sorted(set(args.degradations) | {'clean'}, key=list(DEGRADATIONS).index)
+    results = {}
+    for payload_format in PAYLOAD_FORMATS:
+        secret_key, samples, clock = build_corpus(args.tickets, degradations, args.seed,
+                                           payload_format=payload_format)
+        verification = bench_verification(secret_key, samples, args.profile, clock)
+        results[payload_format] = {
+            'symbol': symbol_stats(payload_format),
+            'decode': bench_decode(samples),
+            'print_size': bench_print_sizes(secret_key, samples, args.print_widths, clock),
+            'verification': {name: {'p50_ms': stats['p50_ms'], 'valid': stats['success_rate']['valid']}
+                             for name, stats in verification['degradations'].items()},
+        }
+
+    print(f"{'format':>8} {'outer':>12} {'inner':>12} {'image':>7} {'decode p50':>11}")
+    for payload_format, stats in results.items():
+        symbol = stats['symbol']
+        print(f"{payload_format:>8} {symbol['outer_chars']:4d}ch {symbol['outer_modules']:3d}m "
+              f"{symbol['inner_chars']:4d}ch {symbol['inner_modules']:3d}m {symbol['image_px']:5d}px "
+              f"{stats['decode']['p50_ms']:8.2f} ms")
+    print(f"\n{'degradation':>20}" + ''.join(f" {name + ' p50':>14} {'valid':>6}" for name in results))
+    for name in degradations:
+        row = f"{name:>20}"
+        for stats in results.values():
+            degraded = stats['verification'][name]
+            row += f" {degraded['p50_ms']:11.1f} ms {degraded['valid']:6.0%}"
+        print(row)
+
+    print(f"\n{'print width':>20}" + ''.join(f" {name:>24}" for name in results))
+    for width in args.print_widths:
+        print(f"{width:>17} px" + ''.join(f" {stats['print_size'][width]:24.0%}" for stats in results.values()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Generation and verification throughput over a synthetic, degraded ticket corpus
+
+Usage:
+    python benchmarks/bench_pipeline.py --tickets 50 --output results.json
+    python benchmarks/bench_pipeline.py --corpus corpus/ --baseline results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from corpus import DEGRADATIONS, PARENT_DIR, build_corpus, load_corpus, save_corpus
+
+from payload_verifier import PayloadVerifier
+from ticket_generator import PAYLOAD_FORMATS, TicketGenerator
+from ticket_verifier import TicketVerifier
+
+# Which pipeline stage a failure message points at
+STAGE_FAILURES = {
+    'Could not read main QR code': 'main_decode',
+    'Could not read inner QR code': 'inner_decode',
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def summarize(latencies):
+    total = sum(latencies)
+    return {
+        'count': len(latencies),
+        'per_sec': len(latencies) / total if total else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def bench_generation(tickets):
+    generator = TicketGenerator(bytes(range(32)))
+    # Warm up template caches so the steady-state cost is measured
+    generator.generate_composite_qr("WARMUP000", io.BytesIO())
+    latencies = []
+    for i in range(tickets):
+        started = time.perf_counter()
+        generator.generate_composite_qr(f"GEN{i:06d}", io.BytesIO())
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def bench_verification(secret_key, samples, profile, clock=time.time):
+    verifier = TicketVerifier(secret_key, preprocess_profile=profile, verbose=False, clock=clock)
+    by_degradation = defaultdict(lambda: {'latencies': [], 'main_decode': 0, 'inner_decode': 0, 'valid': 0,
+                                          'failures': defaultdict(int)})
+    for sample in samples:
+        stats = by_degradation[sample['degradation']]
+        started = time.perf_counter()
+        is_valid, result = verifier.verify_composite_qr(sample['image'], redeem=False)
+        stats['latencies'].append(time.perf_counter() - started)
+
+        # Stages succeed in order, so a failure at one stage means every earlier one passed
+        failed_stage = None if is_valid else STAGE_FAILURES.get(result, 'checks')
+        if failed_stage != 'main_decode':
+            stats['main_decode'] += 1
+            if failed_stage != 'inner_decode':
+                stats['inner_decode'] += 1
+        if is_valid and result['ticket_id'] == sample['ticket_id']:
+            stats['valid'] += 1
+        elif not is_valid:
+            stats['failures'][str(result).split(':', 1)[0]] += 1
+
+    results = {}
+    all_latencies = []
+    for name, stats in by_degradation.items():
+        count = len(stats['latencies'])
+        all_latencies.extend(stats['latencies'])
+        results[name] = {
+            **summarize(stats['latencies']),
+            'success_rate': {
+                'main_decode': stats['main_decode'] / count,
+                'inner_decode': stats['inner_decode'] / count,
+                'valid': stats['valid'] / count,
+            },
+            'failures': dict(stats['failures'])
+        }
+    return {
+        'overall': summarize(all_latencies),
+        'degradations': results,
+        'stages': verifier.instrumentation.snapshot()['stages']
+    }
+
+
+def bench_payload_verification(tickets, rounds=20):
+    """verify_ticket/verify_tickets throughput on pre-decoded payloads, per payload format"""
+    secret_key = bytes(range(32))
+    results = {}
+    for payload_format in PAYLOAD_FORMATS:
+        generator = TicketGenerator(secret_key, payload_format=payload_format)
+        payloads = []
+        for i in range(tickets):
+            ticket_data = generator.generate_ticket_data(f"PAY{i:06d}", ticket_price=100, draw_number=i % 50)
+            inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+            payloads.append(generator.encode_payloads(ticket_data, inner_data))
+        verifier = PayloadVerifier(secret_key, verbose=False)
+
+        latencies = []
+        for _ in range(rounds):
+            for outer, inner in payloads:
+                started = time.perf_counter()
+                verifier.verify_ticket(outer, inner, redeem=False)
+                latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            verifier.verify_tickets(payloads, redeem=False)
+        batch_seconds = time.perf_counter() - started
+        results[payload_format] = {
+            'single': summarize(latencies),
+            'batch_per_sec': len(payloads) * rounds / batch_seconds,
+        }
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PARENT_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Print per-metric changes against a baseline; returns False on a regression"""
+    ok = True
+    rows = [('generation', results['generation'], baseline.get('generation', {}))]
+    rows.append(('verification', results['verification']['overall'],
+                 baseline.get('verification', {}).get('overall', {})))
+    for name, current, previous in rows:
+        if previous.get('per_sec'):
+            change = current['per_sec'] / previous['per_sec'] - 1
+            print(f"{name:>20} throughput: {previous['per_sec']:.1f} -> {current['per_sec']:.1f}/s ({change:+.1%})")
+            ok &= change >= -max_regression
+    for name, current in results['verification']['degradations'].items():
+        previous = baseline.get('verification', {}).get('degradations', {}).get(name)
+        if previous:
+            was, now = previous['success_rate']['valid'], current['success_rate']['valid']
+            print(f"{name:>20} success:    {was:.1%} -> {now:.1%}")
+            ok &= now >= was - max_regression
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=30, help='Tickets per degradation')
+    parser.add_argument('--degradations', nargs='+', choices=list(DEGRADATIONS),
+                        help='Degradations to include (default: all)')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--corpus', help='Corpus directory to reuse (built and saved there if missing)')
+    parser.add_argument('--profile', default='balanced', choices=['fast', 'balanced', 'robust'])
+    parser.add_argument('--output', '-o', help='Write results as JSON')
+    parser.add_argument('--baseline', help='Compare against an earlier results JSON')
+    parser.add_argument('--max-regression', type=float, default=0.1,
+                        help='Allowed drop in throughput or success rate before exiting non-zero')
+    args = parser.parse_args()
+
+    if args.corpus and os.path.exists(os.path.join(args.corpus, 'manifest.json')):
+        secret_key, samples, clock = load_corpus(args.corpus)
+    else:
+        secret_key, samples, clock = build_corpus(args.tickets, args.degradations, args.seed)
+        if args.corpus:
+            save_corpus(args.corpus, secret_key, samples)
+
+    results = {
+        'environment': environment(),
+        'config': {'tickets': args.tickets, 'seed': args.seed, 'profile': args.profile,
+                   'samples': len(samples)},
+        'generation': bench_generation(args.tickets),
+        'verification': bench_verification(secret_key, samples, args.profile, clock),
+        'payload_verification': bench_payload_verification(args.tickets),
+    }
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    print(f"Generation:   {results['generation']['per_sec']:.1f} tickets/sec, "
+          f"p50 {results['generation']['p50_ms']:.1f} ms, p99 {results['generation']['p99_ms']:.1f} ms")
+    print(f"{'degradation':>20} {'img/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'main':>6} {'inner':>6} {'valid':>6}")
+    for name, stats in results['verification']['degradations'].items():
+        rates = stats['success_rate']
+        print(f"{name:>20} {stats['per_sec']:7.1f} {stats['p50_ms']:8.1f} {stats['p99_ms']:8.1f} "
+              f"{rates['main_decode']:6.0%} {rates['inner_decode']:6.0%} {rates['valid']:6.0%}")
+    for payload_format, stats in results['payload_verification'].items():
+        print(f"Payload verify ({payload_format}): {stats['single']['per_sec']:.0f}/sec single, "
+              f"{stats['batch_per_sec']:.0f}/sec batched, p99 {stats['single']['p99_ms']:.3f} ms")
+    print(f"Peak RSS:     {results['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
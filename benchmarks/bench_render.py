@@ -0,0 +1,68 @@
+"""Compare per-ticket composite rendering time: LogoQR drawing vs the NumPy template renderer"""
+import argparse
+import io
+import os
+import sys
+import time
+
+# Add parent directory to path to import ticket modules
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from ticket_generator import TicketGenerator
+
+
+def png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def bench(generator, tickets):
+    """Return (render seconds/ticket, render+PNG seconds/ticket, PNG bytes)"""
+    render_time = 0.0
+    encode_time = 0.0
+    images = []
+    for ticket_data, inner_data in tickets:
+        started = time.perf_counter()
+        image = generator.render_composite(ticket_data, inner_data)
+        rendered = time.perf_counter()
+        images.append(png_bytes(image))
+        render_time += rendered - started
+        encode_time += time.perf_counter() - rendered
+    return render_time / len(tickets), (render_time + encode_time) / len(tickets), images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tickets", type=int, default=200)
+    args = parser.parse_args()
+
+    legacy = TicketGenerator(use_template=False)
+    template = TicketGenerator(legacy.secret_key, use_template=True)
+
+    tickets = []
+    for i in range(args.tickets):
+        ticket_data = legacy.generate_ticket_data(f"TKT{i:08d}", ticket_price=100, draw_number=i % 50)
+        inner_data, _ = legacy.generate_inner_qr_data(ticket_data)
+        tickets.append((ticket_data, inner_data))
+
+    # Warm up template caches so the steady-state cost is measured
+    template.render_composite(*tickets[0])
+
+    legacy_render, legacy_total, legacy_images = bench(legacy, tickets)
+    template_render, template_total, template_images = bench(template, tickets)
+
+    identical = legacy_images == template_images
+    print(f"Tickets rendered:   {args.tickets}")
+    print(f"LogoQR renderer:    {legacy_render * 1000:.2f} ms/ticket ({legacy_total * 1000:.2f} ms with PNG encode)")
+    print(f"Template renderer:  {template_render * 1000:.2f} ms/ticket ({template_total * 1000:.2f} ms with PNG encode)")
+    print(f"Render speedup:     {legacy_render / template_render:.2f}x")
+    print(f"Byte-identical PNG: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Cold-start cost: module import time and time to the first verification in a fresh process
+
+Every measurement runs in a new interpreter, which is what a freshly forked or
+restarted worker sees. "preloaded" runs lazy_imports.preload() first, as the
+gunicorn master does with PRELOAD=1, and reports the first verification after it.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+IMPORTS = ('payload_verifier', 'ticket_generator', 'ticket_verifier', 'app')
+
+# Run in the child; prints one JSON object of timings in milliseconds
+_IMPORT = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = sorted(m for m in ('numpy', 'cv2', 'PIL', 'pyzbar', 'qrcode', 'Crypto') if m in sys.modules)
+print(json.dumps({{'import_ms': elapsed * 1000, 'loaded': heavy}}))
+"""
+
+_FIRST_VERIFY = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+timings = {{}}
+started = time.perf_counter()
+if {preloaded}:
+    import lazy_imports
+    lazy_imports.preload()
+    timings['preload_ms'] = (time.perf_counter() - started) * 1000
+import ticket_verifier
+verifier = ticket_verifier.TicketVerifier(bytes.fromhex({key!r}), verbose=False)
+with open({ticket!r}, 'rb') as f:
+    image = f.read()
+started = time.perf_counter()
+is_valid, _ = verifier.verify_composite_qr(image, redeem=False)
+timings['first_verify_ms'] = (time.perf_counter() - started) * 1000
+started = time.perf_counter()
+verifier.verify_composite_qr(image, redeem=False)
+timings['second_verify_ms'] = (time.perf_counter() - started) * 1000
+started = time.perf_counter()
+verifier.verify_ticket({payload!r}, redeem=False)
+timings['payload_verify_ms'] = (time.perf_counter() - started) * 1000
+timings['valid'] = is_valid
+print(json.dumps(timings))
+"""
+
+
+def run_child(code):
+    env = dict(os.environ, REDEMPTION_STORE='memory', PRELOAD='0')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True, cwd=os.path.join(PARENT_DIR, 'webapp'), env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median_of(runs):
+    """Median of every numeric field over the runs; other fields from the first run"""
+    summary = dict(runs[0])
+    for key, value in runs[0].items():
+        if isinstance(value, float):
+            summary[key] = statistics.median(run[key] for run in runs)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per measurement')
+    parser.add_argument('--output', '-o', help='Write results as JSON')
+    args = parser.parse_args()
+
+    from ticket_generator import TicketGenerator
+    paths = [PARENT_DIR, os.path.join(PARENT_DIR, 'webapp')]
+    secret_key = bytes(range(32))
+    generator = TicketGenerator(secret_key)
+
+    results = {'imports': {}, 'first_verify': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        ticket = os.path.join(tmp, 'ticket.png')
+        generator.generate_composite_qr("STARTUP0001", ticket)
+        payload = json.dumps(generator.generate_ticket_data("STARTUP0002"))
+
+        for module in IMPORTS:
+            code = _IMPORT.format(paths=paths, module=module)
+            results['imports'][module] = median_of([run_child(code) for _ in range(args.runs)])
+        for preloaded in (False, True):
+            code = _FIRST_VERIFY.format(paths=paths, preloaded=preloaded, key=secret_key.hex(),
+                                        ticket=ticket, payload=payload)
+            name = 'preloaded' if preloaded else 'cold'
+            results['first_verify'][name] = median_of([run_child(code) for _ in range(args.runs)])
+
+    print(f"{'import':>18} {'ms':>8}  imaging modules loaded")
+    for module, stats in results['imports'].items():
+        print(f"{module:>18} {stats['import_ms']:8.1f}  {', '.join(stats['loaded']) or '-'}")
+    print(f"\n{'':>18} {'preload':>8} {'1st verify':>11} {'2nd verify':>11} {'payload':>8}")
+    for name, stats in results['first_verify'].items():
+        print(f"{name:>18} {stats.get('preload_ms', 0.0):6.1f}ms {stats['first_verify_ms']:9.1f}ms "
+              f"{stats['second_verify_ms']:9.1f}ms {stats['payload_verify_ms']:6.2f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
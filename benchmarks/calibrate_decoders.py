@@ -0,0 +1,80 @@
+"""Pick the QR decoder backend for this machine from the benchmark corpus
+
+Every available backend, and every race of two of them, verifies the whole
+corpus. The fastest spec (by mean verification time) whose success rate meets
+--target is written to the calibration file, which the webapp loads with
+QR_DECODER=auto. Run it on the hardware that will serve scans: racing only pays
+off with idle cores.
+
+Usage:
+    python benchmarks/calibrate_decoders.py --tickets 20 --target 0.95
+    python benchmarks/calibrate_decoders.py --corpus corpus/ --output decoder_calibration.json
+"""
+import argparse
+import itertools
+import json
+import statistics
+import time
+
+from corpus import build_corpus, load_corpus
+
+import qr_decoders
+from ticket_verifier import TicketVerifier
+
+
+def candidate_specs(backends):
+    return list(backends) + [f"race:{a},{b}" for a, b in itertools.combinations(backends, 2)]
+
+
+def measure(secret_key, samples, spec, clock):
+    verifier = TicketVerifier(secret_key, verbose=False, decoder=spec, clock=clock)
+    # Warm up codecs and per-thread detectors
+    verifier.verify_composite_qr(samples[0]['image'], redeem=False)
+    valid = 0
+    latencies = []
+    for sample in samples:
+        started = time.perf_counter()
+        is_valid, result = verifier.verify_composite_qr(sample['image'], redeem=False)
+        latencies.append(time.perf_counter() - started)
+        valid += is_valid and result['ticket_id'] == sample['ticket_id']
+    return {
+        'success_rate': valid / len(samples),
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': statistics.median(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help='Corpus directory from bench_pipeline.py (built in memory if omitted)')
+    parser.add_argument('--tickets', type=int, default=20, help='Tickets when building the corpus')
+    parser.add_argument('--target', type=float, default=0.95, help='Minimum verification success rate')
+    parser.add_argument('--decoders', nargs='+', help='Specs to try (default: every backend and pair race)')
+    parser.add_argument('--output', '-o', default=qr_decoders.DEFAULT_CALIBRATION,
+                        help='Calibration file to write')
+    args = parser.parse_args()
+
+    if args.corpus:
+        secret_key, samples, clock = load_corpus(args.corpus)
+    else:
+        secret_key, samples, clock = build_corpus(args.tickets)
+    specs = args.decoders or candidate_specs(qr_decoders.available_backends())
+
+    results = {}
+    for spec in specs:
+        results[spec] = measure(secret_key, samples, spec, clock)
+        stats = results[spec]
+        print(f"{spec:>24} {stats['success_rate']:7.1%} {stats['mean_ms']:8.1f}ms mean "
+              f"{stats['p50_ms']:8.1f}ms p50")
+
+    chosen = qr_decoders.choose_decoder(results, args.target)
+    if results[chosen]['success_rate'] < args.target:
+        print(f"No decoder reaches {args.target:.0%}; using the most successful one")
+    print(f"Chosen decoder: {chosen}")
+    with open(args.output, 'w') as f:
+        json.dump({'decoder': chosen, 'target': args.target, 'samples': len(samples), 'results': results},
+                  f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
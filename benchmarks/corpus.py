@@ -0,0 +1,149 @@
+"""Synthetic corpus of composite tickets with controlled, reproducible degradations"""
+import io
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageFilter
+
+# Add parent directory to path to import ticket modules
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.append(PARENT_DIR)
+
+from ticket_generator import TicketGenerator
+
+# /generate serves 10 mm at 300 dpi
+PRINT_SIZE_PX = int(0.3937 * 300)
+
+# Tickets are issued at this fixed Unix time (2026-01-01 UTC), so a corpus renders
+# the same bytes every run and never expires; verify it with corpus_clock
+ISSUED_AT = 1767225600
+
+
+def _blur(image, rng):
+    return image.filter(ImageFilter.GaussianBlur(radius=2.5))
+
+
+def _jpeg(image, rng):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=25)
+    buffer.seek(0)
+    return Image.open(buffer).convert('RGB')
+
+
+def _rotation(image, rng):
+    angle = rng.uniform(5, 12) * rng.choice([-1, 1])
+    return image.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor='white')
+
+
+def _offset(image, rng):
+    # Ticket off-center in a wider phone frame, so the middle third misses the inner code
+    frame = Image.new('RGB', (image.width + 400, image.height + 300), 'white')
+    frame.paste(image, (int(rng.integers(0, 400)), int(rng.integers(0, 300))))
+    return frame
+
+
+def _perspective(image, rng):
+    pixels = np.asarray(image)
+    height, width = pixels.shape[:2]
+    src = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    # Each corner moves inwards by up to 8% of the side, like a phone held at an angle
+    jitter = rng.uniform(0, 0.08, size=(4, 2)) * [width, height]
+    dst = np.float32(src + jitter * [[1, 1], [-1, 1], [-1, -1], [1, -1]])
+    matrix = cv2.getPerspectiveTransform(src, dst)
+    warped = cv2.warpPerspective(pixels, matrix, (width, height), borderValue=(255, 255, 255))
+    return Image.fromarray(warped)
+
+
+def _low_contrast(image, rng):
+    pixels = np.asarray(image).astype(np.float32)
+    return Image.fromarray((100 + pixels * (60 / 255)).astype(np.uint8))
+
+
+def _print_size(image, rng):
+    return image.resize((PRINT_SIZE_PX, PRINT_SIZE_PX), Image.Resampling.LANCZOS)
+
+
+def _print_size_upscaled(image, rng):
+    # A 118 px print photographed and blown back up by the camera pipeline
+    small = _print_size(image, rng)
+    return small.resize(image.size, Image.Resampling.BICUBIC)
+
+
+DEGRADATIONS = {
+    'clean': lambda image, rng: image,
+    'blur': _blur,
+    'jpeg': _jpeg,
+    'rotation': _rotation,
+    'offset': _offset,
+    'perspective': _perspective,
+    'low_contrast': _low_contrast,
+    'print_size': _print_size,
+    'print_size_upscaled': _print_size_upscaled,
+}
+
+
+def corpus_clock(issued_at=ISSUED_AT):
+    """Clock for verifying a corpus: an hour after its tickets were issued"""
+    return lambda: issued_at + 3600
+
+
+def build_corpus(tickets=50, degradations=None, seed=1234, secret_key=None, payload_format='json',
+                 issued_at=ISSUED_AT):
+    """Render tickets and apply each degradation, returning (secret_key, samples, clock)
+
+    Samples are dicts with ticket_id, degradation and the degraded image as PNG
+    bytes; clock is the corpus_clock verifiers should use. Tickets are issued at
+    issued_at, so the same seed always produces the same corpus.
+    """
+    generator = TicketGenerator(secret_key or bytes(range(32)), payload_format=payload_format,
+                                clock=lambda: issued_at)
+    rng = np.random.default_rng(seed)
+    names = degradations or list(DEGRADATIONS)
+    samples = []
+    for i in range(tickets):
+        ticket_id = f"BENCH{i:06d}"
+        buffer = io.BytesIO()
+        generator.generate_composite_qr(ticket_id, buffer, ticket_price=100, draw_number=i % 50)
+        clean = Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+        for name in names:
+            degraded = DEGRADATIONS[name](clean, rng)
+            out = io.BytesIO()
+            degraded.save(out, format='PNG')
+            samples.append({'ticket_id': ticket_id, 'degradation': name, 'image': out.getvalue()})
+    return generator.secret_key, samples, corpus_clock(issued_at)
+
+
+def save_corpus(path, secret_key, samples, issued_at=ISSUED_AT):
+    """Write samples as PNG files plus a manifest.json"""
+    os.makedirs(path, exist_ok=True)
+    manifest = {'secret_key': secret_key.hex(), 'issued_at': issued_at, 'samples': []}
+    for sample in samples:
+        name = f"{sample['degradation']}_{sample['ticket_id']}.png"
+        with open(os.path.join(path, name), 'wb') as f:
+            f.write(sample['image'])
+        manifest['samples'].append({'ticket_id': sample['ticket_id'], 'degradation': sample['degradation'],
+                                    'file': name})
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_corpus(path):
+    """Read a corpus written by save_corpus, returning (secret_key, samples, clock)
+
+    Corpora saved before issued_at was recorded were issued on the real clock
+    and are checked against it.
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    samples = []
+    for entry in manifest['samples']:
+        with open(os.path.join(path, entry['file']), 'rb') as f:
+            samples.append({'ticket_id': entry['ticket_id'], 'degradation': entry['degradation'],
+                            'image': f.read()})
+    clock = corpus_clock(manifest['issued_at']) if 'issued_at' in manifest else time.time
+    return bytes.fromhex(manifest['secret_key']), samples, clock
@@ -0,0 +1,94 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy')
+
+# Snapshot layout: fixed header followed by the raw bit array, so a snapshot can be
+# memory-mapped directly and shared by every worker through the page cache
+_MAGIC = b'LTBF'
+_HEADER = struct.Struct('<4sBBxxQQQ')  # magic, format version, hashes, bits, items, capacity
+_FORMAT_VERSION = 1
+
+
+class BloomFilter:
+    """Compact probabilistic set of ticket IDs; no false negatives, tunable false positives"""
+
+    def __init__(self, capacity, error_rate=0.001, num_bits=None, num_hashes=None, bits=None, count=0):
+        """Size the filter for capacity IDs at the target false-positive rate"""
+        self.capacity = int(capacity)
+        if num_bits is None:
+            num_bits = max(64, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        if num_hashes is None:
+            num_hashes = max(1, int(round(num_bits / max(self.capacity, 1) * math.log(2))))
+        self.num_bits = int(num_bits)
+        self.num_hashes = int(num_hashes)
+        self.bits = bits if bits is not None else np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = count
+        # Scalar lookups through a memoryview avoid NumPy per-element overhead
+        self._view = memoryview(self.bits).cast('B')
+
+    def _positions(self, ticket_id):
+        # Double hashing: k positions from two 64-bit halves of one BLAKE2b digest
+        digest = hashlib.blake2b(ticket_id.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        h2 |= 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, ticket_id):
+        view = self._view
+        for position in self._positions(ticket_id):
+            view[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, ticket_id):
+        view = self._view
+        for position in self._positions(ticket_id):
+            if not view[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def writable(self):
+        """False for snapshots mapped read-only"""
+        return not self._view.readonly
+
+    @property
+    def memory_bytes(self):
+        """Size of the bit array"""
+        return self.bits.nbytes
+
+    def prefault(self):
+        """Read one byte per page, so a mapped snapshot is resident before workers fork"""
+        int(self.bits[::mmap.PAGESIZE].sum())
+
+    def false_positive_rate(self):
+        """Expected false-positive rate at the current fill"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path):
+        """Write a snapshot atomically"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, self.num_hashes, self.num_bits, self.count, self.capacity))
+            f.write(memoryview(np.ascontiguousarray(self.bits)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mode='c'):
+        """Memory-map a snapshot
+
+        mode 'r' maps it read-only; the default 'c' is copy-on-write, so workers share
+        the snapshot pages and only pages touched by local additions become private.
+        """
+        with open(path, 'rb') as f:
+            magic, version, num_hashes, num_bits, count, capacity = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"Not a ticket filter snapshot: {path}")
+        bits = np.memmap(path, dtype=np.uint8, mode=mode, offset=_HEADER.size, shape=((num_bits + 7) // 8,))
+        return cls(capacity, num_bits=num_bits, num_hashes=num_hashes, bits=bits, count=count)
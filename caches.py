@@ -0,0 +1,345 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def content_key(*parts):
+    """Hex SHA-256 over the parts, for keys (and ETags) that change whenever the content does"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ImageCache:
+    """Rendered ticket images by content key, least recently used evicted first
+
+    The in-process tier holds up to max_bytes. With a directory, images are also
+    written there (one file per key, shared by every worker) and trimmed back
+    under max_disk_bytes, oldest first. Keys must be content-addressed, e.g.
+    content_key over the signed payloads: an entry is never stale, only evicted.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(directory)
+                                   if entry.name.endswith('.img'))
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.img")
+
+    def get(self, key):
+        """Cached bytes for key, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return data
+        if self.directory is not None:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                self._remember(key, data)
+                return data
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.directory is not None:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += len(data)
+                over = self._disk_bytes > self.max_disk_bytes
+            if over:
+                self._trim_disk()
+
+    def get_or_render(self, key, render):
+        """Cached bytes for key, calling render() and caching its result on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def _trim_disk(self):
+        """Delete the oldest files until the directory is back under 90% of max_disk_bytes"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.img'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another worker trimmed it first
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._stats['disk_evictions'] += removed
+
+    def stats(self):
+        """Hit/miss counts and sizes, for /metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(items=len(self._entries), bytes=self._bytes)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        if self.directory is not None:
+            stats['disk_bytes'] = self._disk_bytes
+        return stats
+
+    def __contains__(self, key):
+        return key in self._entries or (self.directory is not None and os.path.exists(self._path(key)))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ScanResultCache:
+    """Recent verdicts by (client request ID, upload digest), so a retried upload gets the first answer
+
+    Handhelds on bad Wi-Fi resend the same request. The first attempt decodes
+    and redeems; retries within ttl seconds get its (is_valid, result) back
+    without decoding again, so they never see their own redemption as "Ticket
+    already used". A retry that arrives while the first attempt is still running
+    waits for it. Failures (overload, missed deadlines) are not kept, so those
+    retries run again. Uploads without a request ID are never cached: the same
+    photo uploaded twice on purpose must be checked twice.
+
+    With a path, verdicts are also kept in a SQLite database there, shared by
+    every worker process, so a retry that lands on another worker still gets the
+    first answer. The first attempt claims the key in the database; a retry on
+    another worker polls until the verdict arrives, or until the claim is
+    released (the attempt failed) or older than claim_timeout (its worker died).
+    """
+
+    def __init__(self, ttl=120.0, max_items=10000, clock=time.time, path=None, claim_timeout=30.0,
+                 poll_interval=0.05):
+        self.ttl = ttl
+        self.max_items = max_items
+        # Shared entries are compared across processes, so the clock must be too
+        self.clock = clock
+        self.path = path
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        # key -> (expires_at, Future); insertion order is expiry order
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'shared_hits': 0}
+
+    @staticmethod
+    def key(request_id, data):
+        """Cache key for an upload, or None without a request ID"""
+        if not request_id:
+            return None
+        return content_key('scan', request_id, data)
+
+    def _claim(self, key):
+        """(future, owner): the entry's future, and whether the caller has to fill it"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                future = entry[1]
+                self._stats['hits'] += 1
+                if not future.done():
+                    self._stats['waits'] += 1
+                return future, False
+            self._stats['misses'] += 1
+            future = Future()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, future)
+            while self._entries:
+                oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+                if expires_at > now and len(self._entries) <= self.max_items:
+                    break
+                del self._entries[oldest_key]
+            return future, True
+
+    def _forget(self, key, future, error):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is future:
+                del self._entries[key]
+        future.set_exception(error)
+
+    def _connection(self):
+        # Connections must not cross threads or forked workers, so keep one per thread and pid
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scans ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, verdict TEXT"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS scans_expiry ON scans (expires_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _shared_claim(self, key):
+        """(owner, verdict) from the shared tier: claim the key, or read another worker's verdict
+
+        verdict is None while another worker holds the claim.
+        """
+        now = self.clock()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM scans WHERE expires_at <= ?", (now,))
+            row = conn.execute("SELECT verdict FROM scans WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO scans (key, expires_at, verdict) VALUES (?, ?, NULL)",
+                             (key, now + self.claim_timeout))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return True, None
+        return False, None if row[0] is None else tuple(json.loads(row[0]))
+
+    def _shared_release(self, key):
+        self._connection().execute("DELETE FROM scans WHERE key = ? AND verdict IS NULL", (key,))
+
+    def _shared_store(self, key, result):
+        self._connection().execute("UPDATE scans SET expires_at = ?, verdict = ? WHERE key = ?",
+                                   (self.clock() + self.ttl, json.dumps(result), key))
+
+    def _shared_hit(self):
+        with self._lock:
+            self._stats['shared_hits'] += 1
+
+    def _verify_shared(self, key, verify):
+        """verify() once across processes, through the shared tier"""
+        while True:
+            owner, verdict = self._shared_claim(key)
+            if owner:
+                break
+            if verdict is not None:
+                self._shared_hit()
+                return verdict
+            time.sleep(self.poll_interval)
+        try:
+            result = verify()
+        except BaseException:
+            self._shared_release(key)
+            raise
+        self._shared_store(key, result)
+        return result
+
+    async def _verify_shared_async(self, key, verify):
+        # SQLite calls can wait out another worker's write lock, so they run on the
+        # default executor; each of its threads opens its own connection
+        while True:
+            owner, verdict = await asyncio.to_thread(self._shared_claim, key)
+            if owner:
+                break
+            if verdict is not None:
+                self._shared_hit()
+                return verdict
+            await asyncio.sleep(self.poll_interval)
+        try:
+            result = await verify()
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(self._shared_release, key))
+            raise
+        await asyncio.to_thread(self._shared_store, key, result)
+        return result
+
+    def get_or_verify(self, key, verify):
+        """verify()'s result for this key, calling it only for the first request"""
+        if key is None:
+            return verify()
+        future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        try:
+            result = self._verify_shared(key, verify) if self.path else verify()
+        except BaseException as e:
+            self._forget(key, future, e)
+            raise
+        future.set_result(result)
+        return result
+
+    async def get_or_verify_async(self, key, verify):
+        """get_or_verify for a coroutine function, without blocking the event loop"""
+        if key is None:
+            return await verify()
+        future, owner = self._claim(key)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await (self._verify_shared_async(key, verify) if self.path else verify())
+        except BaseException as e:
+            self._forget(key, future, e)
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        """Hit/miss counts, for /metrics"""
+        with self._lock:
+            stats = dict(self._stats, items=len(self._entries))
+        # Shared hits missed this process's entries first
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
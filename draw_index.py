@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+
+# How often (seconds) a file-backed index checks its file for changes
+RELOAD_INTERVAL = 1.0
+
+
+class DrawIndex:
+    """Open draws by draw number, each with the window tickets for it are valid in
+
+    A scan checks one integer: the scan time against the draw's closing time.
+    Draws the index does not know are left to the draw date on the ticket.
+    Closing a draw moves its close to now, so every ticket for it is rejected at
+    once without touching the tickets; archiving also drops it from the live
+    index. Listeners registered with on_close hear about both, e.g. to drop
+    cached results for the draw.
+
+    An index loaded with from_file follows its file like a file-backed Keyring:
+    closing or archiving a draw in one process and saving the file reaches every
+    worker within reload_interval seconds, without a restart.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.path = None
+        self.reload_interval = RELOAD_INTERVAL
+        self.last_error = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._windows = {}
+        self._closes = {}
+        self._archived = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, clock=time.time):
+        """Read draws written by save"""
+        index = cls(clock)
+        index._set_state(*_read_state(path))
+        return index
+
+    @classmethod
+    def from_file(cls, path, reload_interval=RELOAD_INTERVAL, clock=time.time):
+        """Read draws written by save and follow later changes to the file"""
+        index = cls(clock)
+        index.path = path
+        index.reload_interval = reload_interval
+        index.reload()
+        if index.last_error is not None:
+            raise index.last_error
+        return index
+
+    def save(self, path):
+        with self._lock:
+            state = {
+                'open': {str(number): list(window) for number, window in self._windows.items()},
+                'archived': {str(number): list(window) for number, window in self._archived.items()},
+            }
+        # Replace the file in one step so following processes never read half of it
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_path, path)
+
+    def reload(self):
+        """Re-read the index file if it changed; returns True if draws were replaced
+
+        Draws the new file closes earlier or archives are announced to on_close
+        listeners. A missing or malformed file keeps the current draws and is
+        recorded in last_error rather than raised.
+        """
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            try:
+                stat = os.stat(self.path)
+                # save() replaces the file, so a new inode marks a change even within one mtime tick
+                mtime = (stat.st_mtime_ns, stat.st_ino)
+                if mtime == self._mtime:
+                    return False
+                windows, archived = _read_state(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.last_error = e
+                return False
+            previous = self._closes
+            self._mtime = mtime
+            self.last_error = None
+        self._set_state(windows, archived)
+        for number, closes_at in previous.items():
+            window = windows.get(number) or archived.get(number)
+            if window is not None and (number not in windows or window[1] < closes_at):
+                self._notify(number, window)
+        return True
+
+    def _maybe_reload(self):
+        if self.path is not None and time.monotonic() >= self._next_check:
+            self.reload()
+
+    def _set_state(self, windows, archived):
+        # One assignment each, so concurrent lookups see whole old or new draws
+        with self._lock:
+            self._windows = windows
+            self._closes = {number: window[1] for number, window in windows.items()}
+            self._archived = archived
+
+    def open_draw(self, number, opens_at, closes_at):
+        """Start selling (and verifying) tickets for a draw until closes_at"""
+        if closes_at <= opens_at:
+            raise ValueError("A draw must close after it opens")
+        with self._lock:
+            self._windows[number] = (int(opens_at), int(closes_at))
+            self._closes[number] = int(closes_at)
+            self._archived.pop(number, None)
+
+    def window(self, number):
+        """(opens_at, closes_at) of an open or archived draw, or None"""
+        return self._windows.get(number) or self._archived.get(number)
+
+    def closes_at(self, number):
+        self._maybe_reload()
+        return self._closes.get(number)
+
+    def is_open(self, number, now=None):
+        """Whether tickets for the draw can be issued at now"""
+        self._maybe_reload()
+        window = self._windows.get(number)
+        now = self.clock() if now is None else now
+        return window is not None and window[0] <= now < window[1]
+
+    def knows(self, number):
+        """Whether the draw is open or archived here"""
+        self._maybe_reload()
+        return number in self._closes or number in self._archived
+
+    def check(self, number, now):
+        """None if a ticket for this known draw is still valid at now, else the reason it is not"""
+        closes_at = self._closes.get(number)
+        if closes_at is None or now >= closes_at:
+            return "Draw closed"
+        return None
+
+    def close_draw(self, number, at=None):
+        """Close a draw now (or at a given time), rejecting all of its tickets from then on"""
+        with self._lock:
+            opens_at, closes_at = self._windows[number]
+            closes_at = min(closes_at, int(self.clock() if at is None else at))
+            self._windows[number] = (opens_at, closes_at)
+            self._closes[number] = closes_at
+        self._notify(number, (opens_at, closes_at))
+
+    def archive_draw(self, number):
+        """Close a draw and move it out of the live index"""
+        with self._lock:
+            opens_at, closes_at = self._windows.pop(number)
+            self._closes.pop(number)
+            window = self._archived[number] = (opens_at, min(closes_at, int(self.clock())))
+        self._notify(number, window)
+        return window
+
+    def archive_closed(self, now=None):
+        """Archive every draw whose window has ended, returning their numbers"""
+        now = self.clock() if now is None else now
+        ended = [number for number, closes_at in list(self._closes.items()) if closes_at <= now]
+        for number in ended:
+            self.archive_draw(number)
+        return ended
+
+    def on_close(self, callback):
+        """Call callback(number, (opens_at, closes_at)) whenever a draw closes or is archived"""
+        self._listeners.append(callback)
+
+    def _notify(self, number, window):
+        for callback in self._listeners:
+            callback(number, window)
+
+    def open_draws(self):
+        return dict(self._windows)
+
+    def __getstate__(self):
+        # Listeners and the lock stay with this process; workers get a snapshot of the draws
+        state = self.__dict__.copy()
+        del state['_lock'], state['_listeners']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def __contains__(self, number):
+        return number in self._closes
+
+    def __len__(self):
+        return len(self._closes)
+
+
+def _read_state(path):
+    """({number: window} of open draws, {number: window} of archived ones) from a saved index"""
+    with open(path) as f:
+        state = json.load(f)
+    windows = {int(number): (int(opens_at), int(closes_at))
+               for number, (opens_at, closes_at) in state.get('open', {}).items()}
+    archived = {int(number): tuple(window) for number, window in state.get('archived', {}).items()}
+    if any(closes_at <= opens_at for opens_at, closes_at in windows.values()):
+        raise ValueError("A draw must close after it opens")
+    return windows, archived
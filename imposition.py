@@ -0,0 +1,378 @@
+"""Print sheets: many tickets per page, drawn straight at the printer's resolution
+
+Tickets are sampled from their module matrices onto the page at the target DPI,
+so nothing is rendered large and scaled down. Pages are written one at a time
+as 1-bit multi-page PDF or TIFF; only the page being drawn is held in memory,
+however long the print run.
+"""
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import qr_template
+from lazy_imports import LazyModule
+from qr_template import ERROR_CORRECT_H
+from ticket_generator import BOX_SIZES, TicketGenerator
+
+np = LazyModule('numpy')
+
+MM_PER_INCH = 25.4
+SHEET_FORMATS = ('pdf', 'tiff')
+CONTENT_TYPES = {'pdf': 'application/pdf', 'tiff': 'image/tiff'}
+
+# Geometry of qr_template.render_composite, in its own pixels
+_BORDER = 4
+_INNER_BORDER = 2
+_PADDING = 40
+
+_samplers = {}
+
+
+def mm_to_px(mm, dpi):
+    return int(round(mm * dpi / MM_PER_INCH))
+
+
+class SheetLayout:
+    """A grid of square tickets on a page, in printer pixels"""
+
+    def __init__(self, width_mm, height_mm, ticket_mm=10, gap_mm=2, margin_mm=5, dpi=300):
+        self.dpi = dpi
+        self.width = mm_to_px(width_mm, dpi)
+        self.height = mm_to_px(height_mm, dpi)
+        self.ticket_px = mm_to_px(ticket_mm, dpi)
+        pitch_mm = ticket_mm + gap_mm
+        self.columns = int((width_mm - 2 * margin_mm + gap_mm) // pitch_mm)
+        self.rows = int((height_mm - 2 * margin_mm + gap_mm) // pitch_mm)
+        if self.columns < 1 or self.rows < 1:
+            raise ValueError("Ticket does not fit on the sheet")
+        # Slots are placed in mm and rounded once, so gaps don't drift across the page
+        self.slots = [
+            (mm_to_px(margin_mm + row * pitch_mm, dpi), mm_to_px(margin_mm + column * pitch_mm, dpi))
+            for row in range(self.rows) for column in range(self.columns)
+        ]
+
+    @classmethod
+    def a4(cls, **kwargs):
+        return cls(210, 297, **kwargs)
+
+    @classmethod
+    def roll(cls, width_mm, rows=1, ticket_mm=10, gap_mm=2, margin_mm=5, dpi=300):
+        """A strip of a label roll: width_mm across, rows of tickets per page"""
+        height_mm = 2 * margin_mm + rows * ticket_mm + (rows - 1) * gap_mm
+        return cls(width_mm, height_mm, ticket_mm, gap_mm, margin_mm, dpi)
+
+    @property
+    def per_page(self):
+        return len(self.slots)
+
+
+def _sampler(outer_count, inner_count, box_size, size_px):
+    """Per-axis module indices for each output pixel of a size_px ticket, cached per geometry"""
+    key = (outer_count, inner_count, box_size, size_px)
+    sampler = _samplers.get(key)
+    if sampler is None:
+        center_offset, center_size = qr_template.center_region(outer_count)
+        full = (outer_count + 2 * _BORDER) * box_size
+        center_size_px = center_size * box_size
+        target = center_size_px - _PADDING
+        top = (center_offset + _BORDER) * box_size + (center_size_px - target) // 2
+
+        # Pixel centers in render_composite's coordinates
+        position = (np.arange(size_px) + 0.5) * full / size_px
+        outer = np.minimum((position // box_size).astype(np.intp), outer_count + 2 * _BORDER - 1)
+        offset = position - top
+        inside = (offset >= 0) & (offset < target)
+        inner_span = inner_count + 2 * _INNER_BORDER
+        inner = np.minimum((offset[inside] * inner_span / target).astype(np.intp), inner_span - 1)
+
+        center = np.zeros((outer_count, outer_count), dtype=bool)
+        center[center_offset:center_offset + center_size, center_offset:center_offset + center_size] = True
+        sampler = _samplers[key] = {
+            'outer': outer,
+            'inner_at': np.flatnonzero(inside),
+            'inner': inner,
+            'keep': ~center,
+        }
+    return sampler
+
+
+def render_ticket(outer_payload, inner_payload, size_px, box_size=BOX_SIZES['json']):
+    """Composite ticket as a (size_px, size_px) bool array, True where dark
+
+    Same layout as qr_template.render_composite with box_size, sampled at size_px.
+    """
+    outer = qr_template.make_modules(outer_payload, 4, ERROR_CORRECT_H)
+    inner = qr_template.make_modules(inner_payload, 1, ERROR_CORRECT_H)
+    sampler = _sampler(len(outer), len(inner), box_size, size_px)
+
+    rows = sampler['outer']
+    ticket = np.pad(outer & sampler['keep'], _BORDER)[rows[:, None], rows]
+    at = sampler['inner_at']
+    inner_rows = sampler['inner']
+    ticket[at[:, None], at] = np.pad(inner, _INNER_BORDER)[inner_rows[:, None], inner_rows]
+    return ticket
+
+
+class SheetImposer:
+    """Lay tickets from a TicketGenerator out on sheets and stream them as PDF or TIFF"""
+
+    def __init__(self, generator, layout, verbose=False):
+        """verbose=True prints each run's throughput; it is always in last_stats"""
+        self.generator = generator
+        self.layout = layout
+        self.verbose = verbose
+        self.last_stats = None
+
+    def pages(self, ticket_specs):
+        """Yield (page, ticket_data list) per sheet; page is a bool array, True where dark
+
+        ticket_specs takes the same ticket IDs or dicts as TicketGenerator.generate_batch.
+        """
+        generator = self.generator
+        layout = self.layout
+        size = layout.ticket_px
+        box_size = BOX_SIZES[generator.payload_format]
+        specs = iter(ticket_specs)
+        while True:
+            chunk = list(islice(specs, layout.per_page))
+            if not chunk:
+                return
+            page = np.zeros((layout.height, layout.width), dtype=bool)
+            tickets = []
+            for (top, left), spec in zip(layout.slots, chunk):
+                if not isinstance(spec, dict):
+                    spec = {'ticket_id': spec}
+                ticket_data = generator.generate_ticket_data(
+                    spec['ticket_id'],
+                    spec.get('draw_date'),
+                    spec.get('ticket_price'),
+                    spec.get('draw_number')
+                )
+                inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+                page[top:top + size, left:left + size] = render_ticket(
+                    *generator.encode_payloads(ticket_data, inner_data), size, box_size)
+                tickets.append(ticket_data)
+            yield page, tickets
+
+    def stream(self, ticket_specs, format='pdf', on_page=None, workers=1):
+        """Yield the sheets as PDF or TIFF bytes, one chunk per page plus header and trailer
+
+        on_page(page_number, ticket_data list) is called as each page is written, e.g.
+        to record which tickets went to print. With workers > 1 pages are drawn on a
+        process pool, a few pages ahead of the writer. Throughput ends up in last_stats.
+        """
+        if format not in SHEET_FORMATS:
+            raise ValueError(f"Unknown sheet format: {format}")
+        writer = PdfWriter(self.layout) if format == 'pdf' else TiffWriter(self.layout)
+        stats = {'pages': 0, 'tickets': 0, 'bytes': 0}
+        started = time.perf_counter()
+        try:
+            for data, tickets in self._compressed_pages(ticket_specs, workers):
+                stats['pages'] += 1
+                stats['tickets'] += len(tickets)
+                if on_page is not None:
+                    on_page(stats['pages'], tickets)
+                for chunk in writer.page(data):
+                    stats['bytes'] += len(chunk)
+                    yield chunk
+            chunk = writer.close()
+            stats['bytes'] += len(chunk)
+            yield chunk
+        finally:
+            elapsed = time.perf_counter() - started
+            stats['seconds'] = elapsed
+            stats['pages_per_sec'] = stats['pages'] / elapsed if elapsed > 0 else 0.0
+            stats['tickets_per_sec'] = stats['tickets'] / elapsed if elapsed > 0 else 0.0
+            self.last_stats = stats
+            if self.verbose:
+                print(f"Imposed {stats['tickets']} tickets on {stats['pages']} {format} pages in "
+                      f"{elapsed:.2f}s ({stats['pages_per_sec']:.1f} pages/sec)")
+
+    def _compressed_pages(self, ticket_specs, workers):
+        """(page data, ticket_data list) per sheet, in order"""
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1:
+            for page, tickets in self.pages(ticket_specs):
+                yield _compress(page), tickets
+            return
+
+        generator = self.generator
+        specs = iter(ticket_specs)
+        in_flight = deque()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_sheet_worker,
+            initargs=(generator.secret_key, generator.payload_format, generator.keyring,
+                      generator.clock, generator.draw_index)
+        ) as pool:
+            while True:
+                # Bounded read-ahead: at most two pages per worker exist at once
+                while len(in_flight) < workers * 2:
+                    chunk = list(islice(specs, self.layout.per_page))
+                    if not chunk:
+                        break
+                    in_flight.append(pool.submit(_render_sheet, self.layout, chunk))
+                if not in_flight:
+                    return
+                yield in_flight.popleft().result()
+
+    def write(self, ticket_specs, path, format=None, on_page=None, workers=1):
+        """Stream the sheets to a file, with the format taken from its extension by default"""
+        if format is None:
+            format = 'tiff' if path.lower().endswith(('.tif', '.tiff')) else 'pdf'
+        with open(path, 'wb') as f:
+            for chunk in self.stream(ticket_specs, format, on_page, workers):
+                f.write(chunk)
+        return self.last_stats
+
+
+def _compress(page):
+    """Deflate-compressed 1 bit per pixel, rows padded to whole bytes, 0 for black"""
+    return zlib.compress(np.packbits(~page, axis=1).tobytes(), 6)
+
+
+_sheet_generator = None
+
+
+def _init_sheet_worker(secret_key, payload_format, keyring, clock, draw_index):
+    global _sheet_generator
+    _sheet_generator = TicketGenerator(secret_key, payload_format=payload_format, keyring=keyring,
+                                       clock=clock, draw_index=draw_index)
+
+
+def _render_sheet(layout, specs):
+    """Draw one sheet inside a worker process"""
+    page, tickets = next(SheetImposer(_sheet_generator, layout).pages(specs))
+    return _compress(page), tickets
+
+
+class PdfWriter:
+    """Multi-page PDF written front to back: each page is a Flate-compressed 1-bit image"""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.offset = 0
+        self.offsets = {}
+        self.kids = []
+        # Objects 1 and 2 are the catalog and the page tree, written last
+        self.next_object = 3
+        self.started = False
+
+    def _object(self, number, body, stream=None):
+        chunk = f"{number} 0 obj\n".encode() + body
+        if stream is not None:
+            chunk += b"\nstream\n" + stream + b"\nendstream"
+        chunk += b"\nendobj\n"
+        self.offsets[number] = self.offset
+        self.offset += len(chunk)
+        return chunk
+
+    def _header(self):
+        self.started = True
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.offset = len(header)
+        return header
+
+    def page(self, data):
+        """Chunks for one page, given its compressed data"""
+        layout = self.layout
+        chunks = [] if self.started else [self._header()]
+        image, content, page_object = self.next_object, self.next_object + 1, self.next_object + 2
+        self.next_object += 3
+
+        chunks.append(self._object(image, (
+            f"<< /Type /XObject /Subtype /Image /Width {layout.width} /Height {layout.height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode /Length {len(data)} >>"
+        ).encode(), data))
+
+        width_pt = layout.width * 72 / layout.dpi
+        height_pt = layout.height * 72 / layout.dpi
+        draw = f"q {width_pt:.4f} 0 0 {height_pt:.4f} 0 0 cm /Im0 Do Q".encode()
+        chunks.append(self._object(content, f"<< /Length {len(draw)} >>".encode(), draw))
+        chunks.append(self._object(page_object, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.4f} {height_pt:.4f}] "
+            f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>"
+        ).encode()))
+        self.kids.append(page_object)
+        return chunks
+
+    def close(self):
+        chunks = [] if self.started else [self._header()]
+        kids = ' '.join(f"{kid} 0 R" for kid in self.kids)
+        chunks.append(self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.kids)} >>".encode()))
+        chunks.append(self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>"))
+
+        xref_offset = self.offset
+        lines = [f"xref\n0 {self.next_object}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self.next_object)]
+        lines.append(f"trailer\n<< /Size {self.next_object} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        chunks.append(''.join(lines).encode())
+        return b''.join(chunks)
+
+
+class TiffWriter:
+    """Multi-page TIFF written front to back, one Deflate-compressed 1-bit strip per page
+
+    Each page's directory points at the next one, so a page is held back until the
+    next arrives (or the run ends) and it is known whether it is the last.
+    """
+
+    _ENTRIES = 11
+    _DIRECTORY_SIZE = 2 + 12 * _ENTRIES + 4
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.offset = 8
+        self.pending = None
+        self.started = False
+
+    def page(self, data):
+        """Chunks for the previous page, given this one's compressed data"""
+        chunks = [] if self.started else [b"II*\0" + struct.pack('<I', 8)]
+        self.started = True
+        if self.pending is not None:
+            chunks.append(self._directory(self.pending, last=False))
+        self.pending = data
+        return chunks
+
+    def close(self):
+        if self.pending is None:
+            raise ValueError("A TIFF needs at least one page")
+        chunk = self._directory(self.pending, last=True)
+        self.pending = None
+        return chunk
+
+    def _directory(self, data, last):
+        layout = self.layout
+        resolution_at = self.offset + self._DIRECTORY_SIZE
+        data_at = resolution_at + 16
+        next_directory = 0 if last else data_at + len(data)
+        entries = [
+            (256, 4, layout.width),       # ImageWidth
+            (257, 4, layout.height),      # ImageLength
+            (258, 3, 1),                  # BitsPerSample
+            (259, 3, 8),                  # Compression: Deflate
+            (262, 3, 1),                  # Photometric: BlackIsZero
+            (273, 4, data_at),            # StripOffsets
+            (277, 3, 1),                  # SamplesPerPixel
+            (278, 4, layout.height),      # RowsPerStrip
+            (279, 4, len(data)),          # StripByteCounts
+            (282, 5, resolution_at),      # XResolution
+            (283, 5, resolution_at + 8),  # YResolution
+        ]
+        directory = struct.pack('<H', len(entries))
+        for tag, kind, value in entries:
+            if kind == 3:
+                directory += struct.pack('<HHIHH', tag, kind, 1, value, 0)
+            else:
+                directory += struct.pack('<HHII', tag, kind, 1, value)
+        directory += struct.pack('<I', next_directory)
+        # ResolutionUnit defaults to inches
+        directory += struct.pack('<IIII', layout.dpi, 1, layout.dpi, 1)
+        self.offset = data_at + len(data)
+        return directory + data
@@ -0,0 +1,93 @@
+import io
+
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+Image = LazyModule('PIL.Image')
+
+# Large uploads are decoded at 1/2, 1/4 or 1/8 scale as long as their shorter side
+# keeps at least this many pixels; a ticket filling a fraction of a phone photo
+# still has several pixels per inner QR module at 1500
+REDUCE_MIN_SIDE = 1500
+
+# Decoder scale factors, largest first
+_REDUCED_FLAGS = {
+    8: 'IMREAD_REDUCED_GRAYSCALE_8',
+    4: 'IMREAD_REDUCED_GRAYSCALE_4',
+    2: 'IMREAD_REDUCED_GRAYSCALE_2',
+}
+
+
+def reduction_for(size, min_side=REDUCE_MIN_SIDE):
+    """Largest of 8, 4 and 2 that keeps the shorter side of size (width, height) at min_side, else 1"""
+    if not min_side:
+        return 1
+    for factor in _REDUCED_FLAGS:
+        if min(size) // factor >= min_side:
+            return factor
+    return 1
+
+
+def read_bytes(source):
+    """Encoded image bytes from a path, a bytes-like object or a file-like object"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def decode_gray(data, min_side=REDUCE_MIN_SIDE):
+    """Decode encoded image bytes straight to a read-only grayscale array
+
+    The RGB image is never materialised: OpenCV decodes to one channel, and JPEGs
+    above the reduction threshold are downscaled inside the decoder. Returns None
+    for formats OpenCV cannot read.
+    """
+    flag = cv2.IMREAD_GRAYSCALE
+    if min_side:
+        try:
+            # Only reads the header
+            size = Image.open(io.BytesIO(data)).size
+        except Exception:
+            size = (0, 0)
+        factor = reduction_for(size, min_side)
+        if factor > 1:
+            flag = getattr(cv2, _REDUCED_FLAGS[factor])
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if gray is None:
+        return None
+    gray.flags.writeable = False
+    return gray
+
+
+def as_gray(image):
+    """Read-only 2-D uint8 array of a PIL image or array, converted only if it is not one already"""
+    array = np.asarray(image)
+    if array.dtype != np.uint8:
+        array = array.astype(np.uint8)
+    if array.ndim == 3:
+        array = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+    else:
+        # A view, so the caller's array stays writeable
+        array = array.view()
+    array.flags.writeable = False
+    return array
+
+
+def load_gray(source, min_side=REDUCE_MIN_SIDE):
+    """Grayscale array of anything TicketVerifier.load_image accepts
+
+    Arrays and PIL images are converted once; paths, bytes and streams are decoded
+    with decode_gray, falling back to PIL for formats OpenCV has no codec for.
+    """
+    if isinstance(source, (Image.Image, np.ndarray)):
+        return as_gray(source)
+    data = read_bytes(source)
+    gray = decode_gray(data, min_side)
+    if gray is None:
+        image = Image.open(io.BytesIO(data))
+        gray = as_gray(image.convert('L'))
+    return gray
@@ -0,0 +1,274 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Histogram buckets for stage timings, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _NullStage:
+    """Stage timer handed out while instrumentation is disabled; does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('instrumentation', 'name', 'started')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _Trace:
+    """Events recorded by one thread inside Instrumentation.capture()"""
+
+    def __init__(self):
+        self.events = []
+
+
+class Instrumentation:
+    """Per-stage timers and labelled counters for the generate/verify hot paths
+
+    Stages are timed with `with instrumentation.stage("scan"):` and counters are
+    bumped with count("decode_strategy", strategy="otsu"). While disabled, stage()
+    returns a shared no-op and count() returns at once, so the hooks can stay in
+    the hot path. Work done in a pool worker can be captured there and merged
+    into the parent's instrumentation with merge().
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = defaultdict(lambda: {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                            'buckets': [0] * len(self.buckets)})
+        self._counters = Counter()
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        """Record a stage duration measured elsewhere"""
+        if not self.enabled:
+            return
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.events.append(('stage', name, seconds))
+        with self._lock:
+            stats = self._stages[name]
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+                    break
+
+    def count(self, name, amount=1, **labels):
+        """Increment a counter, optionally labelled (e.g. reason="expired")"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.events.append(('count', key, amount))
+        with self._lock:
+            self._counters[key] += amount
+
+    def capture(self):
+        """Collect this thread's events, e.g. to ship them back from a pool worker"""
+        return _Capture(self)
+
+    def merge(self, events):
+        """Apply events captured by another instance"""
+        for kind, key, value in events or ():
+            if kind == 'stage':
+                self.observe(key, value)
+            elif self.enabled:
+                with self._lock:
+                    self._counters[key] += value
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Stage timings and counters as plain dicts, for JSON output"""
+        with self._lock:
+            stages = {
+                name: {
+                    'count': stats['count'],
+                    'total_s': stats['sum'],
+                    'mean_s': stats['sum'] / stats['count'] if stats['count'] else 0.0,
+                    'max_s': stats['max']
+                }
+                for name, stats in self._stages.items()
+            }
+            counters = defaultdict(dict)
+            for (name, labels), value in self._counters.items():
+                counters[name][','.join(f"{k}={v}" for k, v in labels) or 'total'] = value
+        return {'stages': stages, 'counters': dict(counters)}
+
+    def render_openmetrics(self, prefix='lottery', gauges=None):
+        """Render everything in the OpenMetrics text format (also readable by Prometheus)
+
+        gauges is an optional flat dict of extra numeric values, such as
+        VerificationService.metrics(), exported as <prefix>_<name>.
+        """
+        lines = []
+        with self._lock:
+            stages = {name: dict(stats, buckets=list(stats['buckets'])) for name, stats in self._stages.items()}
+            counters = dict(self._counters)
+
+        metric = f"{prefix}_stage_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        lines.append(f"# HELP {metric} Time spent in each generate/verify stage.")
+        for name in sorted(stages):
+            stats = stages[name]
+            cumulative = 0
+            for bound, hits in zip(self.buckets, stats['buckets']):
+                cumulative += hits
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {stats["count"]}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {stats["sum"]}')
+
+        by_name = defaultdict(list)
+        for (name, labels), value in counters.items():
+            by_name[name].append((labels, value))
+        for name in sorted(by_name):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(by_name[name]):
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+                lines.append(f"{metric}_total{{{label_text}}} {value}" if label_text else f"{metric}_total {value}")
+
+        for name, value in sorted((gauges or {}).items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = f"{prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+
+        lines.append("# EOF")
+        return '\n'.join(lines) + '\n'
+
+
+class _Capture:
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+
+    def __enter__(self):
+        self.previous = getattr(self.instrumentation._local, 'trace', None)
+        self.trace = self.instrumentation._local.trace = _Trace()
+        return self.trace
+
+    def __exit__(self, *exc):
+        self.instrumentation._local.trace = self.previous
+        return False
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread's stack from a background thread
+
+    Nothing runs until start(), so a stopped profiler costs nothing. Samples are
+    aggregated as collapsed stacks ("outer;inner count"), the input format of
+    flamegraph tools.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.sample_count = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def toggle(self):
+        """Start if stopped, stop if running; returns whether it is now running"""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+        return self.running
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.sample_count = 0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self._lock:
+                self.samples.update(stacks)
+                self.sample_count += 1
+
+    def collapsed(self):
+        """Samples in collapsed-stack format, one "frame;frame count" line per stack"""
+        with self._lock:
+            return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def top(self, limit=20):
+        """Innermost functions by share of samples"""
+        leaves = Counter()
+        with self._lock:
+            for stack, count in self.samples.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            total = sum(leaves.values())
+        return [(name, count / total) for name, count in leaves.most_common(limit)] if total else []
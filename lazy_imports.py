@@ -0,0 +1,63 @@
+"""Imaging modules imported on first use, and preloading them before workers fork
+
+NumPy, OpenCV, PIL, pyzbar and qrcode take a few hundred milliseconds to
+import. Modules that need them hold a LazyModule instead, so importing the
+verifier or generator (and serving /health or payload-only checks) does not
+pay for them. preload() does the whole cost up front instead, for servers
+that fork their workers from a warmed-up parent.
+"""
+import gc
+import importlib
+import time
+
+IMAGING_MODULES = ('numpy', 'cv2', 'PIL.Image', 'pyzbar.pyzbar', 'qrcode', 'qrcode.image.pil')
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is used
+
+    The first attribute access imports the module and copies its namespace
+    here, so later lookups are plain attribute reads.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+def preload(verifier=None, redemption_store=None):
+    """Import and warm up the imaging stack in this process, returning the time each step took
+
+    Runs one ticket of each payload format through generation and image
+    verification, so zbar, OpenCV and the QR templates are initialised, then
+    resolves the verifier's signing keys and reads the redemption filter in.
+    Objects created so far are then frozen out of garbage collection, so that
+    workers forked afterwards share their pages instead of copying them.
+    """
+    timings = {}
+    started = time.perf_counter()
+    for name in IMAGING_MODULES:
+        importlib.import_module(name)
+    timings['import_s'] = time.perf_counter() - started
+
+    import ticket_verifier
+    started = time.perf_counter()
+    ticket_verifier.warm_up()
+    timings['warm_up_s'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if verifier is not None:
+        verifier.keys.active()
+    if redemption_store is not None and hasattr(redemption_store, 'prefault'):
+        redemption_store.prefault()
+    timings['state_s'] = time.perf_counter() - started
+
+    gc.freeze()
+    return timings
@@ -0,0 +1,29 @@
+from qrcode.image.pil import PilImage
+
+
+class LogoQR(PilImage):
+    """Custom QR code image class that creates a blank space in the center"""
+    def __init__(self, border, width, box_size, *args, **kwargs):
+        super().__init__(border, width, box_size, *args, **kwargs)
+        # Calculate center size based on version (1/3 of data area)
+        self.center_size = (width - 8) // 3  # Exclude quiet zone (4 modules on each side)
+        self.center_offset = (width - self.center_size) // 2
+        
+        # Create a white rectangle in the center
+        self._idr.rectangle([
+            self.center_offset * self.box_size + self.border,
+            self.center_offset * self.box_size + self.border,
+            (self.center_offset + self.center_size) * self.box_size + self.border,
+            (self.center_offset + self.center_size) * self.box_size + self.border
+        ], fill="white")
+        
+    def drawrect(self, row, col):
+        """Draw a single box, but skip if in the center area"""
+        # Check if we're in the center area
+        if (self.center_offset <= row < self.center_offset + self.center_size and 
+            self.center_offset <= col < self.center_offset + self.center_size):
+            # Skip drawing in center area
+            return
+        
+        # Draw normal QR code box
+        super().drawrect(row, col)
@@ -0,0 +1,144 @@
+"""lottery-verify: bulk-verify folders of scanned ticket images for offline audits
+
+Usage:
+    python lottery_verify.py scans/ --key-hex <hex> --output results.jsonl
+    python lottery_verify.py scans/ --output results.csv --resume
+    python lottery_verify.py scans/ --redeem --store sqlite:///redemptions.db
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from redemption_store import open_redemption_store
+from ticket_verifier import TicketVerifier
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+CSV_FIELDS = ['path', 'is_valid', 'ticket_id', 'draw_date', 'draw_number', 'ticket_price', 'message']
+
+
+def iter_image_paths(inputs):
+    """Expand files and directories into image paths, in a stable order"""
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield item
+
+
+def _trim_partial_line(path):
+    """Drop a row left half-written by an interrupted run"""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            f.truncate(end)
+
+
+def completed_paths(path, output_format):
+    """Paths already recorded in a previous run's output"""
+    if not os.path.exists(path):
+        return set()
+    _trim_partial_line(path)
+    with open(path, newline='') as f:
+        if output_format == 'csv':
+            return {row['path'] for row in csv.DictReader(f)}
+        return {json.loads(line)['path'] for line in f if line.strip()}
+
+
+def to_row(record):
+    """Flatten a verify_many record for output"""
+    result = record['result']
+    row = {'path': record['path'], 'is_valid': record['is_valid']}
+    if isinstance(result, dict):
+        row.update({
+            'ticket_id': result.get('ticket_id'),
+            'draw_date': result.get('draw_date'),
+            'draw_number': result.get('draw_number'),
+            'ticket_price': result.get('ticket_price'),
+            'message': result.get('status')
+        })
+    else:
+        row['message'] = result
+    return row
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='lottery-verify', description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='Image files or directories of scans')
+    key = parser.add_mutually_exclusive_group()
+    key.add_argument('--key', help='Secret key as text (e.g. the webapp SECRET_KEY)')
+    key.add_argument('--key-hex', help='Secret key as hex')
+    parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help='Output format (default: from the output extension, else jsonl)')
+    parser.add_argument('--resume', action='store_true', help='Skip images already in --output and append')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--redeem', action='store_true', help='Mark valid tickets as used (off for audits)')
+    parser.add_argument('--store', default='memory',
+                        help='Redemption store URL: memory, sqlite:///path or log:///path')
+    parser.add_argument('--profile', default='balanced', choices=['fast', 'balanced', 'robust'],
+                        help='Inner QR preprocessing profile')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_format = args.format or ('csv' if args.output and args.output.endswith('.csv') else 'jsonl')
+    if args.resume and not args.output:
+        sys.exit("--resume needs --output")
+
+    if args.key_hex:
+        secret_key = bytes.fromhex(args.key_hex)
+    elif args.key:
+        secret_key = args.key.encode()
+    else:
+        secret_key = None
+
+    verifier = TicketVerifier(
+        secret_key,
+        preprocess_profile=args.profile,
+        redemption_store=open_redemption_store(args.store),
+        verbose=False
+    )
+
+    done = completed_paths(args.output, output_format) if args.resume else set()
+    paths = (path for path in iter_image_paths(args.inputs) if path not in done)
+
+    out = open(args.output, 'a' if args.resume else 'w', newline='') if args.output else sys.stdout
+    writer = None
+    if output_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+        if out is sys.stdout or out.tell() == 0:
+            writer.writeheader()
+
+    started = time.perf_counter()
+    counts = {'valid': 0, 'invalid': 0}
+    try:
+        for record in verifier.verify_many(paths, workers=args.workers, redeem=args.redeem):
+            if writer is not None:
+                writer.writerow(to_row(record))
+            else:
+                out.write(json.dumps(to_row(record)) + '\n')
+            # Flush per row so an interrupted run can resume from the last complete line
+            out.flush()
+            counts['valid' if record['is_valid'] else 'invalid'] += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    total = counts['valid'] + counts['invalid']
+    print(f"Verified {total} images in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} images/sec): "
+          f"{counts['valid']} valid, {counts['invalid']} invalid, {len(done)} skipped from previous run",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
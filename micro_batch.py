@@ -0,0 +1,259 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from lazy_imports import LazyModule
+from verification_service import DeadlineExceeded, ServiceOverloaded
+
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+
+
+def batch_enhanced_gray(arrays):
+    """Grayscale and histogram-equalize many frames at once
+
+    Frames of the same shape are stacked, converted with one cvtColor call and
+    equalized with one vectorized histogram pass. The output is identical to
+    TicketVerifier._to_enhanced_gray applied to each frame on its own.
+    """
+    results = [None] * len(arrays)
+    groups = defaultdict(list)
+    for i, array in enumerate(arrays):
+        groups[array.shape].append(i)
+
+    for shape, indices in groups.items():
+        stack = np.stack([arrays[i] for i in indices])
+        count, height = stack.shape[:2]
+        if stack.ndim == 4:
+            # Color conversion is per pixel, so one tall image converts the whole group
+            tall = stack.reshape(count * height, *stack.shape[2:])
+            stack = cv2.cvtColor(tall, cv2.COLOR_RGB2GRAY).reshape(count, height, -1)
+        for i, enhanced in zip(indices, _batch_equalize_hist(stack)):
+            results[i] = enhanced
+    return results
+
+
+def _batch_equalize_hist(stack):
+    """cv2.equalizeHist over a (count, height, width) uint8 stack"""
+    count = stack.shape[0]
+    flat = stack.reshape(count, -1)
+    total = flat.shape[1]
+    # One bincount for the whole batch by offsetting each frame into its own 256 bins
+    offsets = (np.arange(count, dtype=np.intp) * 256)[:, None]
+    hist = np.bincount((flat + offsets).ravel(), minlength=count * 256).reshape(count, 256)
+
+    # Same LUT as OpenCV: skip the first occupied bin and scale in float32
+    first = (hist > 0).argmax(axis=1)
+    first_count = hist[np.arange(count), first]
+    scale = np.float32(255) / np.maximum(total - first_count, 1).astype(np.float32)
+    cdf = (np.cumsum(hist, axis=1) - first_count[:, None]).astype(np.float32)
+    lut = np.clip(np.rint(cdf * scale[:, None]), 0, 255)
+    lut[np.arange(256)[None, :] <= first[:, None]] = 0
+    uniform = first_count == total
+    lut[uniform] = first[uniform][:, None]
+    lut = lut.astype(np.uint8)
+    return np.take_along_axis(lut, flat.astype(np.intp), axis=1).reshape(stack.shape)
+
+
+class _Request:
+    __slots__ = ('image', 'source', 'future')
+
+    def __init__(self, image, source):
+        self.image = image
+        self.source = source
+        self.future = Future()
+
+
+class MicroBatchScheduler:
+    """Groups verification requests that arrive close together into batches
+
+    The first request of a batch opens a window of window_ms; everything that
+    arrives before it closes, up to max_batch requests, is preprocessed in one
+    batched pass and decoded together on a thread pool. Each caller gets its own
+    result; as with VerificationService, redemption is applied by verify() and
+    only for results that came back within their deadline.
+
+    window_ms is the latency/throughput knob: a longer window builds bigger
+    batches under load at the cost of up to window_ms on every request, while
+    window_ms=0 only batches requests that are already waiting.
+    """
+
+    def __init__(self, verifier, window_ms=5.0, max_batch=32, decode_threads=None,
+                 max_pending=None, deadline=5.0, sample_size=1024):
+        self.verifier = verifier
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.decode_threads = decode_threads or os.cpu_count() or 1
+        self.max_pending = max_batch * 4 if max_pending is None else max_pending
+        self.deadline = deadline
+        self._queue = queue.Queue()
+        self._decoders = ThreadPoolExecutor(max_workers=self.decode_threads,
+                                            thread_name_prefix='micro-batch-decode')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._batch_sizes = deque(maxlen=sample_size)
+        self._service_times = deque(maxlen=sample_size)
+        self._counters = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'deadline_exceeded': 0,
+            'failed': 0,
+            'batches': 0
+        }
+        self._closed = False
+        # Started by the first submit, so a scheduler built before gunicorn forks
+        # (see lazy_imports.preload) runs its collector in the worker
+        self._thread = None
+
+    def submit(self, image, source=None):
+        """Queue an image (bytes, path or array) and return a Future of (is_valid, result)
+
+        The result is computed with redeem=False; pass it through the verifier's
+        settle_redemption to redeem.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            if self._pending >= self.max_pending:
+                self._counters['rejected'] += 1
+                raise ServiceOverloaded("Verification queue is full")
+            self._pending += 1
+            self._counters['submitted'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='micro-batch', daemon=True)
+                self._thread.start()
+        request = _Request(image, source)
+        started = time.perf_counter()
+        request.future.add_done_callback(lambda f: self._on_done(f, started))
+        self._queue.put(request)
+        return request.future
+
+    def _on_done(self, future, started):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._counters['failed'] += 1
+            else:
+                self._counters['completed'] += 1
+                self._service_times.append(time.perf_counter() - started)
+
+    def verify(self, image, source=None, deadline=None, redeem=True):
+        """Blocking verification, same contract as VerificationService.verify"""
+        future = self.submit(image, source)
+        try:
+            is_valid, result = future.result(timeout=deadline or self.deadline)
+        except FutureTimeoutError:
+            # Still waiting for its batch, drop it; a decode already running is
+            # left to finish
+            future.cancel()
+            with self._lock:
+                self._counters['deadline_exceeded'] += 1
+            raise DeadlineExceeded("Verification did not finish within its deadline")
+        return self.verifier.settle_redemption(is_valid, result, redeem)
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        closes_at = time.perf_counter() + self.window_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = closes_at - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _dispatch(self, batch):
+        # Requests cancelled by a caller's deadline are dropped before any work
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        with self._lock:
+            self._counters['batches'] += 1
+            self._batch_sizes.append(len(batch))
+
+        loaded = []
+        for request in batch:
+            try:
+                loaded.append((request, self.verifier.load_gray(request.image)))
+            except Exception as e:
+                request.future.set_result((False, f"Error verifying QR code: {str(e)}"))
+
+        try:
+            with self.verifier.instrumentation.stage('batch_preprocess'):
+                enhanced = batch_enhanced_gray([image for _, image in loaded])
+        except Exception:
+            # An odd frame (e.g. two-channel) should not fail its neighbours; let
+            # each request preprocess on its own instead
+            enhanced = [None] * len(loaded)
+        for (request, image), gray in zip(loaded, enhanced):
+            self._decoders.submit(self._decode, request, image, gray)
+
+    def _decode(self, request, image, enhanced):
+        try:
+            result = self.verifier.verify_composite_qr(
+                image, source=request.source, redeem=False, enhanced=enhanced)
+        except Exception as e:
+            request.future.set_exception(e)
+        else:
+            request.future.set_result(result)
+
+    def metrics(self):
+        """Queue depth, counters, batch sizes and recent service-time percentiles (seconds)"""
+        with self._lock:
+            pending = self._pending
+            counters = dict(self._counters)
+            batch_sizes = list(self._batch_sizes)
+            samples = sorted(self._service_times)
+        metrics = {
+            'window_ms': self.window_ms,
+            'max_batch': self.max_batch,
+            'decode_threads': self.decode_threads,
+            'in_flight': pending,
+            **counters
+        }
+        if batch_sizes:
+            metrics['mean_batch_size'] = sum(batch_sizes) / len(batch_sizes)
+        if samples:
+            metrics.update({
+                'service_time_p50': samples[len(samples) // 2],
+                'service_time_p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+                'service_time_max': samples[-1]
+            })
+        return metrics
+
+    def shutdown(self, wait=True):
+        """Finish queued requests and stop the collector and decode threads"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._decoders.shutdown(wait=wait)
@@ -0,0 +1,247 @@
+"""Ticket checks on already decoded payloads: signatures, dates, draws and redemption
+
+Nothing here touches images, so this module imports neither OpenCV nor PIL; a
+handheld that decoded the QR itself only needs to send the payload text.
+TicketVerifier builds on PayloadVerifier and adds the image pipeline.
+"""
+import hashlib
+import time
+from collections import Counter
+from datetime import datetime
+
+import ticket_payload
+from instrumentation import Instrumentation
+from key_context import KeyContext
+from redemption_store import MemoryRedemptionStore
+
+# Tickets issued up to this many seconds "in the future" are accepted, for clock drift
+# between the issuing server and the gate
+CLOCK_SKEW_S = 300
+
+
+class PayloadVerifier:
+    def __init__(self, secret_key, redemption_store=None, verbose=True, instrumentation=None, keyring=None,
+                 clock=time.time, draw_index=None):
+        """Initialize the payload verifier with a secret key
+
+        redemption_store records used tickets; the default in-memory store is per process.
+        verbose=False silences progress output. instrumentation collects stage timings
+        and counters; pass Instrumentation(enabled=False) to turn it off. keyring (a
+        signing_keys.Keyring) checks each ticket against the key its key ID names,
+        instead of secret_key. clock returns the current Unix time. With a
+        draw_index.DrawIndex, tickets with a draw number are valid until that draw
+        closes rather than until the draw date they carry.
+        """
+        self.secret_key = secret_key if secret_key else hashlib.sha256().digest()
+        self.keyring = keyring
+        self.keys = keyring if keyring is not None else KeyContext(self.secret_key)
+        self.redemptions = redemption_store if redemption_store is not None else MemoryRedemptionStore()
+        self.verbose = verbose
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.clock = clock
+        self.draw_index = draw_index
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _parse(self, payload, kind):
+        """Decoded data for a raw QR payload (str or bytes) or an already decoded dict, or None"""
+        if isinstance(payload, dict):
+            # Ticket dicts from generate_ticket_data; copied, since checks pop the tag. Only
+            # decoding a compact payload may vouch for its MAC, never the caller
+            if ('id' if kind == 'main' else 'l4') not in payload:
+                return None
+            return {k: v for k, v in payload.items() if k != 'mac_valid'}
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            try:
+                payload = bytes(payload).decode('utf-8')
+            except UnicodeDecodeError:
+                return None
+        if not isinstance(payload, str):
+            return None
+        parsed_kind, data = ticket_payload.parse_payload(payload.strip(), self.keys)
+        return data if parsed_kind == kind else None
+
+    def verify_ticket(self, payload, inner_payload=None, redeem=True):
+        """Verify a ticket from its decoded QR payload, without any image work
+
+        payload is the outer code's text (JSON or compact, as str or bytes) or the
+        dict generate_ticket_data returned; inner_payload is the inner code's, when
+        the client read it too. Returns (is_valid, result) like verify_composite_qr.
+        Dicts are for trusted in-process callers; HTTP handlers pass text only.
+        """
+        with self.instrumentation.stage('payload_verify'):
+            is_valid, result = self._verify_payload(payload, inner_payload, redeem)
+        self.instrumentation.count('payload_verifications', result='valid' if is_valid else _failure_reason(result))
+        return is_valid, result
+
+    def verify_tickets(self, payloads, redeem=True):
+        """verify_ticket for many payloads, returning a list of (is_valid, result) in order
+
+        Items are outer payloads or (payload, inner_payload) pairs. Counters are
+        updated once per batch rather than once per ticket.
+        """
+        results = []
+        outcomes = Counter()
+        verify = self._verify_payload
+        with self.instrumentation.stage('payload_batch'):
+            for item in payloads:
+                payload, inner_payload = item if isinstance(item, tuple) else (item, None)
+                is_valid, result = verify(payload, inner_payload, redeem)
+                outcomes['valid' if is_valid else _failure_reason(result)] += 1
+                results.append((is_valid, result))
+        for outcome, amount in outcomes.items():
+            self.instrumentation.count('payload_verifications', amount, result=outcome)
+        return results
+
+    def _verify_payload(self, payload, inner_payload, redeem):
+        main_data = self._parse(payload, 'main')
+        if main_data is None:
+            return False, "Invalid ticket payload"
+        inner_data = None
+        if inner_payload is not None:
+            inner_data = self._parse(inner_payload, 'inner')
+            if inner_data is None:
+                return False, "Invalid inner QR data"
+        return self._check_decoded(main_data, inner_data, redeem)
+
+    def verify_ticket_data(self, ticket_data):
+        """Verify the ticket data and HMAC"""
+        try:
+            # Extract HMAC
+            if not ticket_data.get('h'):
+                return False, "Missing HMAC"
+            
+            # Verify HMAC, in constant time and accepting tickets printed before HMAC-SHA256
+            if not ticket_payload.verify_json(ticket_data, self.keys):
+                return False, "Invalid HMAC"
+            ticket_data.pop('h')
+            
+            # Verify timestamp (allow verification within 24 hours)
+            timestamp = ticket_data.get('t')
+            if not timestamp:
+                return False, "Missing timestamp"
+            
+            if abs(self.clock() - timestamp) > 24*60*60:
+                return False, "Ticket expired or not yet valid"
+            
+            return True, "Valid ticket"
+        except Exception as e:
+            return False, f"Error verifying ticket: {str(e)}"
+
+    def verify_inner_qr(self, inner_data, ticket_id):
+        """Verify the inner QR data"""
+        try:
+            # Verify last 4 digits
+            last_four = inner_data.get('l4', '')
+            if not last_four or len(last_four) != 4:
+                return None, "Invalid inner QR data"
+            
+            # Check if last 4 digits match
+            if not ticket_id.endswith(last_four):
+                return None, "Inner QR verification failed"
+            
+            # Verify timestamp is present
+            if 'ts' not in inner_data:
+                return None, "Missing timestamp in inner QR"
+            
+            return last_four, None
+        except Exception as e:
+            return None, f"Error verifying inner QR: {str(e)}"
+
+    def generate_hmac(self, data):
+        """Generate HMAC for verification"""
+        return self.keys.active().sign_b64(data)
+    
+    def _check_decoded(self, main_data, inner_data, redeem):
+        """Validate decoded main and inner payloads and redeem, returning (is_valid, result)"""
+        stage = self.instrumentation.stage
+        try:
+            # JSON tickets carry their tag in 'h'; compact ones have none and were
+            # authenticated as they were decoded (parse_payload sets 'mac_valid')
+            if self.keys.context(main_data.get('k')) is None:
+                return False, "Unknown signing key"
+            if 'h' in main_data or 'mac_valid' not in main_data:
+                if not main_data.get('h'):
+                    return False, "Missing HMAC"
+                if not ticket_payload.verify_json(main_data, self.keys):
+                    return False, "Invalid HMAC"
+            elif main_data['mac_valid'] is not True:
+                return False, "Invalid HMAC"
+            
+            # Verify inner data (payload clients may send the outer code alone)
+            if inner_data is not None:
+                with stage('inner_verify'):
+                    last_four, error = self.verify_inner_qr(inner_data, main_data['id'])
+                if error:
+                    return False, error
+            
+            # Current timestamp
+            current_time = self.clock()
+            
+            # Validation checks (issuing and scanning clocks may differ slightly)
+            if main_data.get('t', 0) > current_time + CLOCK_SKEW_S:
+                return False, "Invalid ticket date"
+            
+            # Draws in the index close when it says so, others on the ticket's draw date
+            if self._indexed_draw(main_data.get('n')):
+                draw_error = self.draw_index.check(main_data['n'], current_time)
+                if draw_error:
+                    return False, draw_error
+            elif main_data.get('d', 0) < current_time:
+                return False, "Ticket expired (draw date passed)"
+            
+            # Check and mark in one atomic step so a ticket is redeemed exactly once
+            if redeem:
+                with stage('redeem'):
+                    redeemed = self.redemptions.mark_used(main_data['id'])
+                if not redeemed:
+                    return False, "Ticket already used"
+            elif self.redemptions.is_used(main_data['id']):
+                return False, "Ticket already used"
+            
+            return True, {
+                "status": "Valid",
+                "ticket_id": main_data['id'],
+                "draw_date": datetime.fromtimestamp(main_data['d']).strftime('%Y-%m-%d %H:%M:%S'),
+                "draw_number": main_data.get('n', 0),
+                "ticket_price": main_data.get('p', 0)
+            }
+            
+        except Exception as e:
+            return False, f"Error verifying QR code: {str(e)}"
+
+    def _indexed_draw(self, draw_number):
+        return self.draw_index is not None and draw_number is not None and self.draw_index.knows(draw_number)
+
+    def settle_redemption(self, is_valid, result, redeem=True):
+        """Apply this verifier's redemption store to a result computed with redeem=False
+
+        Used when decoding ran in another process, so redemption still happens once,
+        here, against the shared store.
+        """
+        if is_valid:
+            ticket_id = result['ticket_id']
+            # Workers check draw dates only; whether the draw has since closed is known here
+            if self._indexed_draw(result['draw_number']):
+                draw_error = self.draw_index.check(result['draw_number'], self.clock())
+                if draw_error:
+                    return False, draw_error
+            if redeem:
+                with self.instrumentation.stage('redeem'):
+                    redeemed = self.redemptions.mark_used(ticket_id)
+                if not redeemed:
+                    self.instrumentation.count('redemptions_rejected')
+                    return False, "Ticket already used"
+            elif self.redemptions.is_used(ticket_id):
+                self.instrumentation.count('redemptions_rejected')
+                return False, "Ticket already used"
+        return is_valid, result
+
+
+def _failure_reason(message):
+    """Counter label for a failed verification; exception text is dropped to bound cardinality"""
+    return str(message).split(':', 1)[0]
+
+
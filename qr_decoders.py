@@ -0,0 +1,257 @@
+"""Interchangeable QR decoder backends for the verifier
+
+Every backend takes a grayscale uint8 array and returns symbols shaped like
+pyzbar's: .data (bytes), .rect (left, top, width, height) and .polygon (points
+with .x and .y), so the verifier's fallback ladder works with any of them.
+
+Decoders are built from a spec string:
+
+    pyzbar                 libzbar through pyzbar (the default)
+    opencv                 cv2.QRCodeDetector
+    zxing                  zxing-cpp
+    wechat                 cv2.wechat_qrcode, from opencv-contrib-python
+    race:pyzbar,opencv     every listed backend in parallel threads, first valid result wins
+
+benchmarks/calibrate_decoders.py measures each available spec on the benchmark
+corpus and writes the fastest one that meets a success target; QR_DECODER=auto
+picks it up (see load_calibration).
+"""
+import importlib
+import json
+import os
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+pyzbar = LazyModule('pyzbar.pyzbar')
+
+Rect = namedtuple('Rect', 'left top width height')
+Point = namedtuple('Point', 'x y')
+Symbol = namedtuple('Symbol', 'data rect polygon')
+
+DEFAULT_DECODER = 'pyzbar'
+DEFAULT_CALIBRATION = 'decoder_calibration.json'
+
+
+def _symbol(data, points):
+    """Symbol from payload bytes and the corner points of its outline"""
+    polygon = [Point(int(round(x)), int(round(y))) for x, y in points]
+    xs = [point.x for point in polygon]
+    ys = [point.y for point in polygon]
+    return Symbol(data, Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)), polygon)
+
+
+def _as_bytes(payload):
+    return payload if isinstance(payload, bytes) else payload.encode('utf-8')
+
+
+class PyzbarDecoder:
+    name = 'pyzbar'
+
+    def decode(self, image):
+        return pyzbar.decode(image)
+
+
+class OpenCVDecoder:
+    """OpenCV's QR detector, one per thread since a detector keeps state between calls
+
+    cv2.QRCodeDetectorAruco (OpenCV 4.8+) is used where available: the classic
+    cv2.QRCodeDetector's multi-code pass rarely reads the outer code around an
+    inner one.
+    """
+    name = 'opencv'
+
+    # Margin blanked around a found code, as a fraction of its size, before looking again
+    MASK_MARGIN = 0.2
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _detector(self):
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            factory = getattr(cv2, 'QRCodeDetectorAruco', None) or cv2.QRCodeDetector
+            detector = self._local.detector = factory()
+        return detector
+
+    def decode(self, image):
+        detector = self._detector()
+        # Newer OpenCV returns raw bytes; older versions only text
+        raw = hasattr(detector, 'detectAndDecodeBytesMulti')
+        found, payloads, points, _ = (detector.detectAndDecodeBytesMulti if raw
+                                      else detector.detectAndDecodeMulti)(image)
+        symbols = [_symbol(_as_bytes(payload), corners)
+                   for payload, corners in zip(payloads, points) if payload] if found else []
+        if len(symbols) < 2:
+            # Look once more for a single code with the ones already read blanked
+            # out, so a readable inner code cannot draw the detector away from the
+            # outer one (its modules are within the outer code's error correction)
+            payload, corners, _ = (detector.detectAndDecodeBytes if raw
+                                   else detector.detectAndDecode)(self._mask(image, symbols))
+            if payload and all(symbol.data != _as_bytes(payload) for symbol in symbols):
+                symbols.append(_symbol(_as_bytes(payload), corners.reshape(-1, 2)))
+        return symbols
+
+    def _mask(self, image, symbols):
+        """image with each symbol's box, plus MASK_MARGIN, painted background white"""
+        if not symbols:
+            return image
+        masked = np.array(image, copy=True)
+        for symbol in symbols:
+            left, top, width, height = symbol.rect
+            margin_x, margin_y = int(width * self.MASK_MARGIN), int(height * self.MASK_MARGIN)
+            masked[max(top - margin_y, 0):top + height + margin_y + 1,
+                   max(left - margin_x, 0):left + width + margin_x + 1] = 255
+        return masked
+
+
+class ZxingDecoder:
+    name = 'zxing'
+
+    def __init__(self):
+        self._zxing = importlib.import_module('zxingcpp')
+
+    def decode(self, image):
+        symbols = []
+        for result in self._zxing.read_barcodes(np.ascontiguousarray(image)):
+            if not result.valid:
+                continue
+            position = result.position
+            corners = [position.top_left, position.top_right, position.bottom_right, position.bottom_left]
+            symbols.append(_symbol(result.bytes, [(point.x, point.y) for point in corners]))
+        return symbols
+
+
+class WeChatDecoder:
+    """cv2.wechat_qrcode; model_dir holds its detect/sr .prototxt and .caffemodel files
+
+    Without models it falls back to its traditional detector.
+    """
+    name = 'wechat'
+
+    def __init__(self, model_dir=None):
+        if not hasattr(cv2, 'wechat_qrcode_WeChatQRCode'):
+            raise ImportError("The wechat decoder needs opencv-contrib-python")
+        self.model_dir = model_dir
+        self._local = threading.local()
+
+    def _detector(self):
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            if self.model_dir:
+                models = [os.path.join(self.model_dir, name) for name in (
+                    'detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')]
+                detector = cv2.wechat_qrcode_WeChatQRCode(*models)
+            else:
+                detector = cv2.wechat_qrcode_WeChatQRCode()
+            self._local.detector = detector
+        return detector
+
+    def decode(self, image):
+        payloads, points = self._detector().detectAndDecode(image)
+        return [_symbol(_as_bytes(payload), corners) for payload, corners in zip(payloads, points) if payload]
+
+
+BACKENDS = {
+    'pyzbar': PyzbarDecoder,
+    'opencv': OpenCVDecoder,
+    'zxing': ZxingDecoder,
+    'wechat': WeChatDecoder,
+}
+
+
+class RaceDecoder:
+    """Run several backends on the same image at once and keep the first valid result
+
+    accept(symbols) decides what counts as valid, e.g. "contains a ticket
+    payload"; by default any symbol does. When nothing is valid the result of
+    the first backend that found anything is returned, else []. Losing backends
+    are not interrupted; their threads finish in the background, so racing
+    trades CPU for latency and only pays off with idle cores.
+    """
+
+    def __init__(self, backends, accept=None, max_workers=None):
+        self.backends = list(backends)
+        self.name = 'race:' + ','.join(backend.name for backend in self.backends)
+        self.accept = accept or bool
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.backends) * (os.cpu_count() or 1),
+            thread_name_prefix='qr-race'
+        )
+        self._lock = threading.Lock()
+        self.wins = Counter()
+
+    def decode(self, image):
+        pending = {self._pool.submit(backend.decode, image): backend.name for backend in self.backends}
+        fallback = []
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    symbols = future.result()
+                except Exception:
+                    continue
+                if symbols and self.accept(symbols):
+                    with self._lock:
+                        self.wins[name] += 1
+                    return symbols
+                fallback = fallback or symbols
+        return fallback
+
+    def stats(self):
+        """How often each backend won"""
+        with self._lock:
+            return dict(self.wins)
+
+
+def available_backends():
+    """Names of the backends that can run in this environment"""
+    names = []
+    for name, backend in BACKENDS.items():
+        try:
+            if name == 'pyzbar':
+                importlib.import_module('pyzbar.pyzbar')
+            else:
+                backend()
+        except (ImportError, OSError):
+            continue
+        names.append(name)
+    return names
+
+
+def make_decoder(spec=DEFAULT_DECODER, accept=None):
+    """Build a decoder from a spec string (see the module docstring)"""
+    if spec.startswith('race:'):
+        names = [name.strip() for name in spec[len('race:'):].split(',') if name.strip()]
+        if len(names) < 2:
+            raise ValueError(f"A race needs at least two backends: {spec}")
+        return RaceDecoder([make_decoder(name) for name in names], accept=accept)
+    if spec not in BACKENDS:
+        raise ValueError(f"Unknown QR decoder: {spec}")
+    return BACKENDS[spec]()
+
+
+def choose_decoder(results, target):
+    """Fastest spec whose success rate meets target, else the most successful one
+
+    results maps specs to dicts with success_rate and mean_ms, as measured by
+    benchmarks/calibrate_decoders.py.
+    """
+    passing = {spec: stats for spec, stats in results.items() if stats['success_rate'] >= target}
+    if passing:
+        return min(passing, key=lambda spec: passing[spec]['mean_ms'])
+    return max(results, key=lambda spec: (results[spec]['success_rate'], -results[spec]['mean_ms']))
+
+
+def load_calibration(path=DEFAULT_CALIBRATION, default=DEFAULT_DECODER):
+    """Decoder spec chosen by calibrate_decoders.py, or default if there is no calibration"""
+    try:
+        with open(path) as f:
+            return json.load(f)['decoder']
+    except FileNotFoundError:
+        return default
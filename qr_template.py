@@ -0,0 +1,230 @@
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy')
+qrcode = LazyModule('qrcode')
+util = LazyModule('qrcode.util')
+Image = LazyModule('PIL.Image')
+
+# qrcode.constants.ERROR_CORRECT_H, spelled out so default arguments don't import qrcode
+ERROR_CORRECT_H = 2
+
+# Finder/separator, timing and alignment patterns, format info and the dark module only depend
+# on (version, error correction, mask), so they are built once and reused for every ticket.
+_templates = {}
+_canvases = {}
+
+# 1:1:3:1:1 finder-like runs penalised by mask evaluation rule 3
+_RULE3_PATTERNS = (
+    (1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0),
+    (0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1),
+)
+
+
+class QRTemplate:
+    """Precomputed fixed modules and data-module layout for one QR version and EC level"""
+    def __init__(self, version, error_correction):
+        self.version = version
+        self.error_correction = error_correction
+        self.modules_count = version * 4 + 17
+
+        n = self.modules_count
+        scratch = qrcode.QRCode(version=version, error_correction=error_correction)
+        scratch.modules_count = n
+        scratch.modules = [[None] * n for _ in range(n)]
+        scratch.setup_position_probe_pattern(0, 0)
+        scratch.setup_position_probe_pattern(n - 7, 0)
+        scratch.setup_position_probe_pattern(0, n - 7)
+        scratch.setup_position_adjust_pattern()
+        scratch.setup_timing_pattern()
+
+        # Mask selection scores matrices with blank format/version info ("test" mode in qrcode)
+        scratch.setup_type_info(True, 0)
+        if version >= 7:
+            scratch.setup_type_number(True)
+        self.fixed = np.array([[cell is not None for cell in row] for row in scratch.modules])
+        self.test_base = np.array([[bool(cell) for cell in row] for row in scratch.modules])
+
+        # Final symbols carry the real format info, which differs per mask
+        self.final_bases = []
+        for mask_pattern in range(8):
+            scratch.setup_type_info(False, mask_pattern)
+            if version >= 7:
+                scratch.setup_type_number(False)
+            self.final_bases.append(np.array([[bool(cell) for cell in row] for row in scratch.modules]))
+
+        self.data_rows, self.data_cols = self._data_positions()
+
+        rows = self.data_rows.astype(np.int64)
+        cols = self.data_cols.astype(np.int64)
+        self.mask_bits = np.array([
+            (rows + cols) % 2 == 0,
+            rows % 2 == 0,
+            cols % 3 == 0,
+            (rows + cols) % 3 == 0,
+            (rows // 2 + cols // 3) % 2 == 0,
+            (rows * cols) % 2 + (rows * cols) % 3 == 0,
+            ((rows * cols) % 2 + (rows * cols) % 3) % 2 == 0,
+            ((rows * cols) % 3 + (rows + cols) % 2) % 2 == 0,
+        ])
+
+    def _data_positions(self):
+        """Walk the zig-zag placement order used by qrcode's map_data once"""
+        n = self.modules_count
+        rows = []
+        cols = []
+        inc = -1
+        row = n - 1
+        for col in range(n - 1, 0, -2):
+            if col <= 6:
+                col -= 1
+            while True:
+                for c in (col, col - 1):
+                    if not self.fixed[row][c]:
+                        rows.append(row)
+                        cols.append(c)
+                row += inc
+                if row < 0 or n <= row:
+                    row -= inc
+                    inc = -inc
+                    break
+        return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+    def build(self, data, mask_pattern=None):
+        """Place encoded codewords and return (modules, mask_pattern) like QRCode.make()"""
+        bits = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8)).astype(bool)
+        cell_bits = np.zeros(len(self.data_rows), dtype=bool)
+        count = min(len(bits), len(cell_bits))
+        cell_bits[:count] = bits[:count]
+
+        if mask_pattern is None:
+            mask_pattern = self.best_mask_pattern(cell_bits)
+
+        modules = self.final_bases[mask_pattern].copy()
+        modules[self.data_rows, self.data_cols] = cell_bits ^ self.mask_bits[mask_pattern]
+        return modules, mask_pattern
+
+    def best_mask_pattern(self, cell_bits):
+        """Pick the mask with the lowest penalty, first one winning ties as qrcode does"""
+        best_pattern = 0
+        min_lost_point = 0
+        for mask_pattern in range(8):
+            modules = self.test_base.copy()
+            modules[self.data_rows, self.data_cols] = cell_bits ^ self.mask_bits[mask_pattern]
+            lost_point = _lost_point(modules)
+            if mask_pattern == 0 or min_lost_point > lost_point:
+                min_lost_point = lost_point
+                best_pattern = mask_pattern
+        return best_pattern
+
+
+def _lost_point(modules):
+    """Vectorized equivalent of qrcode.util.lost_point"""
+    n = len(modules)
+    lines = np.concatenate([modules, modules.T])
+
+    # Rule 1: runs of five or more same-coloured modules
+    starts = np.ones(lines.shape, dtype=bool)
+    starts[:, 1:] = lines[:, 1:] != lines[:, :-1]
+    run_lengths = np.diff(np.append(np.flatnonzero(starts), starts.size))
+    long_runs = run_lengths[run_lengths >= 5]
+    lost_point = int((long_runs - 2).sum())
+
+    # Rule 2: 2x2 blocks of one colour
+    block = (
+        (modules[:-1, :-1] == modules[1:, :-1])
+        & (modules[:-1, :-1] == modules[:-1, 1:])
+        & (modules[:-1, :-1] == modules[1:, 1:])
+    )
+    lost_point += 3 * int(block.sum())
+
+    # Rule 3: finder-like patterns in rows and columns
+    windows = np.lib.stride_tricks.sliding_window_view(lines, 11, axis=1)
+    matches = (windows[:, :, None, :] == np.array(_RULE3_PATTERNS, dtype=bool)).all(axis=3).any(axis=2)
+    lost_point += 40 * int(matches.sum())
+
+    # Rule 4: dark/light balance
+    percent = float(int(modules.sum())) / (n ** 2)
+    lost_point += int(abs(percent * 100 - 50) / 5) * 10
+
+    return lost_point
+
+
+def get_template(version, error_correction):
+    """Return the cached template for a version/EC level, building it on first use"""
+    key = (version, error_correction)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates[key] = QRTemplate(version, error_correction)
+    return template
+
+
+def make_modules(payload, version, error_correction, mask_pattern=None):
+    """Encode payload exactly like QRCode(version=...).make(fit=True), returning a bool array"""
+    qr = qrcode.QRCode(version=version, error_correction=error_correction)
+    qr.add_data(payload)
+    qr.best_fit(start=version)
+    data = util.create_data(qr.version, qr.error_correction, qr.data_list)
+    modules, _ = get_template(qr.version, qr.error_correction).build(data, mask_pattern)
+    return modules
+
+
+def render_modules(modules, box_size, border):
+    """Upsample a module matrix to an L-mode pixel array (0 dark, 255 light)"""
+    pixels = np.where(modules, np.uint8(0), np.uint8(255))
+    pixels = np.repeat(np.repeat(pixels, box_size, axis=0), box_size, axis=1)
+    pad = border * box_size
+    return np.pad(pixels, pad, constant_values=255)
+
+
+def center_region(modules_count):
+    """(offset, size) in modules of the blanked center area holding the inner QR"""
+    center_size = (modules_count - 8) // 3  # Same calculation as in LogoQR
+    return (modules_count - center_size) // 2, center_size
+
+
+def symbol_size(payload, version=4, error_correction=ERROR_CORRECT_H):
+    """Modules per side of the symbol make_modules/render_composite produce for payload"""
+    qr = qrcode.QRCode(version=version, error_correction=error_correction)
+    qr.add_data(payload)
+    return qr.best_fit(start=version) * 4 + 17
+
+
+def _logo_canvas(modules_count, box_size, border):
+    """Center geometry for LogoQR's blanked area, cached per symbol size"""
+    key = (modules_count, box_size, border)
+    canvas = _canvases.get(key)
+    if canvas is None:
+        center_offset, center_size = center_region(modules_count)
+        center = np.zeros((modules_count, modules_count), dtype=bool)
+        center[center_offset:center_offset + center_size, center_offset:center_offset + center_size] = True
+        canvas = _canvases[key] = {
+            'center': center,
+            'center_size_px': center_size * box_size,
+            'center_pos_px': center_offset * box_size + border * box_size,
+        }
+    return canvas
+
+
+def render_composite(outer_payload, inner_payload, outer_version=4, inner_version=1,
+                     error_correction=ERROR_CORRECT_H,
+                     box_size=15, border=4, inner_box_size=8, inner_border=2, padding=40):
+    """Render the composite ticket image, pixel-identical to the LogoQR + paste path"""
+    outer = make_modules(outer_payload, outer_version, error_correction)
+    canvas = _logo_canvas(len(outer), box_size, border)
+    pixels = render_modules(outer & ~canvas['center'], box_size, border)
+
+    # Mode "1" images are always resized with NEAREST, so keep the inner QR in that mode
+    # for the resize to reproduce the original pixels exactly
+    inner = make_modules(inner_payload, inner_version, error_correction)
+    inner_img = Image.fromarray(render_modules(inner, inner_box_size, inner_border) > 0)
+    target_size = canvas['center_size_px'] - padding
+    inner_img = inner_img.resize((target_size, target_size), Image.Resampling.LANCZOS)
+
+    center_size_px = canvas['center_size_px']
+    paste_offset = (center_size_px - target_size) // 2
+    top = canvas['center_pos_px'] + paste_offset
+    pixels[top:top + target_size, top:top + target_size] = np.where(
+        np.asarray(inner_img), np.uint8(255), np.uint8(0)
+    )
+
+    return Image.fromarray(pixels).convert("RGB")
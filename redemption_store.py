@@ -0,0 +1,349 @@
+import fcntl
+import mmap
+import os
+import sqlite3
+import threading
+import time
+
+from bloom_filter import BloomFilter
+
+
+class RedemptionStore:
+    """Records redeemed ticket IDs with an atomic check-and-mark"""
+
+    # Whether other processes see the same redemptions; shared stores pickle to a
+    # handle that reopens the same database or log in the receiving process
+    shared = False
+
+    def mark_used(self, ticket_id):
+        """Mark a ticket as used, returning True only for the caller that redeemed it first"""
+        raise NotImplementedError
+
+    def is_used(self, ticket_id):
+        """Check whether a ticket has been redeemed, without marking it"""
+        raise NotImplementedError
+
+    def might_be_used(self, ticket_id):
+        """Cheap pre-check before costly work: True is exact, False may be stale
+
+        Only for skipping work early; verdicts use is_used or mark_used.
+        """
+        return self.is_used(ticket_id)
+
+    def __contains__(self, ticket_id):
+        return self.is_used(ticket_id)
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        """Iterate over every redeemed ticket ID"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any files or connections held by the store"""
+
+
+class MemoryRedemptionStore(RedemptionStore):
+    """In-process store; redemptions are lost on restart and not shared between workers"""
+
+    def __init__(self):
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def mark_used(self, ticket_id):
+        with self._lock:
+            if ticket_id in self._used:
+                return False
+            self._used.add(ticket_id)
+            return True
+
+    def is_used(self, ticket_id):
+        return ticket_id in self._used
+
+    def __len__(self):
+        return len(self._used)
+
+    def __iter__(self):
+        return iter(list(self._used))
+
+
+class SQLiteRedemptionStore(RedemptionStore):
+    """Embedded SQLite store in WAL mode, safe to share between processes
+
+    The ticket ID is the primary key of a WITHOUT ROWID table, so a redemption is a
+    single INSERT OR IGNORE and SQLite's write lock makes it exactly-once.
+    """
+
+    shared = True
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS redemptions ("
+            "ticket_id TEXT PRIMARY KEY, redeemed_at INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.commit()
+
+    def __reduce__(self):
+        return SQLiteRedemptionStore, (self.path, self.timeout)
+
+    def _connection(self):
+        # Connections must not cross threads or forked workers, so keep one per thread and pid
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def mark_used(self, ticket_id):
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO redemptions (ticket_id, redeemed_at) VALUES (?, ?)",
+                (ticket_id, int(time.time()))
+            )
+        return cursor.rowcount == 1
+
+    def is_used(self, ticket_id):
+        row = self._connection().execute(
+            "SELECT 1 FROM redemptions WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM redemptions").fetchone()[0]
+
+    def __iter__(self):
+        for (ticket_id,) in self._connection().execute("SELECT ticket_id FROM redemptions"):
+            yield ticket_id
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+class LogRedemptionStore(RedemptionStore):
+    """Append-only log of newline-terminated ticket IDs with an in-memory hash index
+
+    At startup the log is memory-mapped and split in one pass to rebuild the index.
+    Check-and-mark holds an exclusive flock, first catching up on records other
+    processes appended, so each ticket is redeemed exactly once across processes.
+    """
+
+    shared = True
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._used = set()
+        self._offset = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._pid = os.getpid()
+        with self._file_lock():
+            self._truncate_partial_record()
+            self._catch_up()
+
+    def __reduce__(self):
+        return LogRedemptionStore, (self.path, self.fsync)
+
+    def _reopen_after_fork(self):
+        # A forked worker shares the parent's descriptor; give it its own
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def _file_lock(self):
+        return _FileLock(self._fd)
+
+    def _truncate_partial_record(self):
+        """Drop a record left half-written by a crash (caller holds the file lock)"""
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            return
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b'\n') + 1
+        if end != size:
+            os.ftruncate(self._fd, end)
+
+    def _catch_up(self):
+        """Index records appended since our last read (caller holds the file lock)"""
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b'\n', self._offset) + 1
+                if end <= self._offset:
+                    return
+                self._used.update(mm[self._offset:end - 1].split(b'\n'))
+        self._offset = end
+
+    def _key(self, ticket_id):
+        key = ticket_id.encode('utf-8')
+        if b'\n' in key:
+            raise ValueError("Ticket ID must not contain newlines")
+        return key
+
+    def mark_used(self, ticket_id):
+        key = self._key(ticket_id)
+        self._reopen_after_fork()
+        with self._lock, self._file_lock():
+            self._catch_up()
+            if key in self._used:
+                return False
+            os.write(self._fd, key + b'\n')
+            if self.fsync:
+                os.fsync(self._fd)
+            self._used.add(key)
+            self._offset += len(key) + 1
+            return True
+
+    def is_used(self, ticket_id):
+        key = self._key(ticket_id)
+        if key in self._used:
+            return True
+        # Another process may have redeemed it since we last looked
+        self._reopen_after_fork()
+        with self._lock, self._file_lock():
+            self._catch_up()
+        return key in self._used
+
+    def __len__(self):
+        return len(self._used)
+
+    def __iter__(self):
+        for key in list(self._used):
+            yield key.decode('utf-8')
+
+    def close(self):
+        if self._pid == os.getpid():
+            os.close(self._fd)
+
+
+class FilteredRedemptionStore(RedemptionStore):
+    """Bloom filter in front of an exact store
+
+    might_be_used answers filter misses without touching the exact store and
+    confirms filter hits against it. A filter only knows what was redeemed when
+    it was built (or, if writable, in this process since), so is_used and
+    mark_used always go to the exact store: redemptions by other workers after
+    the snapshot are never reported as unused.
+    """
+
+    def __init__(self, store, bloom):
+        self.store = store
+        self.bloom = bloom
+        self.lookups = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+
+    @property
+    def shared(self):
+        return self.store.shared
+
+    def __reduce__(self):
+        # Another process gets the exact store; its filter would be a stale copy
+        return self.store.__reduce__()
+
+    @classmethod
+    def from_store(cls, store, capacity, error_rate=0.001):
+        """Build a filter holding every ID already in the exact store"""
+        bloom = BloomFilter(max(capacity, len(store)), error_rate)
+        for ticket_id in store:
+            bloom.add(ticket_id)
+        return cls(store, bloom)
+
+    @classmethod
+    def from_snapshot(cls, store, path, capacity, error_rate=0.001):
+        """Map an existing snapshot, or build one from the exact store and save it first"""
+        if not os.path.exists(path):
+            cls.from_store(store, capacity, error_rate).snapshot(path)
+        return cls(store, BloomFilter.load(path))
+
+    def mark_used(self, ticket_id):
+        redeemed = self.store.mark_used(ticket_id)
+        if self.bloom.writable and ticket_id not in self.bloom:
+            # Redeemed here or by another worker since the snapshot; remember it locally
+            self.bloom.add(ticket_id)
+        return redeemed
+
+    def is_used(self, ticket_id):
+        return self.store.is_used(ticket_id)
+
+    def might_be_used(self, ticket_id):
+        self.lookups += 1
+        if ticket_id not in self.bloom:
+            return False
+        self.filter_hits += 1
+        if self.store.is_used(ticket_id):
+            return True
+        self.false_positives += 1
+        return False
+
+    def prefault(self):
+        self.bloom.prefault()
+
+    def snapshot(self, path):
+        """Save the filter so other workers can memory-map it with BloomFilter.load"""
+        self.bloom.save(path)
+
+    def stats(self):
+        """Filter memory use with expected and observed false-positive rates"""
+        # Every lookup that is not a confirmed redemption was a true negative
+        negatives = self.lookups - (self.filter_hits - self.false_positives)
+        return {
+            'memory_bytes': self.bloom.memory_bytes,
+            'items': self.bloom.count,
+            'capacity': self.bloom.capacity,
+            'expected_false_positive_rate': self.bloom.false_positive_rate(),
+            'observed_false_positive_rate': self.false_positives / negatives if negatives else 0.0,
+            'lookups': self.lookups,
+            'exact_lookups': self.filter_hits
+        }
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def close(self):
+        self.store.close()
+
+
+class _FileLock:
+    """Exclusive advisory lock on an open file descriptor"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def open_redemption_store(url):
+    """Open a store from a URL: "memory", "sqlite:///path/to.db" or "log:///path/to.log" """
+    if not url or url == 'memory':
+        return MemoryRedemptionStore()
+    if url.startswith('sqlite://'):
+        return SQLiteRedemptionStore(url[len('sqlite://'):])
+    if url.startswith('log://'):
+        return LogRedemptionStore(url[len('log://'):])
+    raise ValueError(f"Unknown redemption store: {url}")
@@ -1,25 +1,98 @@
-from fastapi import FastAPI, HTTPException
+import hashlib
+import os
+from typing import List, Optional
+
+from fastapi import FastAPI, File, Form, Header, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from ticket_verifier import TicketVerifier
 from ticket_generator import TicketGenerator
+from signing_keys import Keyring
+from caches import ScanResultCache
+from verification_service import DeadlineExceeded, ServiceOverloaded, VerificationService
 import uvicorn
 
 app = FastAPI()
 
 # Initialize generator and verifier with same key (in production, use secure key management)
-generator = TicketGenerator()
-verifier = TicketVerifier(generator.secret_key)
+# KEYRING_PATH switches to rotating keys, reloaded from that file as it changes; tickets
+# without a key ID are still checked with the generator's default key
+keyring = None
+if 'KEYRING_PATH' in os.environ:
+    keyring = Keyring.from_file(os.environ['KEYRING_PATH'], legacy_key=hashlib.sha256().digest())
+generator = TicketGenerator(keyring=keyring)
+verifier = TicketVerifier(generator.secret_key, keyring=keyring)
+
+# Image decoding runs on a bounded process pool so it never blocks the event loop
+verification_service = VerificationService(
+    verifier,
+    workers=int(os.environ.get('VERIFY_WORKERS', 0)) or None,
+    max_queue=int(os.environ['VERIFY_MAX_QUEUE']) if 'VERIFY_MAX_QUEUE' in os.environ else None,
+    deadline=float(os.environ.get('VERIFY_DEADLINE_S', 5.0))
+)
+
+# Verdicts of recent uploads by client request ID, so retried uploads are not decoded
+# (or redeemed) twice; SCAN_CACHE_PATH shares them between server processes
+scan_cache = ScanResultCache(ttl=float(os.environ.get('SCAN_CACHE_TTL_S', 120)),
+                             path=os.environ.get('SCAN_CACHE_PATH') or None)
 
 class TicketData(BaseModel):
     encoded_data: str
+    inner_data: Optional[str] = None
 
+class TicketBatch(BaseModel):
+    tickets: List[TicketData]
+    redeem: bool = True
+
+# Payloads decoded on the device: no image work, so these run on the event loop
 @app.post("/verify-ticket/")
 async def verify_ticket(ticket: TicketData):
-    is_valid, message = verifier.verify_ticket(ticket.encoded_data)
+    is_valid, message = verifier.verify_ticket(ticket.encoded_data, ticket.inner_data)
     if not is_valid:
         raise HTTPException(status_code=400, detail=message)
     return {"message": message}
 
+@app.post("/verify-tickets/")
+async def verify_tickets(batch: TicketBatch):
+    results = verifier.verify_tickets(
+        [(ticket.encoded_data, ticket.inner_data) for ticket in batch.tickets], redeem=batch.redeem)
+    return {"results": [{"is_valid": is_valid, "result": result} for is_valid, result in results]}
+
+@app.post("/verify-image/")
+async def verify_image(qr_image: UploadFile = File(...), gate_id: Optional[str] = Form(None),
+                       request_id: Optional[str] = Form(None),
+                       x_request_id: Optional[str] = Header(None)):
+    image = await qr_image.read()
+    try:
+        is_valid, result = await scan_cache.get_or_verify_async(
+            scan_cache.key(request_id or x_request_id, image),
+            lambda: verification_service.verify_async(image, source=gate_id))
+    except ServiceOverloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not is_valid:
+        raise HTTPException(status_code=400, detail=result)
+    return {"message": result}
+
+@app.get("/metrics")
+async def metrics(format: Optional[str] = None):
+    if format == "openmetrics":
+        return PlainTextResponse(
+            verifier.instrumentation.render_openmetrics(
+                gauges={
+                    **{f"service_{name}": value for name, value in verification_service.metrics().items()},
+                    **{f"scan_cache_{name}": value for name, value in scan_cache.stats().items()},
+                }),
+            media_type="application/openmetrics-text; version=1.0.0; charset=utf-8"
+        )
+    return {"service": verification_service.metrics(), "scan_cache": scan_cache.stats(),
+            **verifier.instrumentation.snapshot()}
+
+@app.on_event("shutdown")
+def shutdown_verification_service():
+    verification_service.shutdown(wait=False)
+
 @app.post("/generate-ticket/{ticket_id}")
 async def generate_ticket(ticket_id: str):
     encoded = generator.generate_ticket_data(ticket_id)
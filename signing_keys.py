@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+
+from key_context import KeyContext
+
+# Key IDs travel in every ticket, so keep them short
+MAX_KEY_ID_LENGTH = 8
+
+# How often (seconds) a file-backed keyring checks its file for changes
+RELOAD_INTERVAL = 1.0
+
+
+class Keyring:
+    """Signing keys indexed by key ID, so keys can be rotated without voiding tickets
+
+    New tickets are signed with the active key and carry its ID; verification
+    looks the ID up in a dict, so its cost does not grow with the number of live
+    keys. legacy_key verifies tickets printed before key IDs, which carry none.
+
+    A keyring loaded with from_file picks up edits to the file (new keys, a new
+    active key, retired keys) on its own, checking the file's mtime at most every
+    reload_interval seconds, so long-running workers never need a restart. The
+    file is JSON: {"active": "2025b", "keys": {"2025a": "<hex>", "2025b": "<hex>"}}
+    with an optional "legacy" hex key.
+    """
+
+    def __init__(self, keys=None, active=None, legacy_key=None):
+        self.path = None
+        self.reload_interval = RELOAD_INTERVAL
+        self.last_error = None
+        self._default_legacy = legacy_key
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._set_keys(keys or {}, active, legacy_key)
+
+    @classmethod
+    def from_file(cls, path, reload_interval=RELOAD_INTERVAL, legacy_key=None):
+        """Load a keyring from a JSON file and follow later changes to it
+
+        legacy_key is used unless the file names its own.
+        """
+        keyring = cls(legacy_key=legacy_key)
+        keyring.path = path
+        keyring.reload_interval = reload_interval
+        keyring.reload()
+        if keyring.last_error is not None:
+            raise keyring.last_error
+        return keyring
+
+    def _set_keys(self, keys, active, legacy_key):
+        for kid in keys:
+            if not kid or len(kid) > MAX_KEY_ID_LENGTH or not kid.isascii() or not kid.isprintable():
+                raise ValueError(f"Invalid key ID: {kid!r}")
+        if active is not None and active not in keys:
+            raise ValueError(f"Active key {active!r} is not in the keyring")
+        # Keep existing contexts for unchanged secrets instead of deriving them again
+        previous = getattr(self, '_contexts', {})
+        contexts = {}
+        for kid, secret in keys.items():
+            context = previous.get(kid)
+            contexts[kid] = context if context is not None and context.secret_key == secret else KeyContext(secret, kid)
+        if legacy_key is not None:
+            contexts[None] = KeyContext(legacy_key)
+        # One assignment, so concurrent lookups see the old or the new keys, never a mix
+        self._contexts = contexts
+        self._active = contexts[active] if active is not None else contexts.get(None)
+
+    def add(self, kid, secret_key, activate=False):
+        """Add (or replace) a key; with activate=True new tickets are signed with it"""
+        with self._lock:
+            keys = self.secrets()
+            keys[kid] = secret_key
+            active = kid if activate else (self._active.kid if self._active is not None else None)
+            legacy = self._contexts.get(None)
+            self._set_keys(keys, active, legacy.secret_key if legacy is not None else None)
+
+    def secrets(self):
+        """{key ID: secret} for every key except the legacy one"""
+        return {kid: context.secret_key for kid, context in self._contexts.items() if kid is not None}
+
+    def reload(self):
+        """Re-read the keyring file if it changed; returns True if keys were replaced
+
+        A missing or malformed file keeps the current keys and is recorded in
+        last_error rather than raised, so a bad edit cannot take verification down.
+        """
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return False
+                with open(self.path) as f:
+                    config = json.load(f)
+                keys = {kid: bytes.fromhex(secret) for kid, secret in config['keys'].items()}
+                legacy = config.get('legacy')
+                legacy_key = bytes.fromhex(legacy) if legacy else self._default_legacy
+                self._set_keys(keys, config.get('active'), legacy_key)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                self.last_error = e
+                return False
+            self._mtime = mtime
+            self.last_error = None
+            return True
+
+    def context(self, kid):
+        """KeyContext for a key ID (None for legacy tickets), or None if unknown"""
+        if self.path is not None and time.monotonic() >= self._next_check:
+            self.reload()
+        return self._contexts.get(kid)
+
+    def active(self):
+        """The context new tickets are signed with"""
+        if self.path is not None and time.monotonic() >= self._next_check:
+            self.reload()
+        if self._active is None:
+            raise ValueError("Keyring has no active key")
+        return self._active
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def __contains__(self, kid):
+        return kid in self._contexts
+
+    def __getstate__(self):
+        # Hash states do not pickle; ship the secrets and rebuild them in the worker
+        legacy = self._contexts.get(None)
+        return {
+            'path': self.path,
+            'reload_interval': self.reload_interval,
+            'keys': self.secrets(),
+            'active': self._active.kid if self._active is not None else None,
+            'legacy_key': legacy.secret_key if legacy is not None else None,
+            'default_legacy': self._default_legacy,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['keys'], state['active'], state['legacy_key'])
+        self.path = state['path']
+        self.reload_interval = state['reload_interval']
+        self._default_legacy = state['default_legacy']
@@ -0,0 +1,199 @@
+import time
+
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+
+# Frames whose 64-bit difference hashes differ in at most this many bits are duplicates
+DEDUP_DISTANCE = 4
+
+# Fraction of the tracked code's size added around it when decoding only the ROI
+ROI_MARGIN = 0.2
+
+# Full-frame decode strategies per frame; the next frame is a cheaper retry than
+# the still-image fallback ladder
+STREAM_STRATEGIES = ('direct',)
+
+# Frames wider than this are searched at reduced size; the outer code is large enough
+# to read there, and the tracked ROI is then decoded at full resolution
+SEARCH_WIDTH = 640
+
+
+def capture_frames(capture):
+    """Yield RGB frames from an OpenCV VideoCapture until it runs dry"""
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            return
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def frame_hash(gray):
+    """64-bit difference hash: cheap, and stable under sensor noise and small motion"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    # A small dead band keeps noise on flat scenes (an empty gate) from flipping bits
+    bits = np.packbits(small[:, 1:] > small[:, :-1] + 2)
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def hash_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class StreamVerifier:
+    """Verify a ticket from a stream of camera frames, stopping at the first verdict
+
+    Near-duplicate frames are skipped by perceptual hash. Once the main code has
+    been found, later frames decode only a region of interest around where it was,
+    falling back to the full frame if the ticket moved. Payloads confirmed in
+    different frames are combined, so the outer and inner codes need not read in
+    the same frame.
+    """
+
+    def __init__(self, verifier, source=None, redeem=True, dedup_distance=DEDUP_DISTANCE,
+                 roi_margin=ROI_MARGIN, inner_profile='fast', strategies=STREAM_STRATEGIES,
+                 search_width=SEARCH_WIDTH):
+        self.verifier = verifier
+        self.source = source
+        self.redeem = redeem
+        self.dedup_distance = dedup_distance
+        self.roi_margin = roi_margin
+        self.inner_profile = inner_profile
+        self.strategies = strategies
+        self.search_width = search_width
+        self.reset()
+
+    def reset(self):
+        """Forget the tracked ticket, e.g. between people at a gate"""
+        self.main_data = None
+        self.inner_data = None
+        self.roi = None
+        self._last_hash = None
+        self._first_seen = None
+        self.stats = {'frames': 0, 'duplicates': 0, 'roi_decodes': 0, 'full_decodes': 0,
+                      'verdict_ms': None}
+
+    def _to_gray(self, frame):
+        return self.verifier.load_gray(frame)
+
+    def _decode_roi(self, gray):
+        """Decode only the tracked region; returns (main_data, inner_data, geometry)"""
+        left, top, right, bottom = self.roi
+        enhanced = cv2.equalizeHist(np.ascontiguousarray(gray[top:bottom, left:right]))
+        decoded_objects = self.verifier.decoder.decode(enhanced)
+        decoded_objects.sort(key=lambda x: x.rect.width * x.rect.height, reverse=True)
+        main_data, inner_data, geometry = self.verifier._classify_symbols(decoded_objects)
+        if geometry is not None:
+            corners, payload = geometry
+            geometry = (corners + np.float32([left, top]), payload)
+        return main_data, inner_data, geometry
+
+    def _search(self, gray):
+        """Look for the ticket anywhere in the frame, at reduced size for large frames"""
+        scale = 1.0
+        height, width = gray.shape
+        if self.search_width and width > self.search_width:
+            scale = self.search_width / width
+            gray = cv2.resize(gray, (self.search_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+        with self.verifier.instrumentation.stage('stream_search'):
+            main_data, inner_data, geometry = self.verifier._scan_composite(
+                gray, self.source, strategies=self.strategies)
+        if geometry is not None and scale != 1.0:
+            corners, payload = geometry
+            geometry = (corners / scale, payload)
+        return main_data, inner_data, geometry
+
+    def _track(self, corners, shape):
+        """Region of interest around the main code's corners, clipped to the frame"""
+        low = corners.min(axis=0)
+        high = corners.max(axis=0)
+        margin = (high - low).max() * self.roi_margin
+        height, width = shape[:2]
+        self.roi = (
+            max(0, int(low[0] - margin)), max(0, int(low[1] - margin)),
+            min(width, int(high[0] + margin)), min(height, int(high[1] + margin))
+        )
+
+    def feed(self, frame):
+        """Process one frame; returns (is_valid, result) once decided, otherwise None
+
+        frame may be an RGB or grayscale array, encoded image bytes, or anything
+        else TicketVerifier.load_image accepts.
+        """
+        frame_started = time.perf_counter()
+        self.stats['frames'] += 1
+        gray = self._to_gray(frame)
+
+        # Identical scene, identical pixels: decoding it again cannot tell us more
+        frame_key = frame_hash(gray)
+        if self._last_hash is not None and hash_distance(frame_key, self._last_hash) <= self.dedup_distance:
+            self.stats['duplicates'] += 1
+            return None
+        self._last_hash = frame_key
+
+        main_data = inner_data = geometry = None
+        if self.roi is not None:
+            self.stats['roi_decodes'] += 1
+            with self.verifier.instrumentation.stage('stream_roi'):
+                main_data, inner_data, geometry = self._decode_roi(gray)
+        if main_data is None and inner_data is None:
+            # Lost it (or never had it): search the whole frame
+            self.stats['full_decodes'] += 1
+            main_data, inner_data, geometry = self._search(gray)
+
+        if main_data is None and inner_data is None:
+            # Out of view: latency for the next sighting starts over
+            self.roi = None
+            self._first_seen = None
+            return None
+        if self._first_seen is None:
+            # Latency is measured from the start of the first frame the code was seen in
+            self._first_seen = frame_started
+
+        if main_data is not None:
+            if self.main_data is not None and main_data.get('id') != self.main_data.get('id'):
+                # A different ticket came into view; drop what belonged to the old one
+                self.inner_data = None
+                self._first_seen = frame_started
+            self.main_data = main_data
+            self._track(geometry[0], gray.shape)
+            if self.verifier.redemptions.might_be_used(main_data['id']):
+                return self._verdict(False, "Ticket already used")
+        if inner_data is not None:
+            self.inner_data = inner_data
+
+        if self.main_data is not None and self.inner_data is None and geometry is not None:
+            # Main code in view but the inner one did not read (it is often too small at
+            # search size): warp just its region out of this full-resolution frame
+            try:
+                with self.verifier.instrumentation.stage('stream_inner'):
+                    region = self.verifier.locate_inner_qr(gray, *geometry)
+                    self.inner_data = self.verifier.decode_inner_qr(
+                        gray, profile=self.inner_profile, region=region)
+            except Exception as e:
+                self.verifier._log(f"Error locating inner QR: {str(e)}")
+
+        if self.main_data is not None and self.inner_data is not None:
+            return self._verdict(*self.verifier._check_decoded(self.main_data, self.inner_data, self.redeem))
+        return None
+
+    def _verdict(self, is_valid, result):
+        self.stats['verdict_ms'] = (time.perf_counter() - self._first_seen) * 1000
+        self.verifier.instrumentation.observe('stream_verdict', self.stats['verdict_ms'] / 1000)
+        return is_valid, result
+
+    def verify(self, frames, max_frames=None, timeout=None):
+        """Consume frames until a verdict, max_frames or timeout (seconds) is reached"""
+        started = time.perf_counter()
+        for count, frame in enumerate(frames, 1):
+            verdict = self.feed(frame)
+            if verdict is not None:
+                return verdict
+            if max_frames is not None and count >= max_frames:
+                break
+            if timeout is not None and time.perf_counter() - started >= timeout:
+                break
+        if self.main_data is not None:
+            return False, "Could not read inner QR code"
+        return False, "No ticket found in stream"
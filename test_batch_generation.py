@@ -0,0 +1,78 @@
+import os
+import secrets
+
+from PIL import Image
+
+import ticket_generator
+from ticket_generator import TicketGenerator
+
+_original_render_chunk = ticket_generator._render_batch_chunk
+
+
+def _crash_once_render_chunk(items, output_dir):
+    """Kill the worker the first time it sees ticket index 3"""
+    marker = os.path.join(output_dir, ".crashed")
+    if any(index == 3 for index, _ in items) and not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return _original_render_chunk(items, output_dir)
+
+
+def test_batch_results_are_in_order(tmp_path):
+    generator = TicketGenerator(secrets.token_bytes(32))
+    specs = [f"BATCH{i:04d}" for i in range(6)] + [{'ticket_id': "BATCH0006", 'ticket_price': 100}]
+
+    results = list(generator.generate_batch(specs, output_dir=str(tmp_path), workers=2, chunk_size=2))
+
+    assert [r['index'] for r in results] == list(range(7))
+    assert [r['ticket_id'] for r in results] == [f"BATCH{i:04d}" for i in range(7)]
+    assert results[-1]['ticket_data']['p'] == 100
+    for result in results:
+        assert result['error'] is None
+        assert Image.open(result['path']).size[0] > 0
+    assert generator.last_batch_stats['tickets'] == 7
+
+
+def test_batch_sink_receives_png_bytes(capsys):
+    generator = TicketGenerator(secrets.token_bytes(32))
+    received = []
+
+    list(generator.generate_batch(["SINK0001", "SINK0002"], sink=received.append, workers=1))
+
+    assert [r['ticket_id'] for r in received] == ["SINK0001", "SINK0002"]
+    assert all(r['image'].startswith(b"\x89PNG") for r in received)
+    # Library callers get the throughput in stats and metrics, not on stdout
+    assert capsys.readouterr().out == ""
+    snapshot = generator.instrumentation.snapshot()
+    assert snapshot['stages']['batch']['count'] == 1
+    assert snapshot['counters']['batch_tickets']['total'] == 2
+
+    list(generator.generate_batch(["SINK0003"], sink=received.append, workers=1, verbose=True))
+    assert "Batch generated 1 tickets" in capsys.readouterr().out
+
+
+def test_batch_survives_worker_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(ticket_generator, "_render_batch_chunk", _crash_once_render_chunk)
+    generator = TicketGenerator(secrets.token_bytes(32))
+    specs = [f"CRASH{i:04d}" for i in range(8)]
+
+    results = list(generator.generate_batch(specs, output_dir=str(tmp_path), workers=2, chunk_size=2))
+
+    assert [r['ticket_id'] for r in results] == specs
+    assert all(r['error'] is None for r in results)
+    assert generator.last_batch_stats['worker_restarts'] >= 1
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".png")) == [f"{s}.png" for s in specs]
+
+
+def test_batch_refuses_ids_that_escape_output_dir(tmp_path):
+    generator = TicketGenerator(secrets.token_bytes(32))
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    specs = ["../ESCAPE01", "sub/ESCAPE02", "..", "SAFE0001"]
+
+    results = list(generator.generate_batch(specs, output_dir=str(output_dir), workers=1))
+
+    assert [r['error'] is None for r in results] == [False, False, False, True]
+    assert "file name" in results[0]['error'] and results[0]['ticket_data'] is None
+    assert os.listdir(tmp_path) == ["out"]
+    assert os.listdir(output_dir) == ["SAFE0001.png"]
@@ -0,0 +1,222 @@
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+from caches import ImageCache, ScanResultCache, content_key
+
+
+def test_image_cache_evicts_least_recently_used():
+    cache = ImageCache(max_bytes=30)
+    for name in ('a', 'b', 'c'):
+        cache.put(name, name.encode() * 10)
+    assert cache.get('a') == b'a' * 10
+    cache.put('d', b'd' * 10)
+    # 'b' was the least recently used once 'a' was read
+    assert cache.get('b') is None
+    assert [cache.get(name) is not None for name in ('a', 'c', 'd')] == [True, True, True]
+    stats = cache.stats()
+    assert (stats['evictions'], stats['items'], stats['bytes']) == (1, 3, 30)
+
+
+def test_image_cache_disk_tier(tmp_path):
+    renders = []
+
+    def render():
+        renders.append(1)
+        return b'png' * 100
+
+    key = content_key('ticket-png', 118, 'outer', 'inner')
+    assert key != content_key('ticket-png', 118, 'outer', 'inner2')
+    first = ImageCache(directory=str(tmp_path))
+    assert first.get_or_render(key, render) == b'png' * 100
+    assert first.get_or_render(key, render) == b'png' * 100
+    # Another worker finds it on disk
+    second = ImageCache(directory=str(tmp_path))
+    assert second.get_or_render(key, render) == b'png' * 100
+    assert len(renders) == 1
+    assert second.stats()['disk_hits'] == 1
+
+    small = ImageCache(directory=str(tmp_path), max_disk_bytes=1000)
+    for i in range(5):
+        small.put(content_key(i), b'x' * 300)
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= 1000
+
+
+def test_webapp_reprints_from_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("REDEMPTION_STORE", "memory")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(os.path.abspath(__file__)), "webapp"))
+    sys.modules.pop("app", None)
+    import app as webapp
+
+    client = webapp.app.test_client()
+    generated = client.post("/generate", json={"ticketId": "CACHE0001"}).get_json()
+    payloads = {"payload": generated["payload"], "inner_payload": generated["inner_payload"]}
+
+    image = client.get(generated["image_url"])
+    assert image.status_code == 200 and image.mimetype == "image/png"
+    assert image.headers["ETag"] == f'"{generated["etag"]}"'
+    assert client.get(generated["image_url"], headers={"If-None-Match": image.headers["ETag"]}).status_code == 304
+
+    reprint = client.post("/ticket-image", json=payloads)
+    assert reprint.status_code == 200 and reprint.data == image.data
+    assert webapp.image_cache.stats()['misses'] == 1
+
+    forged = dict(payloads, payload=generated["payload"].replace("CACHE0001", "CACHE0002"))
+    assert client.post("/ticket-image", json=forged).status_code == 403
+    other = client.post("/generate", json={"ticketId": "CACHE0002"}).get_json()
+    for inner_payload in (other["inner_payload"], generated["payload"], "arbitrary text"):
+        response = client.post("/ticket-image", json=dict(payloads, inner_payload=inner_payload))
+        assert response.status_code == 400, inner_payload
+    assert client.get("/ticket-image/" + "0" * 64).status_code == 404
+
+
+def test_scan_cache_returns_first_verdict_to_retries():
+    now = [0.0]
+    cache = ScanResultCache(ttl=60, clock=lambda: now[0])
+    calls = []
+
+    def verify():
+        calls.append(1)
+        return (True, {'ticket_id': 'T1'}) if len(calls) == 1 else (False, "Ticket already used")
+
+    key = cache.key('req-1', b'image')
+    assert cache.key(None, b'image') is None and cache.key('req-2', b'image') != key
+    assert cache.get_or_verify(key, verify) == (True, {'ticket_id': 'T1'})
+    assert cache.get_or_verify(key, verify) == (True, {'ticket_id': 'T1'})
+    assert len(calls) == 1
+    # No request ID: checked every time
+    assert cache.get_or_verify(None, verify)[0] is False
+    now[0] = 61
+    assert cache.get_or_verify(key, verify)[0] is False
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 2, 1 / 3)
+
+    # Failures are not kept
+    def overloaded():
+        raise RuntimeError("queue full")
+    failing = cache.key('req-3', b'image')
+    with pytest.raises(RuntimeError):
+        cache.get_or_verify(failing, overloaded)
+    assert cache.get_or_verify(failing, lambda: (True, 'ok')) == (True, 'ok')
+
+
+def test_scan_cache_retry_waits_for_running_attempt():
+    cache = ScanResultCache()
+    key = cache.key('req-1', b'image')
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow_verify():
+        started.set()
+        release.wait(5)
+        return True, 'first'
+
+    first = threading.Thread(target=lambda: results.append(cache.get_or_verify(key, slow_verify)))
+    first.start()
+    started.wait(5)
+
+    async def retry():
+        return await cache.get_or_verify_async(key, lambda: asyncio.sleep(0, (False, 'second')))
+
+    async def main():
+        pending = asyncio.ensure_future(retry())
+        await asyncio.sleep(0.01)
+        release.set()
+        return await pending
+
+    assert asyncio.run(main()) == (True, 'first')
+    first.join()
+    assert results == [(True, 'first')]
+    assert cache.stats()['waits'] == 1
+
+
+def test_scan_cache_is_bounded():
+    cache = ScanResultCache(max_items=3)
+    for i in range(5):
+        cache.get_or_verify(cache.key(f'req-{i}', b'image'), lambda: (True, i))
+    assert len(cache) == 3
+
+
+def _verify_in_process(path, key, verdict, started, calls):
+    def verify():
+        with calls.get_lock():
+            calls.value += 1
+        started.set()
+        time.sleep(0.3)
+        return verdict
+    cache = ScanResultCache(path=path)
+    return cache.get_or_verify(key, verify)
+
+
+def _retry_in_process(path, key, started, calls, results):
+    started.wait(5)
+    results.put(_verify_in_process(path, key, (False, "Ticket already used"), multiprocessing.Event(), calls))
+
+
+def test_scan_cache_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "scans.db")
+    context = multiprocessing.get_context("spawn")
+    key = ScanResultCache.key('req-1', b'image')
+    started, calls, results = context.Event(), context.Value('i', 0), context.Queue()
+    # A retry reaches a second worker while the first is still verifying
+    retry = context.Process(target=_retry_in_process, args=(path, key, started, calls, results))
+    retry.start()
+    assert _verify_in_process(path, key, (True, {'ticket_id': 'T1'}), started, calls) == (True, {'ticket_id': 'T1'})
+    assert results.get(timeout=30) == (True, {'ticket_id': 'T1'})
+    retry.join(30)
+    assert calls.value == 1
+
+    # Once answered, a fresh process gets the verdict without waiting; failures are released
+    cache = ScanResultCache(path=path)
+    assert cache.get_or_verify(key, lambda: (False, "Ticket already used")) == (True, {'ticket_id': 'T1'})
+    assert cache.stats()['shared_hits'] == 1
+    def overloaded():
+        raise RuntimeError("queue full")
+    failing = cache.key('req-2', b'image')
+    with pytest.raises(RuntimeError):
+        cache.get_or_verify(failing, overloaded)
+    assert ScanResultCache(path=path).get_or_verify(failing, lambda: (True, 'ok')) == (True, 'ok')
+
+
+def test_shared_scan_cache_keeps_the_event_loop_free(tmp_path):
+    path = str(tmp_path / "scans.db")
+    cache = ScanResultCache(path=path)
+    key = cache.key('req-1', b'image')
+    cache.get_or_verify(cache.key('req-0', b'image'), lambda: (True, 'setup'))
+
+    # Another worker holds the write lock for half a second
+    holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(0.5, lambda: holder.execute("COMMIT"))
+
+    async def verify():
+        return True, 'ok'
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.ensure_future(ticker())
+        timer.start()
+        result = await cache.get_or_verify_async(key, verify)
+        ticking.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    timer.join()
+    holder.close()
+    assert result == (True, 'ok')
+    # The loop kept running other requests while the claim waited on the lock
+    assert ticks >= 20
@@ -0,0 +1,108 @@
+import pickle
+import secrets
+
+import pytest
+
+from draw_index import DrawIndex
+from ticket_generator import TicketGenerator
+
+NOW = 1_760_000_000
+DAY = 24 * 60 * 60
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_closing_a_draw_rejects_its_tickets_at_once(tmp_path):
+    clock = FakeClock(NOW)
+    index = DrawIndex(clock)
+    index.open_draw(7, NOW - DAY, NOW + DAY)
+    index.open_draw(8, NOW - DAY, NOW + 2 * DAY)
+    closed = []
+    index.on_close(lambda number, window: closed.append(number))
+
+    assert index.check(7, NOW) is None
+    index.close_draw(7)
+    assert index.check(7, NOW) == "Draw closed"
+    assert index.check(8, NOW) is None
+
+    clock.now = NOW + 3 * DAY
+    assert index.archive_closed() == [7, 8]
+    assert closed == [7, 7, 8]
+    assert len(index) == 0 and index.knows(8)
+
+    path = str(tmp_path / 'draws.json')
+    index.save(path)
+    assert DrawIndex.load(path).check(8, NOW) == "Draw closed"
+    assert pickle.loads(pickle.dumps(index)).window(8) == index.window(8)
+
+
+def test_file_backed_index_follows_closes_from_other_processes(tmp_path):
+    path = str(tmp_path / 'draws.json')
+    admin = DrawIndex(FakeClock(NOW))
+    admin.open_draw(7, NOW - DAY, NOW + DAY)
+    admin.save(path)
+
+    worker = DrawIndex.from_file(path, reload_interval=0)
+    closed = []
+    worker.on_close(lambda number, window: closed.append(number))
+    assert worker.knows(7) and worker.check(7, NOW) is None
+
+    admin.close_draw(7)
+    admin.save(path)
+    assert worker.knows(7) and worker.check(7, NOW) == "Draw closed"
+    assert closed == [7]
+
+    # A bad edit keeps the draws the worker already has
+    with open(path, 'w') as f:
+        f.write('{"open": ')
+    assert worker.knows(7) and worker.last_error is not None
+    with pytest.raises(ValueError):
+        DrawIndex.from_file(path)
+
+
+def test_generator_only_issues_for_open_draws():
+    clock = FakeClock(NOW)
+    index = DrawIndex(clock)
+    index.open_draw(3, NOW - DAY, NOW + DAY)
+    generator = TicketGenerator(secrets.token_bytes(32), clock=clock, draw_index=index)
+
+    ticket_data = generator.generate_ticket_data("DRW00001", draw_number=3)
+    assert ticket_data['t'] == NOW and ticket_data['d'] == NOW + DAY
+    with pytest.raises(ValueError):
+        generator.generate_ticket_data("DRW00002", draw_number=4)
+
+
+def test_verifier_uses_clock_and_draw_index():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    from ticket_verifier import TicketVerifier
+
+    secret_key = secrets.token_bytes(32)
+    clock = FakeClock(NOW)
+    index = DrawIndex(clock)
+    index.open_draw(3, NOW - DAY, NOW + DAY)
+    generator = TicketGenerator(secret_key, clock=clock)
+    verifier = TicketVerifier(secret_key, verbose=False, clock=clock, draw_index=index)
+
+    def check(ticket_data):
+        inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+        return verifier._check_decoded(dict(ticket_data), inner_data, redeem=False)
+
+    indexed = generator.generate_ticket_data("DRW00003", draw_date=NOW + 30 * DAY, draw_number=3)
+    unindexed = generator.generate_ticket_data("DRW00004", draw_date=NOW + DAY, draw_number=9)
+    assert check(indexed)[0] and check(unindexed)[0]
+
+    index.close_draw(3)
+    assert check(indexed) == (False, "Draw closed")
+    # A worker's result is settled against the index as it is now
+    assert verifier.settle_redemption(True, {'ticket_id': "DRW00003", 'draw_number': 3}) == (False, "Draw closed")
+
+    clock.now = NOW + 2 * DAY
+    assert check(unindexed) == (False, "Ticket expired (draw date passed)")
+    clock.now = NOW - DAY
+    assert check(unindexed) == (False, "Invalid ticket date")
@@ -0,0 +1,93 @@
+import io
+import os
+import re
+import secrets
+import sys
+import zlib
+
+import numpy as np
+from PIL import Image
+
+import qr_template
+from imposition import SheetImposer, SheetLayout, render_ticket
+from ticket_generator import BOX_SIZES, PAYLOAD_FORMATS, TicketGenerator
+
+
+def test_render_ticket_matches_composite_at_full_size():
+    for payload_format in PAYLOAD_FORMATS:
+        generator = TicketGenerator(secrets.token_bytes(32), payload_format=payload_format)
+        ticket_data = generator.generate_ticket_data("IMP00001", ticket_price=100, draw_number=2)
+        inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+        payloads = generator.encode_payloads(ticket_data, inner_data)
+        box_size = BOX_SIZES[payload_format]
+
+        expected = np.asarray(qr_template.render_composite(*payloads, box_size=box_size).convert('L')) == 0
+        assert (render_ticket(*payloads, expected.shape[0], box_size) == expected).all()
+
+
+def test_layouts():
+    a4 = SheetLayout.a4()
+    assert (a4.width, a4.height, a4.columns, a4.rows, a4.ticket_px) == (2480, 3508, 16, 24, 118)
+    roll = SheetLayout.roll(80, rows=2)
+    assert (roll.columns, roll.rows, roll.per_page) == (6, 2, 12)
+    left, top = roll.slots[0][1], roll.slots[0][0]
+    assert roll.slots[1] == (top, left + 142)
+
+
+def test_tiff_and_pdf_streams(capsys):
+    # A fixed clock, so the inner payload can be rebuilt from the ticket
+    generator = TicketGenerator(secrets.token_bytes(32), clock=lambda: 1_700_000_000)
+    layout = SheetLayout.roll(80, rows=2, ticket_mm=20)
+    imposer = SheetImposer(generator, layout)
+    ticket_ids = [f"SHEET{i:04d}" for i in range(layout.per_page * 2 + 1)]
+    printed = []
+
+    tiff = b''.join(imposer.stream(ticket_ids, 'tiff', on_page=lambda number, tickets: printed.append(tickets)))
+    assert imposer.last_stats['pages'] == 3
+    assert capsys.readouterr().out == ""
+    assert [ticket['id'] for page in printed for ticket in page] == ticket_ids
+
+    image = Image.open(io.BytesIO(tiff))
+    assert image.n_frames == 3
+    assert image.size == (layout.width, layout.height)
+    assert image.info['dpi'] == (300, 300)
+    # Each slot holds its ticket exactly as drawn on its own
+    image.seek(2)
+    top, left = layout.slots[0]
+    size = layout.ticket_px
+    ticket_data = printed[2][0]
+    inner_data = {'l4': ticket_data['id'][-4:], 'ts': ticket_data['t']}
+    expected = render_ticket(*generator.encode_payloads(ticket_data, inner_data), size)
+    assert (np.asarray(image)[top:top + size, left:left + size] == ~expected).all()
+
+    pdf = b''.join(imposer.stream(ticket_ids, 'pdf'))
+    assert pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n')
+    assert b'/Count 3' in pdf
+    # Every xref entry points at its object
+    xref_at = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+    entries = re.findall(rb'(\d{10}) 00000 n', pdf[xref_at:])
+    for number, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(f"{number} 0 obj".encode())
+    images = re.findall(rb'/Length (\d+) >>\nstream\n', pdf)
+    first = pdf.index(b'stream\n') + len(b'stream\n')
+    packed = zlib.decompress(pdf[first:first + int(images[0])])
+    assert len(packed) == layout.height * ((layout.width + 7) // 8)
+
+
+def test_webapp_bounds_sheet_requests(monkeypatch, tmp_path):
+    monkeypatch.setenv("REDEMPTION_STORE", "memory")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(os.path.abspath(__file__)), "webapp"))
+    sys.modules.pop("app", None)
+    import app as webapp
+
+    client = webapp.app.test_client()
+    for body in ({"count": webapp.SHEET_MAX_TICKETS + 1}, {"count": 0}, {"count": 1, "dpi": 5000},
+                 {"count": 1, "ticket_mm": 1000}, {"count": 1, "roll_width_mm": 10000},
+                 {"count": 1, "digits": 500}, {"ticket_ids": ["A"] * (webapp.SHEET_MAX_TICKETS + 1)},
+                 {"count": "many"}):
+        response = client.post("/generate-sheet", json=body)
+        assert response.status_code == 400, body
+    response = client.post("/generate-sheet", json={"count": 2, "roll_width_mm": 40, "format": "tiff"})
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.get_data())).n_frames == 1
@@ -0,0 +1,58 @@
+import io
+import secrets
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import ingest
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+
+def _jpeg(array):
+    return cv2.imencode('.jpg', array)[1].tobytes()
+
+
+def test_decode_gray_reduces_large_uploads():
+    assert ingest.reduction_for((4032, 3024)) == 2
+    assert ingest.reduction_for((1920, 1080)) == 1
+    assert ingest.reduction_for((4032, 3024), min_side=None) == 1
+    assert ingest.reduction_for((800, 600), min_side=100) == 4
+
+    photo = np.full((600, 800, 3), 200, dtype=np.uint8)
+    gray = ingest.decode_gray(_jpeg(photo), min_side=100)
+    assert gray.shape == (150, 200) and gray.ndim == 2
+    assert not gray.flags.writeable
+    assert ingest.decode_gray(_jpeg(photo), min_side=None).shape == (600, 800)
+
+    # GIF has no OpenCV codec and goes through PIL
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'white').save(buffer, format='GIF')
+    assert ingest.load_gray(buffer.getvalue()).shape == (30, 40)
+
+
+def test_as_gray_shares_grayscale_arrays():
+    frame = np.zeros((20, 30), dtype=np.uint8)
+    gray = ingest.as_gray(frame)
+    assert np.shares_memory(gray, frame)
+    assert not gray.flags.writeable and frame.flags.writeable
+    rgb = ingest.as_gray(np.zeros((20, 30, 3), dtype=np.uint8))
+    assert rgb.shape == (20, 30)
+
+
+def test_verifier_reads_large_jpeg_at_reduced_size():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    secret_key = secrets.token_bytes(32)
+    buffer = io.BytesIO()
+    TicketGenerator(secret_key).generate_composite_qr("INGEST001", buffer)
+    ticket = np.asarray(Image.open(buffer).convert('RGB').resize((800, 800)))
+    photo = np.full((2400, 3200, 3), 230, dtype=np.uint8)
+    photo[600:1400, 1000:1800] = ticket
+    upload = _jpeg(photo)
+
+    verifier = TicketVerifier(secret_key, verbose=False, ingest_min_side=1000)
+    assert verifier.load_gray(upload).shape == (1200, 1600)
+    is_valid, result = verifier.verify_composite_qr(upload, redeem=False)
+    assert is_valid and result['ticket_id'] == "INGEST001"
@@ -0,0 +1,106 @@
+import io
+import os
+import secrets
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+import ticket_verifier
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+TICKET_IDS = [f"MEM{i:05d}" for i in range(16)]
+
+
+def _ticket_images(generator):
+    images = {}
+    for ticket_id in TICKET_IDS:
+        buffer = io.BytesIO()
+        generator.generate_composite_qr(ticket_id, buffer)
+        images[ticket_id] = buffer.getvalue()
+    return images
+
+
+def test_verifier_accepts_in_memory_sources():
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    png = _ticket_images(generator)[TICKET_IDS[0]]
+
+    sources = [
+        png,
+        io.BytesIO(png),
+        Image.open(io.BytesIO(png)),
+        np.array(Image.open(io.BytesIO(png))),
+    ]
+    for source in sources:
+        is_valid, result = verifier.verify_composite_qr(source, redeem=False)
+        assert is_valid, result
+        assert result['ticket_id'] == TICKET_IDS[0]
+
+
+def test_strategy_memory_is_bounded(monkeypatch):
+    monkeypatch.setattr(ticket_verifier, "MAX_STRATEGY_SOURCES", 3)
+    secret_key = secrets.token_bytes(32)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    png = _ticket_images(TicketGenerator(secret_key))[TICKET_IDS[0]]
+
+    for gate in ("gate-1", "gate-2", "gate-3", "gate-1", "gate-4"):
+        assert verifier.verify_composite_qr(png, source=gate, redeem=False)[0]
+    # gate-2 was the least recently seen when gate-4 arrived
+    assert [source for source, _ in verifier.preferred_strategies] == ["gate-3", "gate-1", "gate-4"]
+
+
+def test_parallel_verifications_never_cross():
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    images = _ticket_images(generator)
+
+    def verify(ticket_id):
+        return ticket_id, verifier.verify_composite_qr(images[ticket_id])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(verify, TICKET_IDS * 2))
+
+    first_pass, second_pass = results[:len(TICKET_IDS)], results[len(TICKET_IDS):]
+    for ticket_id, (is_valid, result) in first_pass:
+        assert is_valid, result
+        assert result['ticket_id'] == ticket_id
+    for ticket_id, (is_valid, result) in second_pass:
+        assert not is_valid
+        assert result == "Ticket already used"
+
+
+def test_webapp_verify_uploads_in_parallel_without_temp_files(monkeypatch, tmp_path):
+    monkeypatch.setenv("REDEMPTION_STORE", "memory")
+    monkeypatch.chdir(tmp_path)
+    webapp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webapp")
+    monkeypatch.syspath_prepend(webapp_dir)
+    sys.modules.pop("app", None)
+    import app as webapp
+
+    generator = TicketGenerator(webapp.SECRET_KEY)
+    images = _ticket_images(generator)
+    client = webapp.app.test_client()
+
+    def upload(ticket_id):
+        response = client.post(
+            "/verify",
+            data={"qr_image": (io.BytesIO(images[ticket_id]), f"{ticket_id}.png")},
+            content_type="multipart/form-data",
+        )
+        return ticket_id, response.get_json()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(upload, TICKET_IDS))
+
+    for ticket_id, body in responses:
+        assert body['is_valid'], body
+        assert body['result']['ticket_id'] == ticket_id
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,53 @@
+import io
+import json
+import secrets
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+from pyzbar.pyzbar import decode
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+
+def _off_center_capture(generator, ticket_id):
+    buffer = io.BytesIO()
+    generator.generate_composite_qr(ticket_id, buffer)
+    ticket = Image.open(buffer).convert("RGB").rotate(25, expand=True, fillcolor="white")
+    # Ticket in the lower right of a wider frame, so the middle third misses it
+    frame = Image.new("RGB", (ticket.width + 500, ticket.height + 400), "white")
+    frame.paste(ticket, (480, 390))
+    return frame
+
+
+def test_homography_locates_inner_qr_on_skewed_capture():
+    secret_key = secrets.token_bytes(32)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    frame = _off_center_capture(TicketGenerator(secret_key), "LOC00001")
+
+    main_data, _, geometry = verifier._scan_composite(frame)
+    assert main_data['id'] == "LOC00001"
+    region = verifier.locate_inner_qr(frame, *geometry)
+    payloads = [json.loads(symbol.data) for symbol in decode(region)]
+    assert payloads and payloads[0]['l4'] == "0001"
+
+    # The fixed center crop lands on the wrong pixels
+    assert verifier.decode_inner_qr(frame) is None
+    assert verifier.decode_inner_qr(frame, region=region)['l4'] == "0001"
+
+
+def test_unmeasured_nlmeans_respects_budget(monkeypatch):
+    import cv2
+    import numpy as np
+    calls = []
+    real_nlmeans = cv2.fastNlMeansDenoising
+    monkeypatch.setattr(cv2, "fastNlMeansDenoising", lambda image: calls.append(1) or real_nlmeans(image))
+    verifier = TicketVerifier(secrets.token_bytes(32), verbose=False, preprocess_budget_ms=15)
+    noise = np.random.default_rng(7).integers(0, 256, size=(300, 300), dtype=np.uint8)
+
+    # No NL-means timing exists yet; the seeded estimate for this region exceeds 15 ms
+    assert verifier.decode_inner_qr(None, region=noise) is None
+    assert calls == []
+    assert verifier.preprocess_report()['balanced']['budget_exhausted'] == 1
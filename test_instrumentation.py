@@ -0,0 +1,76 @@
+import threading
+import time
+
+from instrumentation import Instrumentation, SamplingProfiler
+
+
+def test_disabled_instrumentation_records_nothing():
+    instrumentation = Instrumentation(enabled=False)
+    with instrumentation.stage('scan'):
+        pass
+    instrumentation.count('decode_strategy', strategy='otsu')
+    assert instrumentation.stage('scan') is instrumentation.stage('verify')
+    assert instrumentation.snapshot() == {'stages': {}, 'counters': {}}
+
+
+def test_stages_counters_and_openmetrics():
+    instrumentation = Instrumentation()
+    for _ in range(3):
+        with instrumentation.stage('scan'):
+            pass
+    instrumentation.count('decode_strategy', strategy='otsu')
+    instrumentation.count('decode_strategy', strategy='otsu')
+    instrumentation.count('verifications', result='Ticket already used')
+
+    snapshot = instrumentation.snapshot()
+    assert snapshot['stages']['scan']['count'] == 3
+    assert snapshot['counters']['decode_strategy'] == {'strategy=otsu': 2}
+
+    text = instrumentation.render_openmetrics(gauges={'queue_depth': 4, 'workers': 2})
+    assert 'lottery_stage_seconds_bucket{stage="scan",le="+Inf"} 3' in text
+    assert 'lottery_stage_seconds_count{stage="scan"} 3' in text
+    assert 'lottery_decode_strategy_total{strategy="otsu"} 2' in text
+    assert 'lottery_verifications_total{result="Ticket already used"} 1' in text
+    assert 'lottery_queue_depth 4' in text
+    assert text.endswith('# EOF\n')
+
+
+def test_captured_events_merge_into_another_instance():
+    worker = Instrumentation()
+    with worker.capture() as trace:
+        with worker.stage('decode'):
+            pass
+        worker.count('decode_failed')
+    with worker.stage('outside_capture'):
+        pass
+
+    parent = Instrumentation()
+    parent.merge(trace.events)
+    snapshot = parent.snapshot()
+    assert snapshot['stages']['decode']['count'] == 1
+    assert 'outside_capture' not in snapshot['stages']
+    assert snapshot['counters']['decode_failed'] == {'total': 1}
+
+
+def _busy_wait(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler_collects_stacks():
+    profiler = SamplingProfiler(interval=0.001)
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_wait, args=(stop,))
+    worker.start()
+    try:
+        profiler.start()
+        assert profiler.running
+        time.sleep(0.2)
+        profiler.stop()
+    finally:
+        stop.set()
+        worker.join()
+
+    assert not profiler.running
+    assert profiler.sample_count > 0
+    assert '_busy_wait' in profiler.collapsed()
@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import hmac
+import io
+import json
+import secrets
+
+import pytest
+
+import ticket_payload
+from key_context import KeyContext
+from ticket_generator import TicketGenerator
+
+
+def test_key_context_matches_hmac_sha256():
+    for length in (1, 16, 32, 64, 100):
+        secret_key = secrets.token_bytes(length)
+        keys = KeyContext(secret_key)
+        messages = [secrets.token_bytes(n) for n in (0, 1, 63, 64, 65, 500)]
+        expected = [hmac.new(secret_key, message, hashlib.sha256).digest() for message in messages]
+        assert keys.sign_many(messages) == expected
+        assert all(keys.verify_many(zip(messages, (digest[:8] for digest in expected)), 8))
+        assert all(keys.verify_many(zip(messages, expected), 32))
+        assert keys.verify_many([(b"other", expected[0]), (messages[0], b"")], 32) == [False, False]
+
+
+def test_key_context_refuses_tags_of_the_wrong_length():
+    keys = KeyContext(secrets.token_bytes(32))
+    message = b"ticket"
+    digest = keys.sign(message)
+    # A prefix of the right tag is still refused when the format wants more bytes
+    for length in (1, 8, 31):
+        assert not keys.verify(message, digest[:length], 32)
+    assert keys.verify_many([(message, digest[:1]), (message, digest[:8])], 32) == [False, False]
+    # Compact MACs are exactly MAC_BYTES: shorter or longer tags are refused
+    assert keys.verify(message, digest[:ticket_payload.MAC_BYTES], ticket_payload.MAC_BYTES)
+    for tag in (digest[:4], digest[:ticket_payload.MAC_BYTES + 1], digest):
+        assert not keys.verify(message, tag, ticket_payload.MAC_BYTES)
+    assert not keys.verify(message, b"", 0)
+    assert not keys.verify(message, digest + b"\0", 33)
+
+
+def test_json_tags_must_be_full_length():
+    secret_key = secrets.token_bytes(32)
+    ticket_data = TicketGenerator(secret_key).generate_ticket_data("KEY00003")
+    tag = base64.b64decode(ticket_data['h'])
+    assert len(tag) == ticket_payload.JSON_TAG_BYTES
+    for length in (1, 8):
+        assert not ticket_payload.verify_json({**ticket_data, 'h': base64.b64encode(tag[:length]).decode()}, secret_key)
+    made_up = {**ticket_data, 'id': "FORGED02"}
+    assert not any(ticket_payload.verify_json({**made_up, 'h': base64.b64encode(bytes([byte])).decode()}, secret_key)
+                   for byte in range(256))
+
+
+def test_json_tag_accepts_legacy_tickets():
+    secret_key = secrets.token_bytes(32)
+    ticket_data = TicketGenerator(secret_key).generate_ticket_data("KEY00001", ticket_price=100)
+    assert ticket_payload.verify_json(ticket_data, secret_key)
+
+    # Printed before HMAC-SHA256: sha256 over the repr of the JSON bytes and the hex key
+    legacy = {k: v for k, v in ticket_data.items() if k != 'h'}
+    message = json.dumps(legacy, sort_keys=True).encode()
+    legacy['h'] = base64.b64encode(hashlib.sha256(f"{message}:{secret_key.hex()}".encode()).digest()).decode()
+    assert ticket_payload.verify_json(legacy, secret_key)
+
+    assert not ticket_payload.verify_json({**legacy, 'p': 1000}, secret_key)
+    assert not ticket_payload.verify_json({**ticket_data, 'h': "not base64!"}, secret_key)
+    assert not ticket_payload.verify_json(ticket_data, secrets.token_bytes(32))
+
+
+def test_verifier_checks_json_tags():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    from ticket_verifier import TicketVerifier
+
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key)
+    verifier = TicketVerifier(secret_key, verbose=False)
+
+    ticket_data = generator.generate_ticket_data("KEY00002")
+    inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+    forged = {**ticket_data, 'd': ticket_data['d'] + 86400}
+    buffer = io.BytesIO()
+    generator.render_composite(forged, inner_data).save(buffer, format="PNG")
+    assert verifier.verify_composite_qr(buffer.getvalue()) == (False, "Invalid HMAC")
+
+    buffer = io.BytesIO()
+    generator.render_composite(ticket_data, inner_data).save(buffer, format="PNG")
+    is_valid, result = verifier.verify_composite_qr(buffer.getvalue())
+    assert is_valid, result
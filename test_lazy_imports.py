@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import pytest
+
+from lazy_imports import LazyModule
+
+
+def test_lazy_module_imports_on_first_use():
+    json = LazyModule('json')
+    assert 'dumps' not in vars(json)
+    assert json.dumps([1]) == '[1]'
+    # The namespace is copied over, so later lookups skip __getattr__
+    assert 'dumps' in vars(json)
+
+
+def test_importing_the_pipeline_skips_the_imaging_stack():
+    code = ("import sys, ticket_verifier, ticket_generator, imposition, micro_batch, redemption_store; "
+            "print(sorted(m for m in ('numpy', 'cv2', 'PIL', 'pyzbar', 'qrcode', 'Crypto') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_warm_up_verifies_every_payload_format():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    import ticket_verifier
+
+    assert ticket_verifier.warm_up()
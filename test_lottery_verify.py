@@ -0,0 +1,68 @@
+import csv
+import json
+import os
+import secrets
+
+import pytest
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+import lottery_verify
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+
+def _scans(tmp_path, secret_key):
+    scans = tmp_path / "scans"
+    (scans / "gate2").mkdir(parents=True)
+    generator = TicketGenerator(secret_key)
+    generator.generate_composite_qr("AUDIT0001", str(scans / "a.png"))
+    generator.generate_composite_qr("AUDIT0002", str(scans / "gate2" / "b.png"))
+    (scans / "c.png").write_bytes(b"not an image")
+    (scans / "notes.txt").write_text("skipped")
+    return scans
+
+
+def test_verify_many_yields_in_order_and_redeems_once(tmp_path):
+    secret_key = secrets.token_bytes(32)
+    scans = _scans(tmp_path, secret_key)
+    paths = list(lottery_verify.iter_image_paths([str(scans)]))
+    assert [os.path.relpath(path, scans) for path in paths] == ["a.png", "c.png", os.path.join("gate2", "b.png")]
+
+    verifier = TicketVerifier(secret_key, verbose=False)
+    audit = list(verifier.verify_many(paths, workers=2, chunksize=1))
+    assert [record['path'] for record in audit] == paths
+    assert [record['is_valid'] for record in audit] == [True, False, True]
+    assert audit[2]['result']['ticket_id'] == "AUDIT0002"
+    # Audits do not burn tickets
+    assert len(verifier.redemptions) == 0
+
+    redeemed = list(verifier.verify_many(paths, workers=2, redeem=True))
+    assert [record['is_valid'] for record in redeemed] == [True, False, True]
+    again = list(verifier.verify_many(paths[:1], workers=1, redeem=True))
+    assert again[0]['result'] == "Ticket already used"
+
+
+def test_cli_writes_rows_and_resumes(tmp_path, capsys):
+    secret_key = secrets.token_bytes(32)
+    scans = _scans(tmp_path, secret_key)
+    output = tmp_path / "results.jsonl"
+    args = [str(scans), "--key-hex", secret_key.hex(), "--output", str(output), "--workers", "1"]
+
+    lottery_verify.main(args)
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row['is_valid'] for row in rows] == [True, False, True]
+    assert rows[0]['ticket_id'] == "AUDIT0001" and rows[0]['message'] == "Valid"
+    assert "3 images" in capsys.readouterr().err
+
+    # An interrupted run: one complete row and a torn one
+    output.write_text(output.read_text().splitlines()[0] + '\n{"path": "')
+    lottery_verify.main(args + ["--resume"])
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row['path'] for row in rows] == list(lottery_verify.iter_image_paths([str(scans)]))
+    assert "1 skipped" in capsys.readouterr().err
+
+    csv_output = tmp_path / "results.csv"
+    lottery_verify.main([str(scans / "a.png"), "--key-hex", secret_key.hex(), "--output", str(csv_output)])
+    with open(csv_output, newline='') as f:
+        assert [row['ticket_id'] for row in csv.DictReader(f)] == ["AUDIT0001"]
@@ -0,0 +1,58 @@
+import io
+import secrets
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+from micro_batch import MicroBatchScheduler, batch_enhanced_gray
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+TICKET_IDS = ["MB000001", "MB000002", "MB000003", "MB000004"]
+
+
+def test_batched_preprocessing_matches_per_image():
+    rng = np.random.default_rng(7)
+    arrays = [
+        rng.integers(0, 256, (48, 64, 3), dtype=np.uint8),
+        rng.normal(128, 20, (48, 64, 3)).clip(0, 255).astype(np.uint8),
+        (rng.integers(0, 4, (48, 64, 3)) * 60).astype(np.uint8),
+        np.full((30, 30, 3), 77, dtype=np.uint8),
+        rng.integers(0, 256, (30, 40), dtype=np.uint8),
+    ]
+    verifier = TicketVerifier(None, verbose=False)
+    for array, enhanced in zip(arrays, batch_enhanced_gray(arrays)):
+        assert np.array_equal(enhanced, verifier._to_enhanced_gray(array))
+
+
+def test_scheduler_batches_and_returns_each_result():
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key)
+    pngs = []
+    for ticket_id in TICKET_IDS:
+        buffer = io.BytesIO()
+        generator.generate_composite_qr(ticket_id, buffer)
+        pngs.append(buffer.getvalue())
+
+    scheduler = MicroBatchScheduler(TicketVerifier(secret_key, verbose=False), window_ms=200, decode_threads=2)
+    try:
+        futures = [scheduler.submit(png, source=f"gate-{i}") for i, png in enumerate(pngs)]
+        for ticket_id, future in zip(TICKET_IDS, futures):
+            is_valid, result = future.result(timeout=30)
+            assert is_valid, result
+            assert result['ticket_id'] == ticket_id
+
+        is_valid, result = scheduler.verify(pngs[0])
+        assert is_valid
+        is_valid, result = scheduler.verify(pngs[0])
+        assert not is_valid
+        assert result == "Ticket already used"
+
+        metrics = scheduler.metrics()
+        assert metrics['batches'] < metrics['submitted']
+        assert metrics['completed'] == len(TICKET_IDS) + 2
+        assert metrics['in_flight'] == 0
+    finally:
+        scheduler.shutdown()
@@ -0,0 +1,122 @@
+import base64
+import json
+import os
+import secrets
+import subprocess
+import sys
+
+import ticket_payload
+from payload_verifier import PayloadVerifier
+from ticket_generator import TicketGenerator
+
+
+def _payloads(generator, ticket_id):
+    ticket_data = generator.generate_ticket_data(ticket_id, ticket_price=100, draw_number=3)
+    inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+    return ticket_data, inner_data, generator.encode_payloads(ticket_data, inner_data)
+
+
+def test_verify_ticket_accepts_strings_bytes_and_dicts():
+    secret_key = secrets.token_bytes(32)
+    verifier = PayloadVerifier(secret_key, verbose=False)
+    for payload_format in ('json', 'compact'):
+        generator = TicketGenerator(secret_key, payload_format=payload_format)
+        _, _, (outer, inner) = _payloads(generator, f"{payload_format.upper()}0001")
+        is_valid, result = verifier.verify_ticket(outer.encode(), inner, redeem=False)
+        assert is_valid, result
+        assert result['draw_number'] == 3
+        is_valid, result = verifier.verify_ticket(outer)
+        assert is_valid, result
+        assert verifier.verify_ticket(outer) == (False, "Ticket already used")
+
+    ticket_data, inner_data, _ = _payloads(TicketGenerator(secret_key), "DICT0001")
+    assert verifier.verify_ticket(ticket_data, inner_data)[0]
+    # The caller's dict keeps its tag
+    assert 'h' in ticket_data
+
+
+def test_verify_ticket_rejects_bad_payloads():
+    secret_key = secrets.token_bytes(32)
+    verifier = PayloadVerifier(secret_key, verbose=False)
+    generator = TicketGenerator(secret_key)
+    ticket_data, _, (outer, inner) = _payloads(generator, "BAD00001")
+    _, _, (_, other_inner) = _payloads(generator, "BAD00002")
+
+    assert verifier.verify_ticket("not a ticket") == (False, "Invalid ticket payload")
+    assert verifier.verify_ticket(b"\xff\xfe") == (False, "Invalid ticket payload")
+    assert verifier.verify_ticket(outer, "garbage") == (False, "Invalid inner QR data")
+    assert verifier.verify_ticket(outer, other_inner) == (False, "Inner QR verification failed")
+    forged = json.dumps({**ticket_data, 'p': 100000})
+    assert verifier.verify_ticket(forged) == (False, "Invalid HMAC")
+
+
+def test_verify_tickets_batch():
+    secret_key = secrets.token_bytes(32)
+    verifier = PayloadVerifier(secret_key, verbose=False)
+    generator = TicketGenerator(secret_key, payload_format='compact')
+    payloads = [_payloads(generator, f"BAT{i:05d}")[2] for i in range(20)]
+
+    results = verifier.verify_tickets(payloads + [payloads[0][0], "junk"])
+    assert all(is_valid for is_valid, _ in results[:20])
+    assert results[20:] == [(False, "Ticket already used"), (False, "Invalid ticket payload")]
+    counters = verifier.instrumentation.snapshot()['counters']['payload_verifications']
+    assert counters == {'result=valid': 20, 'result=Ticket already used': 1, 'result=Invalid ticket payload': 1}
+
+
+def test_payload_path_skips_image_libraries():
+    code = ("import sys, payload_verifier, ticket_payload; "
+            "print(sorted(m for m in ('cv2', 'PIL', 'pyzbar') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_caller_cannot_vouch_for_a_mac():
+    secret_key = secrets.token_bytes(32)
+    verifier = PayloadVerifier(secret_key, verbose=False)
+    ticket_data, _, _ = _payloads(TicketGenerator(secret_key), "FORGE0002")
+    forged = {k: v for k, v in ticket_data.items() if k != 'h'}
+    assert verifier.verify_ticket({**forged, 'mac_valid': True}) == (False, "Missing HMAC")
+    assert verifier.verify_ticket({**ticket_data, 'p': 100000, 'mac_valid': True}) == (False, "Invalid HMAC")
+    assert not verifier.redemptions.is_used("FORGE0002")
+
+
+def test_webapp_takes_payload_text_only(monkeypatch, tmp_path):
+    monkeypatch.setenv("REDEMPTION_STORE", "memory")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(os.path.abspath(__file__)), "webapp"))
+    sys.modules.pop("app", None)
+    import app as webapp
+
+    ticket_data, _, (outer, _) = _payloads(TicketGenerator(webapp.SECRET_KEY), "FORGE0003")
+    client = webapp.app.test_client()
+    forged = {**ticket_data, 'mac_valid': True}
+    response = client.post("/verify-payload", json={"payload": forged})
+    assert response.status_code == 400
+    response = client.post("/verify-payload", json={"tickets": [{"payload": outer}, {"payload": forged}]})
+    assert response.status_code == 400
+    response = client.post("/verify-payload", json={"payload": outer, "redeem": False})
+    assert response.get_json()['is_valid']
+
+
+def test_verify_ticket_refuses_short_tags():
+    secret_key = secrets.token_bytes(32)
+    verifier = PayloadVerifier(secret_key, verbose=False)
+    ticket_data, _, _ = _payloads(TicketGenerator(secret_key), "SHORT001")
+    tag = base64.b64decode(ticket_data['h'])
+    for length in (1, 8):
+        truncated = json.dumps({**ticket_data, 'h': base64.b64encode(tag[:length]).decode()})
+        assert verifier.verify_ticket(truncated, redeem=False) == (False, "Invalid HMAC")
+
+    # Every one-byte tag on a made-up ticket is refused, not one in 256
+    made_up = {k: v for k, v in ticket_data.items() if k != 'h'}
+    made_up['id'] = "FORGED01"
+    for byte in range(256):
+        forged = json.dumps({**made_up, 'h': base64.b64encode(bytes([byte])).decode()})
+        assert verifier.verify_ticket(forged, redeem=False) == (False, "Invalid HMAC")
+
+    # A compact payload whose MAC is cut short no longer lines up with its fields
+    generator = TicketGenerator(secret_key, payload_format='compact')
+    _, _, (outer, _) = _payloads(generator, "SHORT002")
+    data = ticket_payload.b45decode(outer[len(ticket_payload.OUTER_PREFIX):])
+    shortened = ticket_payload.OUTER_PREFIX + ticket_payload.b45encode(data[:-4])
+    assert not verifier.verify_ticket(shortened, redeem=False)[0]
@@ -0,0 +1,103 @@
+import io
+import secrets
+import threading
+
+import pytest
+
+import qr_decoders
+from qr_decoders import RaceDecoder, Symbol, choose_decoder, make_decoder
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+
+class _Backend:
+    def __init__(self, name, symbols, release=None):
+        self.name = name
+        self.symbols = symbols
+        self.release = release
+
+    def decode(self, image):
+        if self.release is not None:
+            self.release.wait(5)
+        return self.symbols
+
+
+def _symbols(data):
+    return [Symbol(data, None, [])]
+
+
+def test_make_decoder_specs():
+    assert make_decoder('opencv').name == 'opencv'
+    assert make_decoder('race:pyzbar, opencv').name == 'race:pyzbar,opencv'
+    with pytest.raises(ValueError):
+        make_decoder('tesseract')
+    with pytest.raises(ValueError):
+        make_decoder('race:opencv')
+    assert 'opencv' in qr_decoders.available_backends()
+
+
+def test_race_takes_first_valid_result():
+    release = threading.Event()
+    accept = lambda symbols: symbols[0].data == b'ticket'
+    race = RaceDecoder([_Backend('slow', _symbols(b'ticket'), release), _Backend('fast', _symbols(b'ticket'))],
+                       accept=accept)
+    assert race.decode(None)[0].data == b'ticket'
+    assert race.stats() == {'fast': 1}
+    release.set()
+
+    # A fast but unusable result does not win
+    race = RaceDecoder([_Backend('slow', _symbols(b'ticket')), _Backend('fast', _symbols(b'other'))],
+                       accept=accept)
+    assert race.decode(None)[0].data == b'ticket'
+    race = RaceDecoder([_Backend('a', []), _Backend('b', _symbols(b'other'))], accept=accept)
+    assert race.decode(None)[0].data == b'other'
+
+    results = {'pyzbar': {'success_rate': 0.97, 'mean_ms': 40.0},
+               'opencv': {'success_rate': 0.90, 'mean_ms': 20.0},
+               'race:pyzbar,opencv': {'success_rate': 0.99, 'mean_ms': 35.0}}
+    assert choose_decoder(results, 0.95) == 'race:pyzbar,opencv'
+    assert choose_decoder(results, 0.999) == 'race:pyzbar,opencv'
+    assert choose_decoder(results, 0.5) == 'opencv'
+
+
+def test_verifier_with_opencv_backend():
+    # A fixed key and clock, so the rendered ticket is the same on every run
+    secret_key = bytes(range(32))
+    clock = lambda: 1_700_000_000
+    buffer = io.BytesIO()
+    TicketGenerator(secret_key, clock=clock).generate_composite_qr("DECODE001", buffer)
+    verifier = TicketVerifier(secret_key, verbose=False, decoder='opencv', clock=clock)
+    is_valid, result = verifier.verify_composite_qr(buffer.getvalue())
+    assert is_valid and result['ticket_id'] == "DECODE001"
+
+
+def test_race_accepts_by_payload_kind():
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key)
+    ticket_data = generator.generate_ticket_data("KIND00001")
+    outer, inner = generator.encode_payloads(ticket_data, generator.generate_inner_qr_data(ticket_data)[0])
+    verifier = TicketVerifier(secret_key, verbose=False, decoder='race:pyzbar,opencv')
+    inner_only, both = _symbols(inner.encode()), _symbols(outer.encode()) + _symbols(inner.encode())
+
+    # The main scan waits for a backend that read the main code; the inner ladder does not
+    release = threading.Event()
+    main_race = RaceDecoder([_Backend('slow', both, release), _Backend('fast', inner_only)],
+                            accept=verifier._has_main_payload)
+    threading.Timer(0.05, release.set).start()
+    assert main_race.decode(None) == both
+    release = threading.Event()
+    inner_race = RaceDecoder([_Backend('slow', both, release), _Backend('fast', inner_only)],
+                             accept=verifier._has_inner_payload)
+    assert inner_race.decode(None) == inner_only
+    release.set()
+    assert verifier.decoder.accept == verifier._has_main_payload
+    assert verifier.inner_decoder.accept == verifier._has_inner_payload
+
+
+def test_pools_need_a_decoder_spec():
+    verifier = TicketVerifier(None, verbose=False, decoder=qr_decoders.OpenCVDecoder())
+    with pytest.raises(ValueError):
+        verifier.pool_initargs()
+    with pytest.raises(ValueError):
+        list(verifier.verify_many(["ticket.png"], workers=1))
+    assert TicketVerifier(None, verbose=False, decoder='opencv').pool_initargs()[7] == 'opencv'
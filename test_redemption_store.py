@@ -0,0 +1,133 @@
+import json
+import multiprocessing
+
+import pytest
+
+from bloom_filter import BloomFilter
+from redemption_store import (
+    FilteredRedemptionStore,
+    LogRedemptionStore,
+    MemoryRedemptionStore,
+    SQLiteRedemptionStore,
+)
+
+TICKETS = [f"TKT{i:05d}" for i in range(200)]
+
+
+def _open(kind, path):
+    if kind == "sqlite":
+        return SQLiteRedemptionStore(path)
+    return LogRedemptionStore(path)
+
+
+def _redeem_all(kind, path, queue):
+    store = _open(kind, path)
+    queue.put(sum(store.mark_used(ticket_id) for ticket_id in TICKETS))
+    store.close()
+
+
+def test_memory_store_marks_once():
+    store = MemoryRedemptionStore()
+    assert store.mark_used("TKT1")
+    assert not store.mark_used("TKT1")
+    assert "TKT1" in store
+    assert len(store) == 1
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "log"])
+def test_store_persists_across_reopen(tmp_path, kind):
+    path = str(tmp_path / f"redemptions.{kind}")
+    store = _open(kind, path)
+    assert store.mark_used("TKT1")
+    assert not store.mark_used("TKT1")
+    store.close()
+
+    reopened = _open(kind, path)
+    assert reopened.is_used("TKT1")
+    assert not reopened.is_used("TKT2")
+    assert not reopened.mark_used("TKT1")
+    assert len(reopened) == 1
+    reopened.close()
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "log"])
+def test_store_redeems_exactly_once_across_processes(tmp_path, kind):
+    path = str(tmp_path / f"redemptions.{kind}")
+    _open(kind, path).close()
+
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_redeem_all, args=(kind, path, queue)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    redeemed = sum(queue.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    assert redeemed == len(TICKETS)
+    assert len(_open(kind, path)) == len(TICKETS)
+
+
+def test_log_store_drops_torn_record(tmp_path):
+    path = tmp_path / "redemptions.log"
+    path.write_bytes(b"TKT1\nTKT2\nTKT")
+
+    store = LogRedemptionStore(str(path))
+    assert store.is_used("TKT2")
+    assert not store.is_used("TKT")
+    assert store.mark_used("TKT3")
+    store.close()
+
+    assert path.read_bytes() == b"TKT1\nTKT2\nTKT3\n"
+
+
+def test_filtered_store_answers_misses_from_filter(tmp_path):
+    exact = SQLiteRedemptionStore(str(tmp_path / "redemptions.db"))
+    for ticket_id in TICKETS[:50]:
+        exact.mark_used(ticket_id)
+
+    snapshot = str(tmp_path / "redemptions.bloom")
+    store = FilteredRedemptionStore.from_snapshot(exact, snapshot, capacity=1000)
+    assert all(store.might_be_used(ticket_id) for ticket_id in TICKETS[:50])
+    assert not any(store.might_be_used(ticket_id) for ticket_id in TICKETS[50:])
+
+    assert store.mark_used("NEW00001")
+    assert not store.mark_used("NEW00001")
+    assert store.is_used("NEW00001")
+
+    stats = store.stats()
+    assert stats['exact_lookups'] < stats['lookups']
+    assert stats['memory_bytes'] > 0
+
+
+def test_filtered_store_is_exact_after_snapshot_goes_stale(tmp_path):
+    path = str(tmp_path / "redemptions.db")
+    exact = SQLiteRedemptionStore(path)
+    exact.mark_used(TICKETS[0])
+    store = FilteredRedemptionStore.from_snapshot(exact, str(tmp_path / "redemptions.bloom"), capacity=1000)
+
+    # Another worker redeems a ticket after the snapshot was taken
+    SQLiteRedemptionStore(path).mark_used(TICKETS[1])
+    assert not store.might_be_used(TICKETS[1])
+    assert store.is_used(TICKETS[1])
+
+    from payload_verifier import PayloadVerifier
+    from ticket_generator import TicketGenerator
+    generator = TicketGenerator(bytes(range(32)))
+    payload = json.dumps(generator.generate_ticket_data(TICKETS[1]))
+    verifier = PayloadVerifier(generator.secret_key, redemption_store=store, verbose=False)
+    assert verifier.verify_ticket(payload, redeem=False) == (False, "Ticket already used")
+
+
+def test_bloom_snapshot_round_trip(tmp_path):
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(f"TKT{i}")
+    path = str(tmp_path / "tickets.bloom")
+    bloom.save(path)
+
+    shared = BloomFilter.load(path, mode='r')
+    assert not shared.writable
+    assert all(f"TKT{i}" in shared for i in range(10000))
+    false_positives = sum(f"MISS{i}" in shared for i in range(10000))
+    assert false_positives / 10000 < 0.03
+    assert abs(shared.false_positive_rate() - 0.01) < 0.005
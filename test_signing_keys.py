@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import pickle
+import secrets
+
+import pytest
+
+import ticket_payload
+from signing_keys import Keyring
+from ticket_generator import TicketGenerator
+
+
+def _write_keyring(path, keys, active, mtime_ns):
+    with open(path, 'w') as f:
+        json.dump({'active': active, 'keys': {kid: key.hex() for kid, key in keys.items()}}, f)
+    # Some filesystems only keep whole seconds; make every rewrite visible
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_rotation_keeps_old_tickets_valid():
+    legacy_key, first, second = (secrets.token_bytes(32) for _ in range(3))
+    old_ticket = TicketGenerator(legacy_key).generate_ticket_data("ROT00000")
+
+    keyring = Keyring({'k1': first}, active='k1', legacy_key=legacy_key)
+    generator = TicketGenerator(keyring=keyring, payload_format='compact')
+    ticket = generator.generate_ticket_data("ROT00001")
+    assert ticket['k'] == 'k1'
+
+    keyring.add('k2', second, activate=True)
+    rotated = generator.generate_ticket_data("ROT00002")
+    assert rotated['k'] == 'k2'
+
+    verifier_keys = Keyring({'k1': first, 'k2': second}, legacy_key=legacy_key)
+    assert ticket_payload.verify_json(old_ticket, verifier_keys)
+    for ticket_data in (ticket, rotated):
+        outer = ticket_payload.encode_ticket(ticket_data, keyring)
+        assert ticket_payload.decode_ticket(outer, verifier_keys) == {**ticket_data, 'mac_valid': True}
+        # A verifier without that key ID turns the ticket away
+        assert not ticket_payload.decode_ticket(outer, Keyring({'k3': first}))['mac_valid']
+
+    with pytest.raises(ValueError):
+        keyring.add('much-too-long', second)
+
+
+def test_keyring_file_reloads_without_restart(tmp_path):
+    path = str(tmp_path / 'keyring.json')
+    first, second = secrets.token_bytes(32), secrets.token_bytes(32)
+    _write_keyring(path, {'k1': first}, 'k1', 1_000_000_000_000_000_000)
+    keyring = Keyring.from_file(path, reload_interval=0)
+    assert keyring.context('k2') is None
+
+    _write_keyring(path, {'k1': first, 'k2': second}, 'k2', 2_000_000_000_000_000_000)
+    assert keyring.context('k2').secret_key == second
+    assert keyring.active().kid == 'k2'
+
+    # Workers get the keyring by pickle and keep following the file
+    worker_keyring = pickle.loads(pickle.dumps(keyring))
+    assert worker_keyring.context('k1').sign(b"x") == keyring.context('k1').sign(b"x")
+
+    # A broken edit keeps the keys that were working
+    with open(path, 'w') as f:
+        f.write("{not json")
+    os.utime(path, ns=(3_000_000_000_000_000_000,) * 2)
+    assert keyring.context('k2') is not None
+    assert keyring.last_error is not None
+
+
+def test_verifier_uses_ticket_key_id():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    from ticket_verifier import TicketVerifier
+
+    first, second = secrets.token_bytes(32), secrets.token_bytes(32)
+    generator = TicketGenerator(keyring=Keyring({'k1': first, 'k2': second}, active='k2'))
+    buffer = io.BytesIO()
+    generator.generate_composite_qr("ROT00003", buffer)
+
+    verifier = TicketVerifier(None, verbose=False, keyring=Keyring({'k1': first, 'k2': second}))
+    is_valid, result = verifier.verify_composite_qr(buffer.getvalue(), redeem=False)
+    assert is_valid, result
+
+    retired = TicketVerifier(None, verbose=False, keyring=Keyring({'k1': first}))
+    assert retired.verify_composite_qr(buffer.getvalue()) == (False, "Unknown signing key")
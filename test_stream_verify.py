@@ -0,0 +1,113 @@
+import io
+import secrets
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+import stream_verify
+from stream_verify import StreamVerifier, frame_hash, hash_distance
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+
+
+def _camera_frames(ticket, consumed, empty=5, moving=20):
+    """An empty gate followed by a ticket drifting across the frame, with sensor noise"""
+    rng = np.random.default_rng(0)
+    background = np.full((720, 1280, 3), 200, dtype=np.uint8)
+    for i in range(empty + moving):
+        frame = Image.fromarray(background)
+        if i >= empty:
+            frame.paste(ticket, (300 + (i - empty) * 12, 100 + (i - empty) * 6))
+        noisy = np.asarray(frame).astype(np.int16) + rng.normal(0, 2, background.shape).astype(np.int16)
+        consumed.append(i)
+        yield np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def _ticket(secret_key, ticket_id):
+    buffer = io.BytesIO()
+    TicketGenerator(secret_key).generate_composite_qr(ticket_id, buffer)
+    return Image.open(buffer).convert("RGB").resize((500, 500))
+
+
+def test_noisy_empty_frames_hash_as_duplicates():
+    rng = np.random.default_rng(1)
+    frames = [np.clip(200 + rng.normal(0, 2, (720, 1280)), 0, 255).astype(np.uint8) for _ in range(2)]
+    assert hash_distance(frame_hash(frames[0]), frame_hash(frames[1])) == 0
+
+
+def test_stream_stops_at_first_verdict():
+    secret_key = secrets.token_bytes(32)
+    ticket = _ticket(secret_key, "STR00001")
+    verifier = TicketVerifier(secret_key, verbose=False)
+
+    consumed = []
+    stream = StreamVerifier(verifier)
+    is_valid, result = stream.verify(_camera_frames(ticket, consumed))
+    assert is_valid, result
+    assert result['ticket_id'] == "STR00001"
+    assert len(consumed) < 25
+    assert stream.stats['duplicates'] >= 3
+    assert stream.stats['verdict_ms'] is not None
+
+    # Shown again, the redeemed ticket is turned away
+    is_valid, result = verifier.verify_stream(_camera_frames(ticket, []))
+    assert not is_valid
+    assert result == "Ticket already used"
+
+
+def test_stream_tracks_roi_between_frames():
+    secret_key = secrets.token_bytes(32)
+    ticket = _ticket(secret_key, "STR00002")
+    verifier = TicketVerifier(secret_key, verbose=False)
+    stream = StreamVerifier(verifier, redeem=False, dedup_distance=-1)
+
+    frames = list(_camera_frames(ticket, []))
+    assert stream.feed(frames[5]) is not None
+    # Later frames only decode around where the ticket was
+    stream.inner_data = None
+    assert stream.feed(frames[6]) is not None
+    assert stream.stats['roi_decodes'] == 1
+    assert stream.stats['full_decodes'] == 1
+
+
+def test_stream_without_ticket_gives_up():
+    verifier = TicketVerifier(None, verbose=False)
+    blank = np.full((480, 640, 3), 128, dtype=np.uint8)
+    assert verifier.verify_stream(iter([blank] * 10), max_frames=5) == (False, "No ticket found in stream")
+
+
+def test_verdict_latency_restarts_for_each_ticket(monkeypatch):
+    secret_key = secrets.token_bytes(32)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    now = [0.0]
+    monkeypatch.setattr(stream_verify, "time", types.SimpleNamespace(perf_counter=lambda: now[0]))
+    stream = StreamVerifier(verifier, redeem=False, dedup_distance=-1)
+
+    def frame(ticket=None):
+        scene = Image.new("RGB", (1280, 720), (200, 200, 200))
+        if ticket is not None:
+            scene.paste(ticket, (300, 100))
+        return np.asarray(scene)
+
+    first, second = _ticket(secret_key, "STR00003"), _ticket(secret_key, "STR00004")
+    is_valid, result = stream.feed(frame(first))
+    assert is_valid and result['ticket_id'] == "STR00003"
+    assert stream.stats['verdict_ms'] == 0
+
+    # The next ticket is timed from its own first frame, not from the previous ticket's
+    now[0] = 10.0
+    is_valid, result = stream.feed(frame(second))
+    assert is_valid and result['ticket_id'] == "STR00004"
+    assert stream.stats['verdict_ms'] == 0
+
+    # Out of view and back again also starts over
+    now[0] = 20.0
+    assert stream.feed(frame()) is None
+    now[0] = 25.0
+    is_valid, result = stream.feed(frame(second))
+    assert is_valid
+    assert stream.stats['verdict_ms'] == 0
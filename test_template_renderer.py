@@ -0,0 +1,39 @@
+import random
+import secrets
+import string
+
+import numpy as np
+import qrcode
+
+from qr_template import make_modules
+from ticket_generator import PAYLOAD_FORMATS, TicketGenerator
+
+
+def test_template_modules_match_qrcode():
+    rng = random.Random(1234)
+    for _ in range(100):
+        payload = ''.join(rng.choice(string.printable) for _ in range(rng.randint(1, 150)))
+        version = rng.choice([1, 4])
+        error_correction = rng.choice([0, 1, 2, 3])
+
+        qr = qrcode.QRCode(version=version, error_correction=error_correction)
+        qr.add_data(payload)
+        qr.make(fit=True)
+
+        assert (make_modules(payload, version, error_correction) == np.array(qr.modules)).all()
+
+
+def test_template_composite_is_pixel_identical_to_logoqr():
+    for payload_format in PAYLOAD_FORMATS:
+        generator = TicketGenerator(secrets.token_bytes(32), payload_format=payload_format)
+        for i, (price, draw) in enumerate([(None, None), (100, None), (500, 42)]):
+            ticket_data = generator.generate_ticket_data(f"PIX{i:05d}", ticket_price=price, draw_number=draw)
+            inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+
+            generator.use_template = False
+            expected = np.asarray(generator.render_composite(ticket_data, inner_data))
+            generator.use_template = True
+            actual = np.asarray(generator.render_composite(ticket_data, inner_data))
+
+            assert actual.shape == expected.shape
+            assert (actual == expected).all()
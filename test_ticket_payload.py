@@ -0,0 +1,95 @@
+import io
+import json
+import secrets
+
+import pytest
+
+import ticket_payload
+from ticket_generator import TicketGenerator
+
+
+def test_base45_matches_rfc_examples():
+    assert ticket_payload.b45encode(b"AB") == "BB8"
+    assert ticket_payload.b45encode(b"Hello!!") == "%69 VD92EX0"
+    assert ticket_payload.b45decode("QED8WEX0") == b"ietf!"
+    with pytest.raises(ticket_payload.PayloadError):
+        ticket_payload.b45decode("GGW")
+
+
+def test_compact_ticket_round_trip():
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key, payload_format='compact')
+    ticket_data = generator.generate_ticket_data("CMP00001", ticket_price=500, draw_number=42)
+    inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+    outer, inner = generator.encode_payloads(ticket_data, inner_data)
+
+    # Small enough for a version 4-H symbol in alphanumeric mode
+    assert len(outer) <= 50
+    assert set(outer + inner) <= set(ticket_payload.BASE45_CHARSET)
+    assert ticket_payload.parse_payload(outer, secret_key) == ('main', {**ticket_data, 'mac_valid': True})
+    assert ticket_payload.parse_payload(inner, secret_key) == ('inner', inner_data)
+
+
+def test_compact_ticket_detects_tampering():
+    secret_key = secrets.token_bytes(32)
+    ticket_data = {'id': "CMP00002", 't': 1736827239, 'd': 1737432039}
+    payload = ticket_payload.encode_ticket(ticket_data, secret_key)
+
+    assert not ticket_payload.decode_ticket(payload, secrets.token_bytes(32))['mac_valid']
+    forged = ticket_payload.encode_ticket({**ticket_data, 'd': ticket_data['d'] + 86400}, secrets.token_bytes(32))
+    assert not ticket_payload.decode_ticket(forged, secret_key)['mac_valid']
+    assert ticket_payload.parse_payload(payload[:-3], secret_key) == (None, None)
+    assert ticket_payload.parse_payload("LT2" + payload[3:], secret_key) == (None, None)
+
+
+def test_json_payload_cannot_claim_a_valid_mac():
+    secret_key = secrets.token_bytes(32)
+    ticket_data = TicketGenerator(secret_key).generate_ticket_data("FORGE0001")
+    del ticket_data['h']
+    forged = json.dumps({**ticket_data, 'mac_valid': True})
+    assert ticket_payload.parse_payload(forged, secret_key) == (None, None)
+    assert ticket_payload.authentic_ticket(forged, secret_key) is None
+
+    from payload_verifier import PayloadVerifier
+    verifier = PayloadVerifier(secret_key, verbose=False)
+    assert verifier.verify_ticket(forged) == (False, "Invalid ticket payload")
+    assert verifier.verify_ticket(json.dumps(ticket_data)) == (False, "Missing HMAC")
+    assert not verifier.redemptions.is_used("FORGE0001")
+
+
+def test_verifier_accepts_both_formats():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    from ticket_verifier import TicketVerifier
+
+    secret_key = secrets.token_bytes(32)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    for payload_format in ('json', 'compact'):
+        buffer = io.BytesIO()
+        ticket_id = f"{payload_format[:3].upper()}00003"
+        TicketGenerator(secret_key, payload_format=payload_format).generate_composite_qr(ticket_id, buffer)
+        is_valid, result = verifier.verify_composite_qr(buffer.getvalue())
+        assert is_valid, result
+        assert result['ticket_id'] == ticket_id
+
+    # A compact ticket signed with another key is turned away before redemption
+    buffer = io.BytesIO()
+    TicketGenerator(secrets.token_bytes(32), payload_format='compact').generate_composite_qr("FOR00003", buffer)
+    assert verifier.verify_composite_qr(buffer.getvalue()) == (False, "Invalid HMAC")
+    assert not verifier.redemptions.is_used("FOR00003")
+
+
+def test_small_compact_print_decodes_without_equalization():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+    from PIL import Image
+    from ticket_verifier import TicketVerifier
+
+    secret_key = secrets.token_bytes(32)
+    buffer = io.BytesIO()
+    TicketGenerator(secret_key, payload_format='compact').generate_composite_qr("PRINT0001", buffer)
+    buffer.seek(0)
+    # Shrunk like a 10 mm print seen by a gate camera
+    small = Image.open(buffer).convert('RGB').resize((240, 240), Image.Resampling.LANCZOS)
+    verifier = TicketVerifier(secret_key, verbose=False)
+    is_valid, result = verifier.verify_composite_qr(small, source="gate1")
+    assert is_valid, result
+    assert verifier.preferred_strategies[("gate1", False)] == 'raw'
@@ -0,0 +1,107 @@
+import asyncio
+import io
+import secrets
+import time
+
+import pytest
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+import ticket_verifier
+from ticket_generator import TicketGenerator
+from ticket_verifier import TicketVerifier
+from redemption_store import SQLiteRedemptionStore
+from verification_service import DeadlineExceeded, ServiceOverloaded, VerificationService
+
+
+def _slow_verify_in_worker(image, source=None, preferred=None):
+    time.sleep(1.0)
+    return False, "Could not read main QR code", [], {'preferred': {}, 'strategy_hits': {}, 'preprocess': {}}
+
+
+def _ticket_png(generator, ticket_id):
+    buffer = io.BytesIO()
+    generator.generate_composite_qr(ticket_id, buffer)
+    return buffer.getvalue()
+
+
+def test_service_verifies_and_redeems_once():
+    secret_key = secrets.token_bytes(32)
+    png = _ticket_png(TicketGenerator(secret_key), "SVC00001")
+    service = VerificationService(TicketVerifier(secret_key, verbose=False), workers=2)
+    try:
+        is_valid, result = service.verify(png)
+        assert is_valid, result
+        assert result['ticket_id'] == "SVC00001"
+
+        is_valid, result = asyncio.run(service.verify_async(png))
+        assert not is_valid
+        assert result == "Ticket already used"
+
+        metrics = service.metrics()
+        assert metrics['completed'] == 2
+        assert metrics['in_flight'] == 0
+        assert 'service_time_p50' in metrics
+
+        # Stage timings recorded in the worker processes are merged back
+        stages = service.verifier.instrumentation.snapshot()['stages']
+        assert stages['verify']['count'] == 2
+        assert stages['scan']['count'] == 2
+    finally:
+        service.shutdown()
+
+
+def test_service_merges_worker_decode_state(tmp_path):
+    secret_key = secrets.token_bytes(32)
+    generator = TicketGenerator(secret_key)
+    store = SQLiteRedemptionStore(str(tmp_path / "redemptions.db"))
+    verifier = TicketVerifier(secret_key, verbose=False, redemption_store=store)
+    service = VerificationService(verifier, workers=1)
+    try:
+        is_valid, result = service.verify(_ticket_png(generator, "SVC00002"), source="gate1")
+        assert is_valid, result
+        assert verifier.strategy_hits
+        assert ("gate1", False) in verifier.preferred_strategies
+
+        # Inner ladder statistics travel the same way
+        worker = TicketVerifier(secret_key, verbose=False)
+        worker.decode_inner_qr(worker.load_gray(_ticket_png(generator, "SVC00003")))
+        verifier.merge_decode_state(worker.take_decode_state())
+        assert verifier.preprocess_report()[verifier.preprocess_profile]['images'] == 1
+        assert not worker.preprocess_stats
+
+        # The worker reopened the shared store, so its early replay check sees the redemption
+        is_valid, result, _, _ = service.submit(_ticket_png(generator, "SVC00002")).result()
+        assert result == "Ticket already used"
+    finally:
+        service.shutdown()
+        store.close()
+
+
+def test_service_rejects_when_saturated(monkeypatch):
+    monkeypatch.setattr(ticket_verifier, "_verify_in_worker", _slow_verify_in_worker)
+    service = VerificationService(TicketVerifier(None, verbose=False), workers=1, max_queue=1)
+    try:
+        service.submit(b"first")
+        service.submit(b"second")
+        started = time.perf_counter()
+        with pytest.raises(ServiceOverloaded):
+            service.submit(b"third")
+        assert time.perf_counter() - started < 0.1
+        assert service.metrics()['rejected'] == 1
+        assert service.metrics()['queue_depth'] == 1
+    finally:
+        service.shutdown()
+
+
+def test_service_enforces_deadline(monkeypatch):
+    monkeypatch.setattr(ticket_verifier, "_verify_in_worker", _slow_verify_in_worker)
+    service = VerificationService(TicketVerifier(None, verbose=False), workers=1, deadline=0.1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            service.verify(b"slow")
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(service.verify_async(b"slow"))
+        assert service.metrics()['deadline_exceeded'] == 2
+    finally:
+        service.shutdown()
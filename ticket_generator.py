@@ -2,60 +2,67 @@ import os
 import json
 import time
 import hmac
-try:
-    from Cryptodome.Cipher import AES
-    from Cryptodome.Random import get_random_bytes
-except ImportError:
-    from Crypto.Cipher import AES
-    from Crypto.Random import get_random_bytes
-
-import qrcode
-from PIL import Image
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
 import io
 import hashlib
 import base64
-import numpy as np
-import cv2
-from qrcode.image.pil import PilImage
-from qrcode.constants import ERROR_CORRECT_H
 import secrets
+import qr_template
+import ticket_payload
+from key_context import KeyContext
+from instrumentation import Instrumentation
+from lazy_imports import LazyModule
+
+# Imported on first render, see lazy_imports
+qrcode = LazyModule('qrcode')
+Image = LazyModule('PIL.Image')
+
+
+PAYLOAD_FORMATS = ('json', 'compact')
+
+# Pixels per outer module. Compact symbols have about half the modules, so they are
+# drawn larger to keep the image (and the inner code's share of it) about the same size
+BOX_SIZES = {'json': 15, 'compact': 25}
 
-class LogoQR(PilImage):
-    """Custom QR code image class that creates a blank space in the center"""
-    def __init__(self, border, width, box_size, *args, **kwargs):
-        super().__init__(border, width, box_size, *args, **kwargs)
-        # Calculate center size based on version (1/3 of data area)
-        self.center_size = (width - 8) // 3  # Exclude quiet zone (4 modules on each side)
-        self.center_offset = (width - self.center_size) // 2
-        
-        # Create a white rectangle in the center
-        self._idr.rectangle([
-            self.center_offset * self.box_size + self.border,
-            self.center_offset * self.box_size + self.border,
-            (self.center_offset + self.center_size) * self.box_size + self.border,
-            (self.center_offset + self.center_size) * self.box_size + self.border
-        ], fill="white")
-        
-    def drawrect(self, row, col):
-        """Draw a single box, but skip if in the center area"""
-        # Check if we're in the center area
-        if (self.center_offset <= row < self.center_offset + self.center_size and 
-            self.center_offset <= col < self.center_offset + self.center_size):
-            # Skip drawing in center area
-            return
-        
-        # Draw normal QR code box
-        super().drawrect(row, col)
 
 class TicketGenerator:
-    def __init__(self, secret_key=None):
-        """Initialize the ticket generator with a secret key"""
+    def __init__(self, secret_key=None, use_template=True, instrumentation=None, payload_format='json',
+                 keyring=None, clock=time.time, draw_index=None):
+        """Initialize the ticket generator with a secret key
+
+        With a signing_keys.Keyring, tickets are signed with its active key and
+        carry that key's ID instead. clock returns the current Unix time. With a
+        draw_index.DrawIndex, tickets are only issued for open draws and default to
+        the draw's closing time as their draw date.
+        """
         self.secret_key = secret_key if secret_key else hashlib.sha256().digest()
+        self.keyring = keyring
+        self.keys = keyring if keyring is not None else KeyContext(self.secret_key)
+        if payload_format not in PAYLOAD_FORMATS:
+            raise ValueError(f"Unknown payload format: {payload_format}")
+        # 'compact' packs both codes as signed base45 (see ticket_payload) for smaller
+        # symbols; 'json' stays the default while scanners migrate
+        self.payload_format = payload_format
+        # Template rendering is pixel-identical to the LogoQR path, just faster
+        self.use_template = use_template
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.clock = clock
+        self.draw_index = draw_index
     
     def generate_ticket_data(self, ticket_id, draw_date=None, ticket_price=None, draw_number=None):
         """Generate ticket data with HMAC"""
         # Current timestamp
-        current_time = int(time.mktime(time.strptime("2025-01-14T09:30:39+05:30", "%Y-%m-%dT%H:%M:%S%z")))
+        current_time = int(self.clock())
+        
+        if self.draw_index is not None and draw_number is not None:
+            if not self.draw_index.is_open(draw_number, current_time):
+                raise ValueError(f"Draw {draw_number} is not open")
+            if draw_date is None:
+                draw_date = self.draw_index.closes_at(draw_number)
         
         # Default draw date (7 days from now)
         if draw_date is None:
@@ -74,25 +81,27 @@ class TicketGenerator:
         if draw_number is not None:
             ticket_data['n'] = draw_number
         
-        # Generate HMAC
-        hmac_data = json.dumps(ticket_data, sort_keys=True).encode()
-        ticket_data['h'] = self.generate_hmac(hmac_data)
+        # Key ID, so the verifier knows which key to check the MAC with
+        signer = self.keys.active()
+        if signer.kid is not None:
+            ticket_data['k'] = signer.kid
+        
+        # Generate HMAC (compact payloads carry their own truncated MAC)
+        if self.payload_format == 'json':
+            ticket_data['h'] = ticket_payload.sign_json(ticket_data, self.keys)
         
         return ticket_data
 
     def generate_hmac(self, data):
-        return base64.b64encode(
-            hashlib.sha256(
-                f"{data}:{self.secret_key.hex()}".encode()
-            ).digest()
-        ).decode()
+        """Base64 HMAC-SHA256 of data with the active key"""
+        return self.keys.active().sign_b64(data)
 
     def generate_inner_qr_data(self, ticket_data):
         """Generate inner QR data"""
         # Create inner QR data with last 4 digits and timestamp
         inner_data = {
             'l4': ticket_data['id'][-4:],  # Last 4 digits of ticket ID
-            'ts': int(time.time())  # Add timestamp for additional security
+            'ts': int(self.clock())  # Add timestamp for additional security
         }
         
         return inner_data, None  # No distortion key needed
@@ -103,21 +112,73 @@ class TicketGenerator:
 
     def generate_composite_qr(self, ticket_id, output_path, draw_date=None, ticket_price=None, draw_number=None):
         """Generate composite QR code with inner verification"""
-        # Generate main ticket data
-        ticket_data = self.generate_ticket_data(ticket_id, draw_date, ticket_price, draw_number)
+        stage = self.instrumentation.stage
+        with stage('generate'):
+            # Generate main ticket data
+            with stage('ticket_data'):
+                ticket_data = self.generate_ticket_data(ticket_id, draw_date, ticket_price, draw_number)
+            
+            # Generate inner QR data
+            with stage('inner_data'):
+                inner_data, _ = self.generate_inner_qr_data(ticket_data)
+            
+            with stage('render'):
+                composite = self.render_composite(ticket_data, inner_data)
+            
+            # Save composite QR with high quality (file-like outputs have no extension to infer from)
+            save_format = None if isinstance(output_path, (str, os.PathLike)) else "PNG"
+            with stage('save'):
+                composite.save(output_path, format=save_format, quality=100)
         
-        # Generate inner QR data
-        inner_data, _ = self.generate_inner_qr_data(ticket_data)
+        self.instrumentation.count('tickets_generated')
+        return ticket_data
+
+    def encode_payloads(self, ticket_data, inner_data):
+        """Serialize ticket and inner data to the (outer, inner) QR payload strings"""
+        if self.payload_format == 'compact':
+            return (ticket_payload.encode_ticket(ticket_data, self.keys),
+                    ticket_payload.encode_inner(inner_data))
+        return json.dumps(ticket_data), json.dumps(inner_data)
+
+    def render_composite(self, ticket_data, inner_data):
+        """Render the composite QR image for already generated ticket data"""
+        if self.use_template:
+            return qr_template.render_composite(*self.encode_payloads(ticket_data, inner_data),
+                                                box_size=BOX_SIZES[self.payload_format])
+        return self.render_composite_logoqr(ticket_data, inner_data)
+
+    def render_png(self, outer_payload, inner_payload, size_px=None):
+        """PNG bytes of a ticket drawn from its QR payloads, LANCZOS-downscaled to size_px
+
+        The payload format is taken from the payload, so tickets of either format
+        can be reprinted whatever this generator issues.
+        """
+        payload_format = 'compact' if outer_payload.startswith(ticket_payload.OUTER_PREFIX) else 'json'
+        with self.instrumentation.stage('render'):
+            image = qr_template.render_composite(outer_payload, inner_payload,
+                                                 box_size=BOX_SIZES[payload_format])
+            if size_px is not None:
+                image = image.resize((size_px, size_px), Image.Resampling.LANCZOS)
+        with self.instrumentation.stage('save'):
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG', optimize=False)
+        return buffer.getvalue()
+
+    def render_composite_logoqr(self, ticket_data, inner_data):
+        """Reference renderer drawing every module through LogoQR"""
+        outer_payload, inner_payload = self.encode_payloads(ticket_data, inner_data)
+        
+        from logo_qr import LogoQR
         
         # Create main QR code with higher error correction and center space
         qr = qrcode.QRCode(
             version=4,  # Smaller version for better readability
-            error_correction=ERROR_CORRECT_H,
-            box_size=15,  # Larger box size for better scanning
+            error_correction=qrcode.constants.ERROR_CORRECT_H,
+            box_size=BOX_SIZES[self.payload_format],  # Larger box size for better scanning
             border=4,
             image_factory=LogoQR
         )
-        qr.add_data(json.dumps(ticket_data))
+        qr.add_data(outer_payload)
         qr.make(fit=True)
         
         # Generate main QR with white background
@@ -135,11 +196,11 @@ class TicketGenerator:
         # Create inner QR with smaller version and higher error correction
         inner_qr = qrcode.QRCode(
             version=1,  # Smallest version for inner QR
-            error_correction=ERROR_CORRECT_H,
+            error_correction=qrcode.constants.ERROR_CORRECT_H,
             box_size=8,  # Increased for better readability
             border=2  # Increased border for better recognition
         )
-        inner_qr.add_data(json.dumps(inner_data))
+        inner_qr.add_data(inner_payload)
         inner_qr.make(fit=True)
         
         # Create and resize inner QR
@@ -168,10 +229,201 @@ class TicketGenerator:
         main_qr_copy = main_qr.copy()
         main_qr_copy.paste(bg, (center_pos_px, center_pos_px))
         
-        # Save composite QR with high quality
-        main_qr_copy.save(output_path, quality=100)
+        return main_qr_copy
+
+    def generate_batch(self, ticket_specs, output_dir=None, sink=None, workers=None,
+                       chunk_size=32, max_retries=2, verbose=False):
+        """Render many composite tickets on a process pool, yielding results in input order
+
+        ticket_specs is any iterable of ticket IDs or dicts with ticket_id and the optional
+        draw_date, ticket_price and draw_number. Each ticket is written to
+        output_dir/<ticket_id>.png, or passed to sink(result) as PNG bytes under 'image'.
+        Chunks lost to a crashed worker are re-rendered on a fresh pool; a ticket that keeps
+        crashing workers is yielded with an 'error' instead of being dropped.
+        Throughput is kept in last_batch_stats and the instrumentation; verbose also
+        prints it.
+        """
+        if (output_dir is None) == (sink is None):
+            raise ValueError("Provide exactly one of output_dir or sink")
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        workers = workers or os.cpu_count() or 1
+        max_in_flight = workers * 2  # Bounded read-ahead keeps memory flat for huge runs
+        specs = enumerate(ticket_specs)
+        retry_queue = deque()
+        in_flight = {}
+        ready = {}
+        next_index = 0
+        exhausted = False
+        stats = {'tickets': 0, 'errors': 0, 'worker_restarts': 0}
+        started = time.perf_counter()
         
-        return ticket_data
+        pool = self._new_batch_pool(workers)
+        try:
+            while True:
+                # Keep the pool busy, retries first
+                while len(in_flight) < max_in_flight:
+                    if retry_queue:
+                        chunk = retry_queue.popleft()
+                    elif not exhausted:
+                        chunk = _BatchChunk(list(islice(specs, chunk_size)))
+                        if not chunk.items:
+                            exhausted = True
+                            break
+                    else:
+                        break
+                    future = pool.submit(_render_batch_chunk, chunk.items, output_dir)
+                    in_flight[future] = chunk
+                
+                if not in_flight:
+                    break
+                
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                pool_broken = False
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    try:
+                        for result in future.result():
+                            ready[result['index']] = result
+                    except BrokenProcessPool:
+                        pool_broken = True
+                        self._retry_batch_chunk(chunk, retry_queue, ready, output_dir, max_retries)
+                
+                if pool_broken:
+                    # Every chunk still in flight died with the pool; completed chunks are kept,
+                    # so nothing is rendered or emitted twice
+                    for chunk in in_flight.values():
+                        self._retry_batch_chunk(chunk, retry_queue, ready, output_dir, max_retries)
+                    in_flight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._new_batch_pool(workers)
+                    stats['worker_restarts'] += 1
+                
+                # Stream results back strictly in input order
+                while next_index in ready:
+                    result = ready.pop(next_index)
+                    next_index += 1
+                    stats['tickets'] += 1
+                    if result['error'] is not None:
+                        stats['errors'] += 1
+                    elif sink is not None:
+                        sink(result)
+                    yield result
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            elapsed = time.perf_counter() - started
+            stats['seconds'] = elapsed
+            stats['tickets_per_sec'] = stats['tickets'] / elapsed if elapsed > 0 else 0.0
+            self.last_batch_stats = stats
+            self.instrumentation.observe('batch', elapsed)
+            self.instrumentation.count('batch_tickets', stats['tickets'])
+            self.instrumentation.count('batch_errors', stats['errors'])
+            self.instrumentation.count('batch_worker_restarts', stats['worker_restarts'])
+            if verbose:
+                    print(f"Batch generated {stats['tickets']} tickets in {elapsed:.2f}s "
+                      f"({stats['tickets_per_sec']:.1f} tickets/sec, {stats['errors']} errors, "
+                      f"{stats['worker_restarts']} worker restarts)")
+
+    def _new_batch_pool(self, workers):
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_batch_worker,
+            initargs=(self.secret_key, self.payload_format, self.keyring, self.clock, self.draw_index)
+        )
+
+    def _retry_batch_chunk(self, chunk, retry_queue, ready, output_dir, max_retries):
+        """Requeue a chunk lost to a worker crash, isolating tickets that keep crashing"""
+        chunk.attempts += 1
+        if chunk.attempts <= max_retries:
+            retry_queue.append(chunk)
+            return
+        
+        # Render each ticket alone so an innocent ticket that shared a pool with a
+        # crashing one is not failed along with it
+        for item in chunk.items:
+            with ProcessPoolExecutor(
+                max_workers=1,
+                initializer=_init_batch_worker,
+                initargs=(self.secret_key, self.payload_format, self.keyring, self.clock, self.draw_index)
+            ) as isolated:
+                try:
+                    result = isolated.submit(_render_batch_chunk, [item], output_dir).result()[0]
+                except BrokenProcessPool:
+                    index, spec = item
+                    result = _batch_result(index, spec, error="Worker crashed while rendering ticket")
+            ready[result['index']] = result
+
+
+class _BatchChunk:
+    """A slice of (index, spec) pairs submitted to the pool as one task"""
+    def __init__(self, items):
+        self.items = items
+        self.attempts = 0
+
+
+_batch_generator = None
+
+
+def _init_batch_worker(secret_key, payload_format='json', keyring=None, clock=time.time, draw_index=None):
+    """Build one generator per worker process instead of one per ticket"""
+    global _batch_generator
+    _batch_generator = TicketGenerator(secret_key, payload_format=payload_format, keyring=keyring,
+                                       clock=clock, draw_index=draw_index)
+
+
+def _batch_result(index, spec, ticket_data=None, path=None, image=None, error=None):
+    return {
+        'index': index,
+        'ticket_id': spec['ticket_id'] if isinstance(spec, dict) else spec,
+        'ticket_data': ticket_data,
+        'path': path,
+        'image': image,
+        'error': error
+    }
+
+
+def _safe_file_name(ticket_id):
+    """ticket_id as a file name, refusing anything that would leave output_dir"""
+    ticket_id = str(ticket_id)
+    if (not ticket_id or ticket_id in ('.', '..') or os.path.basename(ticket_id) != ticket_id
+            or (os.altsep and os.altsep in ticket_id) or '\0' in ticket_id):
+        raise ValueError(f"Ticket ID is not usable as a file name: {ticket_id!r}")
+    return ticket_id
+
+
+def _render_batch_chunk(items, output_dir):
+    """Render a chunk of tickets inside a worker process"""
+    results = []
+    for index, spec in items:
+        if not isinstance(spec, dict):
+            spec = {'ticket_id': spec}
+        try:
+            # Checked before signing, so a rejected ID never gets a ticket
+            file_name = _safe_file_name(spec['ticket_id']) if output_dir is not None else None
+            ticket_data = _batch_generator.generate_ticket_data(
+                spec['ticket_id'],
+                spec.get('draw_date'),
+                spec.get('ticket_price'),
+                spec.get('draw_number')
+            )
+            inner_data, _ = _batch_generator.generate_inner_qr_data(ticket_data)
+            composite = _batch_generator.render_composite(ticket_data, inner_data)
+            
+            if output_dir is not None:
+                # Write then rename so a crash never leaves a truncated ticket behind
+                path = os.path.join(output_dir, f"{file_name}.png")
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                composite.save(tmp_path, format="PNG")
+                os.replace(tmp_path, path)
+                results.append(_batch_result(index, spec, ticket_data, path=path))
+            else:
+                buffer = io.BytesIO()
+                composite.save(buffer, format="PNG")
+                results.append(_batch_result(index, spec, ticket_data, image=buffer.getvalue()))
+        except Exception as e:
+            results.append(_batch_result(index, spec, error=str(e)))
+    return results
 
 if __name__ == "__main__":
     # Demo usage
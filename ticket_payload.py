@@ -0,0 +1,254 @@
+"""Compact ticket payloads: versioned binary records carried as base45 text
+
+JSON payloads put the outer code past version 4 at ERROR_CORRECT_H. The compact
+format packs the same fields into a few bytes with integer timestamps and a
+truncated HMAC-SHA256, then base45-encodes them so the whole payload stays in
+QR alphanumeric mode (5.5 bits per character instead of 8).
+
+    outer: "LT1" + base45(flags, id length, id, issued, draw date, [price], [draw number],
+                          [key ID length, key ID], mac)
+    inner: "LI1" + base45(last four, timestamp)
+"""
+import base64
+import binascii
+import json
+import struct
+
+from key_context import DIGEST_SIZE, key_context
+
+BASE45_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+_BASE45_VALUES = {char: value for value, char in enumerate(BASE45_CHARSET)}
+
+OUTER_PREFIX = "LT1"
+INNER_PREFIX = "LI1"
+
+# 64-bit tag: forging one online takes ~2^63 scans, far beyond any gate's throughput
+MAC_BYTES = 8
+# JSON tickets carry the full HMAC-SHA256 tag, base64-encoded in 'h'
+JSON_TAG_BYTES = DIGEST_SIZE
+
+_FLAG_PRICE = 0x01
+_FLAG_DRAW_NUMBER = 0x02
+_FLAG_KEY_ID = 0x04
+
+_TIMESTAMPS = struct.Struct('>II')
+_INNER = struct.Struct('>4sI')
+
+
+class PayloadError(ValueError):
+    """Raised for payloads that are malformed or use an unknown format version"""
+
+
+def b45encode(data):
+    """Base45 (RFC 9285) encode bytes to text"""
+    chars = []
+    for i in range(0, len(data) - 1, 2):
+        value = data[i] * 256 + data[i + 1]
+        value, c = divmod(value, 45)
+        e, d = divmod(value, 45)
+        chars.append(BASE45_CHARSET[c] + BASE45_CHARSET[d] + BASE45_CHARSET[e])
+    if len(data) % 2:
+        d, c = divmod(data[-1], 45)
+        chars.append(BASE45_CHARSET[c] + BASE45_CHARSET[d])
+    return ''.join(chars)
+
+
+def b45decode(text):
+    """Base45 (RFC 9285) decode text to bytes"""
+    try:
+        values = [_BASE45_VALUES[char] for char in text]
+    except KeyError:
+        raise PayloadError("Invalid base45 character")
+    if len(values) % 3 == 1:
+        raise PayloadError("Invalid base45 length")
+    out = bytearray()
+    for i in range(0, len(values), 3):
+        chunk = values[i:i + 3]
+        if len(chunk) == 3:
+            value = chunk[0] + chunk[1] * 45 + chunk[2] * 45 * 45
+            if value > 0xFFFF:
+                raise PayloadError("Invalid base45 triplet")
+            out += value.to_bytes(2, 'big')
+        else:
+            value = chunk[0] + chunk[1] * 45
+            if value > 0xFF:
+                raise PayloadError("Invalid base45 pair")
+            out.append(value)
+    return bytes(out)
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data) or shift > 63:
+            raise PayloadError("Truncated payload")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def json_message(ticket_data):
+    """Canonical bytes a JSON ticket's 'h' tag covers"""
+    return json.dumps({k: v for k, v in ticket_data.items() if k != 'h'}, sort_keys=True).encode()
+
+
+def signing_context(ticket_data, key):
+    """KeyContext for the ticket's key ID ('k', absent for single-key tickets), or None"""
+    return key_context(key).context(ticket_data.get('k'))
+
+
+def sign_json(ticket_data, key):
+    """Base64 HMAC-SHA256 tag for a JSON ticket"""
+    return signing_context(ticket_data, key).sign_b64(json_message(ticket_data))
+
+
+def verify_json(ticket_data, key):
+    """Check a JSON ticket's 'h' tag, accepting tickets printed before HMAC-SHA256
+
+    Those were tagged with sha256 over the repr of the JSON bytes (b'{...}')
+    followed by the hex key.
+    """
+    keys = signing_context(ticket_data, key)
+    if keys is None:
+        return False
+    try:
+        tag = base64.b64decode(ticket_data.get('h') or '', validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        return False
+    message = json_message(ticket_data)
+    return keys.verify(message, tag, JSON_TAG_BYTES) or keys.verify_legacy(message, tag)
+
+
+def encode_ticket(ticket_data, key):
+    """Pack ticket fields (id, t, d and optional p, n, k) into a signed compact payload"""
+    ticket_id = ticket_data['id'].encode('utf-8')
+    if len(ticket_id) > 255:
+        raise PayloadError("Ticket ID too long")
+    flags = 0
+    tail = b''
+    if ticket_data.get('p') is not None:
+        flags |= _FLAG_PRICE
+        tail += _varint(int(ticket_data['p']))
+    if ticket_data.get('n') is not None:
+        flags |= _FLAG_DRAW_NUMBER
+        tail += _varint(int(ticket_data['n']))
+    if ticket_data.get('k') is not None:
+        flags |= _FLAG_KEY_ID
+        kid = ticket_data['k'].encode('ascii')
+        tail += bytes([len(kid)]) + kid
+    message = bytes([flags, len(ticket_id)]) + ticket_id + _TIMESTAMPS.pack(ticket_data['t'], ticket_data['d']) + tail
+    return OUTER_PREFIX + b45encode(message + signing_context(ticket_data, key).sign(message)[:MAC_BYTES])
+
+
+def decode_ticket(text, key):
+    """Unpack a compact outer payload into ticket fields
+
+    The result has the same keys as a JSON ticket, with 'h' replaced by
+    'mac_valid' (False too for an unknown key ID). Raises PayloadError if the
+    payload is malformed.
+    """
+    if not text.startswith(OUTER_PREFIX):
+        raise PayloadError("Not a compact ticket payload")
+    data = b45decode(text[len(OUTER_PREFIX):])
+    if len(data) < 2 + _TIMESTAMPS.size + MAC_BYTES:
+        raise PayloadError("Truncated payload")
+    message, mac = data[:-MAC_BYTES], data[-MAC_BYTES:]
+    flags, id_length = message[0], message[1]
+    offset = 2 + id_length
+    if offset + _TIMESTAMPS.size > len(message):
+        raise PayloadError("Truncated payload")
+    try:
+        ticket_id = message[2:offset].decode('utf-8')
+    except UnicodeDecodeError:
+        raise PayloadError("Invalid ticket ID")
+    issued, draw_date = _TIMESTAMPS.unpack_from(message, offset)
+    offset += _TIMESTAMPS.size
+
+    ticket_data = {'id': ticket_id, 't': issued, 'd': draw_date}
+    if flags & _FLAG_PRICE:
+        ticket_data['p'], offset = _read_varint(message, offset)
+    if flags & _FLAG_DRAW_NUMBER:
+        ticket_data['n'], offset = _read_varint(message, offset)
+    if flags & _FLAG_KEY_ID:
+        end = offset + 1 + (message[offset] if offset < len(message) else 0)
+        try:
+            ticket_data['k'] = message[offset + 1:end].decode('ascii')
+        except UnicodeDecodeError:
+            raise PayloadError("Invalid key ID")
+        offset = end
+    if offset != len(message):
+        raise PayloadError("Unexpected trailing data")
+    keys = signing_context(ticket_data, key)
+    ticket_data['mac_valid'] = keys is not None and keys.verify(message, mac, MAC_BYTES)
+    return ticket_data
+
+
+def encode_inner(inner_data):
+    """Pack inner fields (l4, ts) into a compact payload"""
+    last_four = inner_data['l4'].encode('utf-8')
+    if len(last_four) != 4:
+        raise PayloadError("Inner payload needs exactly four ID characters")
+    return INNER_PREFIX + b45encode(_INNER.pack(last_four, inner_data['ts']))
+
+
+def decode_inner(text):
+    """Unpack a compact inner payload into {'l4', 'ts'}"""
+    if not text.startswith(INNER_PREFIX):
+        raise PayloadError("Not a compact inner payload")
+    data = b45decode(text[len(INNER_PREFIX):])
+    if len(data) != _INNER.size:
+        raise PayloadError("Invalid inner payload length")
+    last_four, timestamp = _INNER.unpack(data)
+    try:
+        return {'l4': last_four.decode('utf-8'), 'ts': timestamp}
+    except UnicodeDecodeError:
+        raise PayloadError("Invalid inner payload")
+
+
+def parse_payload(text, key):
+    """Classify and decode any supported payload
+
+    Returns ('main', data), ('inner', data) or (None, None) for anything else,
+    accepting both JSON and compact payloads. key is the secret or a KeyContext.
+    Only compact tickets carry 'mac_valid', set here from their MAC; a JSON
+    object claiming one is refused rather than trusted.
+    """
+    try:
+        if text.startswith(OUTER_PREFIX):
+            return 'main', decode_ticket(text, key)
+        if text.startswith(INNER_PREFIX):
+            return 'inner', decode_inner(text)
+        data = json.loads(text)
+    except (PayloadError, json.JSONDecodeError):
+        return None, None
+    if isinstance(data, dict) and 'mac_valid' not in data:
+        if 'id' in data:
+            return 'main', data
+        if 'l4' in data:
+            return 'inner', data
+    return None, None
+
+
+def authentic_ticket(text, key):
+    """Ticket fields of a main payload (JSON or compact) whose MAC checks out, else None"""
+    kind, data = parse_payload(text, key)
+    if kind != 'main':
+        return None
+    valid = data['mac_valid'] if text.startswith(OUTER_PREFIX) else verify_json(data, key)
+    return data if valid else None
@@ -1,156 +1,454 @@
+import io
 import os
 import time
+import threading
+import multiprocessing
 import hashlib
 import base64
 import json
+from collections import Counter, OrderedDict, defaultdict
 from datetime import datetime
-import numpy as np
-from PIL import Image
-import cv2
-from pyzbar.pyzbar import decode
 import secrets
-import qrcode
-import qrcode.image
-from Crypto.Cipher import AES
+import ingest
+import qr_decoders
+import qr_template
+import ticket_payload
+from payload_verifier import PayloadVerifier, _failure_reason
+from stream_verify import StreamVerifier
+from instrumentation import Instrumentation
+from lazy_imports import LazyModule
 
-class TicketVerifier:
-    def __init__(self, secret_key):
-        """Initialize the ticket verifier with a secret key"""
-        self.secret_key = secret_key if secret_key else hashlib.sha256().digest()
-        self.used_tickets = set()
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+Image = LazyModule('PIL.Image')
+AES = LazyModule('Crypto.Cipher.AES')
 
-    def scan_qr_image(self, image, is_inner=False):
-        """Scan QR image and return decoded data using multiple methods"""
-        try:
-            print(f"Scanning {'inner' if is_inner else 'main'} QR image...")
-            # Convert PIL Image to numpy array
-            np_image = np.array(image).astype(np.uint8)
-            
-            # Convert to grayscale if needed
-            if len(np_image.shape) == 3:
-                np_image = cv2.cvtColor(np_image, cv2.COLOR_RGB2GRAY)
-            
-            # Enhance contrast
-            enhanced = cv2.equalizeHist(np_image)
-            
-            # Try different methods to decode
-            
-            # 1. Try direct scan
-            decoded_objects = decode(enhanced)
-            if decoded_objects:
-                # Sort by size (main QR will be larger than inner QR)
-                decoded_objects.sort(key=lambda x: x.rect.width * x.rect.height, reverse=True)
-                
-                # For inner QR, take any QR code
-                # For main QR, take the largest one
-                qr_code = decoded_objects[-1] if is_inner else decoded_objects[0]
-                
-                print(f"Decoded QR code using direct scan")
-                data = qr_code.data.decode('utf-8')
-                print(f"Decoded data: {data}")
-                try:
-                    return json.loads(data)
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")
-                    return None
-            
-            # 2. Try Otsu's thresholding
+# Decode strategies tried in order when a frame does not read directly. 'raw' skips
+# equalization, which can merge the modules of small, downsampled prints
+SCAN_STRATEGIES = ('direct', 'raw', 'otsu', 'scale_0.5', 'scale_1.5', 'scale_2.0')
+
+# Inner QR preprocessing attempts per profile, cheapest first; NL-means only as escalation
+PREPROCESS_PROFILES = {
+    'fast': (
+        ('median',),
+        ('median', 'sharpen', 'adaptive'),
+    ),
+    'balanced': (
+        ('median',),
+        ('median', 'sharpen', 'adaptive'),
+        ('gaussian', 'sharpen', 'adaptive'),
+        ('nlmeans', 'sharpen', 'adaptive'),
+    ),
+    'robust': (
+        ('median',),
+        ('median', 'sharpen', 'adaptive'),
+        ('gaussian', 'sharpen', 'adaptive'),
+        ('nlmeans', 'sharpen', 'adaptive'),
+        ('nlmeans', 'sharpen'),
+    ),
+}
+
+# Sources (gate IDs come from clients) whose last working strategy is remembered;
+# the least recently seen are forgotten first
+MAX_STRATEGY_SOURCES = 1024
+
+# Smallest side, in pixels, the located inner QR region is warped to; larger captures
+# keep their own resolution
+INNER_WARP_MIN_SIZE = 200
+
+# NL-means cost assumed before the first measurement, in microseconds per pixel;
+# on the high side, so an unmeasured NL-means pass never blows a tight budget
+NLMEANS_US_PER_PIXEL = 2.0
+
+# Default per-image time budget for each profile, in milliseconds
+PREPROCESS_BUDGETS_MS = {
+    'fast': 15,
+    'balanced': 50,
+    'robust': 200,
+}
+
+class TicketVerifier(PayloadVerifier):
+    def __init__(self, secret_key, preprocess_profile='balanced', preprocess_budget_ms=None,
+                 redemption_store=None, verbose=True, instrumentation=None, keyring=None,
+                 clock=time.time, draw_index=None, ingest_min_side=ingest.REDUCE_MIN_SIDE,
+                 decoder=qr_decoders.DEFAULT_DECODER):
+        """Initialize the ticket verifier with a secret key
+
+        preprocess_profile picks the inner QR preprocessing ladder ("fast", "balanced"
+        or "robust"); preprocess_budget_ms overrides that profile's per-image budget.
+        Encoded uploads at least twice ingest_min_side on their shorter side are
+        decoded at 1/2, 1/4 or 1/8 scale (see ingest.py); None decodes at full size.
+        decoder is a qr_decoders spec such as "opencv" or "race:pyzbar,opencv", or a
+        decoder object; a race takes the first backend result holding a main ticket
+        payload, or an inner one on the inner QR ladder. Process pools (verify_many,
+        VerificationService) rebuild the decoder from its spec, so they need a spec.
+        The other arguments are PayloadVerifier's.
+        """
+        if preprocess_profile not in PREPROCESS_PROFILES:
+            raise ValueError(f"Unknown preprocessing profile: {preprocess_profile}")
+        super().__init__(secret_key, redemption_store, verbose, instrumentation, keyring, clock, draw_index)
+        self.preprocess_profile = preprocess_profile
+        self.preprocess_budget_ms = preprocess_budget_ms
+        self.ingest_min_side = ingest_min_side
+        if isinstance(decoder, str):
+            self.decoder_spec = decoder
+            self.decoder = qr_decoders.make_decoder(decoder, accept=self._has_main_payload)
+            self.inner_decoder = qr_decoders.make_decoder(decoder, accept=self._has_inner_payload)
+        else:
+            self.decoder_spec = None
+            self.decoder = self.inner_decoder = decoder
+        self.preprocess_stats = defaultdict(lambda: {
+            'images': 0, 'decoded': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'budget_exhausted': 0, 'attempt_hits': Counter()
+        })
+        # Running NL-means cost per pixel, seeded conservatively until measured
+        self._nlmeans_us_per_pixel = NLMEANS_US_PER_PIXEL
+        # Fallback strategy that last decoded for each (source, is_inner), e.g. per gate camera
+        self.preferred_strategies = OrderedDict()
+        self.strategy_hits = Counter()
+        # Verifiers are shared by request threads; keep counter updates consistent
+        self._stats_lock = threading.Lock()
+
+    def load_image(self, source):
+        """Open an image from a path, bytes, a file-like object, a PIL image or a NumPy array
+
+        Arrays are used as-is and are expected in RGB (or single-channel) order.
+        """
+        if isinstance(source, (Image.Image, np.ndarray)):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        image = Image.open(source)
+        # Decode now, while a caller-owned stream is guaranteed to still be open
+        image.load()
+        return image
+
+    def load_gray(self, source):
+        """Read-only grayscale array of anything load_image accepts
+
+        Encoded images are decoded straight to one channel, reduced in the decoder
+        when large, so the RGB image is never built. Every stage of a verification
+        reads this one buffer.
+        """
+        return ingest.load_gray(source, self.ingest_min_side)
+
+    def _to_enhanced_gray(self, image):
+        """Convert an image to a contrast-enhanced grayscale array"""
+        return cv2.equalizeHist(ingest.as_gray(image))
+
+    def _prepare_strategy(self, enhanced, strategy, image=None):
+        """Build the image variant a fallback strategy decodes"""
+        if strategy == 'direct':
+            return enhanced
+        if strategy == 'raw':
+            return ingest.as_gray(image)
+        if strategy == 'otsu':
             _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            decoded_objects = decode(binary)
+            return binary
+        scale = float(strategy.split('_', 1)[1])
+        height, width = enhanced.shape
+        return cv2.resize(enhanced, (int(width * scale), int(height * scale)))
+
+    def _strategy_order(self, source_key, strategies=SCAN_STRATEGIES):
+        """Fallback ladder, starting with whatever last worked for this source"""
+        with self._stats_lock:
+            preferred = self.preferred_strategies.get(source_key)
+            if preferred is not None:
+                self.preferred_strategies.move_to_end(source_key)
+        if preferred not in strategies:
+            return strategies
+        return (preferred,) + tuple(s for s in strategies if s != preferred)
+
+    def _remember_strategy(self, source_key, strategy):
+        """Record the strategy that worked for a source; call with _stats_lock held"""
+        self.preferred_strategies[source_key] = strategy
+        self.preferred_strategies.move_to_end(source_key)
+        while len(self.preferred_strategies) > MAX_STRATEGY_SOURCES:
+            self.preferred_strategies.popitem(last=False)
+
+    def _decode_with_fallbacks(self, image, source_key, enhanced=None, strategies=SCAN_STRATEGIES):
+        """Run the fallback ladder, decoding each variant at most once
+
+        enhanced is the image's precomputed _to_enhanced_gray output, if any;
+        strategies limits the ladder, e.g. to one cheap pass per video frame.
+        Returns (strategy, decoded_objects sorted largest first), or (None, []).
+        """
+        if enhanced is None:
+            with self.instrumentation.stage('preprocess'):
+                enhanced = self._to_enhanced_gray(image)
+        decoder = self.inner_decoder if source_key[1] else self.decoder
+        for strategy in self._strategy_order(source_key, strategies):
+            with self.instrumentation.stage('decode'):
+                decoded_objects = decoder.decode(self._prepare_strategy(enhanced, strategy, image))
             if decoded_objects:
-                # Sort by size
+                # Sort by size (main QR will be larger than inner QR)
                 decoded_objects.sort(key=lambda x: x.rect.width * x.rect.height, reverse=True)
-                qr_code = decoded_objects[-1] if is_inner else decoded_objects[0]
-                
-                print(f"Decoded QR code using Otsu's thresholding")
-                data = qr_code.data.decode('utf-8')
-                print(f"Decoded data: {data}")
-                try:
-                    return json.loads(data)
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")
-                    return None
-            
-            # 3. Try multiple scales
-            for scale in [0.5, 1.5, 2.0]:
-                height, width = np_image.shape
-                new_height = int(height * scale)
-                new_width = int(width * scale)
-                resized = cv2.resize(enhanced, (new_width, new_height))
-                decoded_objects = decode(resized)
-                if decoded_objects:
-                    # Sort by size
-                    decoded_objects.sort(key=lambda x: x.rect.width * x.rect.height, reverse=True)
-                    qr_code = decoded_objects[-1] if is_inner else decoded_objects[0]
-                    
-                    print(f"Decoded QR code using scale {scale}")
-                    data = qr_code.data.decode('utf-8')
-                    print(f"Decoded data: {data}")
-                    try:
-                        return json.loads(data)
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error: {e}")
-                        return None
-            
-            print("Failed to decode QR code")
-            return None
+                with self._stats_lock:
+                    self._remember_strategy(source_key, strategy)
+                    self.strategy_hits[strategy] += 1
+                self.instrumentation.count('decode_strategy', strategy=strategy)
+                self._log(f"Decoded QR code using {strategy}")
+                return strategy, decoded_objects
+        self.instrumentation.count('decode_failed')
+        return None, []
+
+    def scan_qr_image(self, image, is_inner=False, source=None):
+        """Scan QR image and return decoded data using multiple methods"""
+        try:
+            self._log(f"Scanning {'inner' if is_inner else 'main'} QR image...")
+            _, decoded_objects = self._decode_with_fallbacks(image, (source, is_inner))
+            if not decoded_objects:
+                self._log("Failed to decode QR code")
+                return None
+            
+            # For inner QR, take any QR code
+            # For main QR, take the largest one
+            qr_code = decoded_objects[-1] if is_inner else decoded_objects[0]
+            data = qr_code.data.decode('utf-8')
+            self._log(f"Decoded data: {data}")
+            _, payload = ticket_payload.parse_payload(data, self.keys)
+            if payload is None:
+                self._log("Unrecognized QR payload")
+            return payload
         except Exception as e:
-            print(f"Error scanning QR: {str(e)}")
+            self._log(f"Error scanning QR: {str(e)}")
             return None
 
-    def extract_inner_qr(self, image):
-        """Extract the inner QR code from the composite image"""
+    def scan_composite(self, image, source=None, enhanced=None):
+        """Decode the main and inner QR codes from a single pass over the image
+
+        The decoder returns every symbol it finds, so when the inner code is readable in
+        the full frame it comes back with the main code and no second scan is needed.
+        Returns (main_data, inner_data); either may be None.
+        """
+        main_data, inner_data, _ = self._scan_composite(image, source, enhanced)
+        return main_data, inner_data
+
+    def _scan_composite(self, image, source=None, enhanced=None, strategies=SCAN_STRATEGIES):
+        """scan_composite, also returning the main symbol's geometry
+
+        The geometry is (corners, payload): the main code's corners in image
+        coordinates and its raw payload, for locate_inner_qr; None if not found.
+        """
         try:
-            print("Extracting inner QR code...")
-            # Convert PIL Image to numpy array
-            np_image = np.array(image).astype(np.uint8)
-            
-            # Convert to grayscale if needed
-            if len(np_image.shape) == 3:
-                np_image = cv2.cvtColor(np_image, cv2.COLOR_RGB2GRAY)
-            
-            # Get image dimensions
-            height, width = np_image.shape
-            
-            # Calculate center position and size (1/3 of total size)
-            center_size = min(width, height) // 3
-            start_x = (width - center_size) // 2
-            start_y = (height - center_size) // 2
-            
-            # Extract inner QR with padding
-            padding = 10
-            inner_qr = np_image[
-                start_y + padding:start_y + center_size - padding,
-                start_x + padding:start_x + center_size - padding
-            ]
-            
-            # Apply multiple preprocessing steps
-            # 1. Enhance contrast
-            enhanced = cv2.equalizeHist(inner_qr)
-            
-            # 2. Denoise
-            denoised = cv2.fastNlMeansDenoising(enhanced)
-            
-            # 3. Sharpen
+            self._log("Scanning composite QR image...")
+            strategy, decoded_objects = self._decode_with_fallbacks(image, (source, False), enhanced, strategies)
+            return self._classify_symbols(decoded_objects, strategy)
+        except Exception as e:
+            self._log(f"Error scanning QR: {str(e)}")
+            return None, None, None
+
+    def _has_payload(self, decoded_objects, kind):
+        """Whether any decoded symbol is a ticket payload of this kind ('main' or 'inner')"""
+        for qr_code in decoded_objects:
+            try:
+                parsed_kind, _ = ticket_payload.parse_payload(qr_code.data.decode('utf-8'), self.keys)
+            except UnicodeDecodeError:
+                continue
+            if parsed_kind == kind:
+                return True
+        return False
+
+    def _has_main_payload(self, decoded_objects):
+        return self._has_payload(decoded_objects, 'main')
+
+    def _has_inner_payload(self, decoded_objects):
+        return self._has_payload(decoded_objects, 'inner')
+
+    def _classify_symbols(self, decoded_objects, strategy=None):
+        """Split decoded symbols into (main_data, inner_data, main geometry)"""
+        main_data = None
+        inner_data = None
+        geometry = None
+        for qr_code in decoded_objects:
+            try:
+                payload = qr_code.data.decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            # Tell the codes apart by payload rather than size, the inner code can
+            # come back alone when the main one is damaged
+            kind, data = ticket_payload.parse_payload(payload, self.keys)
+            if main_data is None and kind == 'main':
+                main_data = data
+                geometry = (self._symbol_corners(qr_code, strategy), payload)
+            elif inner_data is None and kind == 'inner':
+                inner_data = data
+        return main_data, inner_data, geometry
+
+    def _symbol_corners(self, qr_code, strategy):
+        """Four corners of a decoded symbol in original image coordinates, in cyclic order"""
+        points = np.array([(point.x, point.y) for point in qr_code.polygon], dtype=np.float32)
+        if len(points) != 4:
+            # zbar can report extra polygon points; fit the enclosing quadrilateral
+            points = cv2.boxPoints(cv2.minAreaRect(points))
+        if strategy and strategy.startswith('scale_'):
+            points /= float(strategy.split('_', 1)[1])
+        center = points.mean(axis=0)
+        return points[np.argsort(np.arctan2(points[:, 1] - center[1], points[:, 0] - center[0]))]
+
+    def locate_inner_qr(self, image, corners, payload, size=None):
+        """Warp the inner QR's center region to a square grayscale array
+
+        The outer symbol's corners and module count (derived from its payload) give
+        a homography from module coordinates to the photo, so offset, rotated or
+        skewed captures still land the inner code squarely on the canvas. By default
+        the canvas keeps the capture's pixels per module, but is never smaller than
+        INNER_WARP_MIN_SIZE.
+        """
+        modules_count = qr_template.symbol_size(payload)
+        center_offset, center_size = qr_template.center_region(modules_count)
+        if size is None:
+            side = np.linalg.norm(np.roll(corners, -1, axis=0) - corners, axis=1).mean()
+            size = max(INNER_WARP_MIN_SIZE, int(round(side * center_size / modules_count)))
+        
+        # Canvas coordinates of the whole symbol when its center region fills the canvas
+        scale = size / center_size
+        low = -center_offset * scale
+        high = (modules_count - center_offset) * scale
+        target = np.float32([[low, low], [high, low], [high, high], [low, high]])
+        matrix = cv2.getPerspectiveTransform(np.float32(corners), target)
+        
+        return cv2.warpPerspective(ingest.as_gray(image), matrix, (size, size), flags=cv2.INTER_LINEAR, borderValue=255)
+
+    def _crop_inner(self, image):
+        """Crop the center third of the composite, where the inner QR is printed"""
+        np_image = ingest.as_gray(image)
+        
+        # Get image dimensions
+        height, width = np_image.shape
+        
+        # Calculate center position and size (1/3 of total size)
+        center_size = min(width, height) // 3
+        start_x = (width - center_size) // 2
+        start_y = (height - center_size) // 2
+        
+        # Extract inner QR with padding
+        padding = 10
+        return np_image[
+            start_y + padding:start_y + center_size - padding,
+            start_x + padding:start_x + center_size - padding
+        ]
+
+    def _apply_preprocess_step(self, image, step):
+        """Apply a single inner QR preprocessing step"""
+        if step == 'median':
+            return cv2.medianBlur(image, 3)
+        if step == 'gaussian':
+            return cv2.GaussianBlur(image, (3, 3), 0)
+        if step == 'sharpen':
             kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            sharpened = cv2.filter2D(denoised, -1, kernel)
-            
-            # 4. Adaptive threshold
-            binary = cv2.adaptiveThreshold(
-                sharpened,
+            return cv2.filter2D(image, -1, kernel)
+        if step == 'adaptive':
+            return cv2.adaptiveThreshold(
+                image,
                 255,
                 cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
                 cv2.THRESH_BINARY,
                 15,
                 5
             )
-            
-            print("Inner QR code extracted")
-            return Image.fromarray(binary)
+        if step == 'nlmeans':
+            started = time.perf_counter()
+            denoised = cv2.fastNlMeansDenoising(image)
+            # Track the running cost so the budget check can skip NL-means up front
+            cost = (time.perf_counter() - started) * 1e6 / max(image.size, 1)
+            self._nlmeans_us_per_pixel = 0.8 * self._nlmeans_us_per_pixel + 0.2 * cost
+            return denoised
+        raise ValueError(f"Unknown preprocessing step: {step}")
+
+    def extract_inner_qr(self, image):
+        """Extract the inner QR code from the composite image"""
+        try:
+            self._log("Extracting inner QR code...")
+            # Enhance contrast, then the cheap denoise/sharpen/threshold chain
+            processed = cv2.equalizeHist(self._crop_inner(image))
+            for step in ('median', 'sharpen', 'adaptive'):
+                processed = self._apply_preprocess_step(processed, step)
+            
+            self._log("Inner QR code extracted")
+            return Image.fromarray(processed)
         except Exception as e:
-            print(f"Error extracting inner QR: {str(e)}")
+            self._log(f"Error extracting inner QR: {str(e)}")
             return None
 
+    def decode_inner_qr(self, image, profile=None, region=None):
+        """Crop, preprocess and decode the inner QR within the profile's time budget
+
+        Attempts run cheapest first and stop at the first payload that decodes.
+        region is an already located grayscale inner QR (see locate_inner_qr);
+        without one the fixed center crop is used. Returns the inner data dict or None.
+        """
+        profile = profile or self.preprocess_profile
+        attempts = PREPROCESS_PROFILES[profile]
+        budget_ms = self.preprocess_budget_ms or PREPROCESS_BUDGETS_MS[profile]
+        stats = self.preprocess_stats[profile]
+        started = time.perf_counter()
+        inner_data = None
+        try:
+            self._log(f"Decoding inner QR code ({profile} profile)...")
+            # Steps are cached by prefix so later attempts build on earlier ones
+            if region is not None:
+                # A located region is mostly quiet zone; equalizing it would blow sensor
+                # noise up to full contrast, so only stretch its range
+                stages = {(): cv2.normalize(region, None, 0, 255, cv2.NORM_MINMAX)}
+            else:
+                stages = {(): cv2.equalizeHist(self._crop_inner(image))}
+            nlmeans_ms = self._nlmeans_us_per_pixel * stages[()].size / 1000
+            for attempt in attempts:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if elapsed_ms >= budget_ms or ('nlmeans' in attempt and elapsed_ms + nlmeans_ms > budget_ms):
+                    with self._stats_lock:
+                        stats['budget_exhausted'] += 1
+                    self.instrumentation.count('inner_budget_exhausted', profile=profile)
+                    self._log(f"Inner QR budget of {budget_ms}ms exhausted")
+                    break
+                
+                for i in range(len(attempt)):
+                    prefix = attempt[:i + 1]
+                    if prefix not in stages:
+                        stages[prefix] = self._apply_preprocess_step(stages[attempt[:i]], attempt[i])
+                
+                for qr_code in sorted(self.inner_decoder.decode(stages[attempt]),
+                                      key=lambda x: x.rect.width * x.rect.height):
+                    try:
+                        kind, data = ticket_payload.parse_payload(qr_code.data.decode('utf-8'), self.keys)
+                    except UnicodeDecodeError:
+                        continue
+                    if kind == 'inner':
+                        inner_data = data
+                        break
+                if inner_data is not None:
+                    with self._stats_lock:
+                        stats['attempt_hits']['+'.join(attempt)] += 1
+                    self.instrumentation.count('inner_attempt', attempt='+'.join(attempt))
+                    self._log(f"Decoded inner QR code using {'+'.join(attempt)}")
+                    break
+        except Exception as e:
+            self._log(f"Error decoding inner QR: {str(e)}")
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            stats['images'] += 1
+            stats['decoded'] += inner_data is not None
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        return inner_data
+
+    def preprocess_report(self):
+        """Per-profile inner QR decode success rate and latency, for tuning venues"""
+        report = {}
+        for profile, stats in self.preprocess_stats.items():
+            images = stats['images']
+            report[profile] = {
+                'images': images,
+                'success_rate': stats['decoded'] / images if images else 0.0,
+                'mean_ms': stats['total_ms'] / images if images else 0.0,
+                'max_ms': stats['max_ms'],
+                'budget_exhausted': stats['budget_exhausted'],
+                'attempt_hits': dict(stats['attempt_hits'])
+            }
+        return report
+
     def recover_inner_qr(self, inner_qr_image, ticket_data):
         """No recovery needed, return image as is"""
         return inner_qr_image
@@ -159,9 +457,7 @@ class TicketVerifier:
         """Decode and verify the inner QR data"""
         try:
             # Generate distortion key
-            distortion_key = hashlib.sha256(
-                f"{ticket_data['id']}:{ticket_data['ts']}:{self.secret_key.hex()}".encode()
-            ).digest()
+            distortion_key = self.keys.legacy_digest(f"{ticket_data['id']}:{ticket_data['ts']}")
             
             # Decode components
             nonce = base64.b64decode(inner_data['n'])
@@ -176,113 +472,219 @@ class TicketVerifier:
         except Exception as e:
             return None
     
-    def verify_ticket_data(self, ticket_data):
-        """Verify the ticket data and HMAC"""
-        try:
-            # Extract HMAC
-            hmac = ticket_data.pop('h', None)
-            if not hmac:
-                return False, "Missing HMAC"
-            
-            # Verify HMAC
-            expected_hmac = self.generate_hmac(json.dumps(ticket_data, sort_keys=True))
-            if hmac != expected_hmac:
-                return False, "Invalid HMAC"
-            
-            # Verify timestamp (allow verification within 24 hours)
-            timestamp = ticket_data.get('t')
-            if not timestamp:
-                return False, "Missing timestamp"
-            
-            current_time = int(time.mktime(time.strptime("2025-01-14T08:27:36+05:30", "%Y-%m-%dT%H:%M:%S%z")))
-            if abs(current_time - timestamp) > 24*60*60:
-                return False, "Ticket expired or not yet valid"
-            
-            return True, "Valid ticket"
-        except Exception as e:
-            return False, f"Error verifying ticket: {str(e)}"
+    def verify_composite_qr(self, qr_path, source=None, redeem=True, enhanced=None):
+        """Verify a composite QR code
 
-    def verify_inner_qr(self, inner_data, ticket_id):
-        """Verify the inner QR data"""
-        try:
-            # Verify last 4 digits
-            last_four = inner_data.get('l4', '')
-            if not last_four or len(last_four) != 4:
-                return None, "Invalid inner QR data"
-            
-            # Check if last 4 digits match
-            if not ticket_id.endswith(last_four):
-                return None, "Inner QR verification failed"
-            
-            # Verify timestamp is present
-            if 'ts' not in inner_data:
-                return None, "Missing timestamp in inner QR"
-            
-            return last_four, None
-        except Exception as e:
-            return None, f"Error verifying inner QR: {str(e)}"
-
-    def generate_hmac(self, data):
-        """Generate HMAC for verification"""
-        return base64.b64encode(
-            hashlib.sha256(
-                f"{data}:{self.secret_key.hex()}".encode()
-            ).digest()
-        ).decode()
-    
-    def verify_composite_qr(self, qr_path):
-        """Verify a composite QR code"""
+        qr_path may be anything load_image accepts, so uploads can be verified in
+        memory without touching the filesystem; it is read once with load_gray.
+        source identifies the capturing device (e.g. a gate camera) so its frames
+        start with the decode strategy that last worked for it. With redeem=False
+        the ticket is checked but not marked as used. enhanced lets a caller that
+        already preprocessed the frame (see micro_batch) skip the grayscale pass.
+        """
+        with self.instrumentation.stage('verify'):
+            is_valid, result = self._verify_composite(qr_path, source, redeem, enhanced)
+        self.instrumentation.count('verifications', result='valid' if is_valid else _failure_reason(result))
+        return is_valid, result
+
+    def _verify_composite(self, qr_path, source, redeem, enhanced):
+        stage = self.instrumentation.stage
         try:
             # Read QR code image
-            image = Image.open(qr_path)
+            with stage('load'):
+                image = self.load_gray(qr_path)
             
-            # Scan main QR code
-            main_data = self.scan_qr_image(image, is_inner=False)
+            # Scan main QR code, picking up the inner one from the same pass when possible
+            with stage('scan'):
+                main_data, inner_data, geometry = self._scan_composite(image, source, enhanced)
             if not main_data:
                 return False, "Could not read main QR code"
             
-            # Extract inner QR
-            inner_qr = self.extract_inner_qr(image)
-            if inner_qr is None:
-                return False, "Could not extract inner QR code"
-            
-            # Try to read the QR code directly
-            inner_data = self.scan_qr_image(inner_qr, is_inner=True)
-            if not inner_data:
-                return False, "Could not read inner QR code"
-            
-            # Verify inner data
-            last_four, error = self.verify_inner_qr(inner_data, main_data['id'])
-            if error:
-                return False, error
-            
-            # Current timestamp
-            current_time = int(time.mktime(time.strptime("2025-01-14T09:30:39+05:30", "%Y-%m-%dT%H:%M:%S%z")))
-            
-            # Validation checks
-            if main_data.get('t', 0) > current_time:
-                return False, "Invalid ticket date"
-            
-            if main_data.get('d', 0) < current_time:
-                return False, "Ticket expired (draw date passed)"
-            
-            if main_data['id'] in self.used_tickets:
+            # Reject replays before the costly inner decode; cheap when a filter fronts the store
+            with stage('redemption_check'):
+                already_used = self.redemptions.might_be_used(main_data['id'])
+            if already_used:
                 return False, "Ticket already used"
             
-            # Mark ticket as used
-            self.used_tickets.add(main_data['id'])
+            if inner_data is None:
+                # Locate the inner QR from the outer code's corners and escalate
+                # preprocessing within the time budget
+                inner_data = self._decode_located_inner(image, geometry)
+                if not inner_data:
+                    return False, "Could not read inner QR code"
             
-            return True, {
-                "status": "Valid",
-                "ticket_id": main_data['id'],
-                "draw_date": datetime.fromtimestamp(main_data['d']).strftime('%Y-%m-%d %H:%M:%S'),
-                "draw_number": main_data.get('n', 0),
-                "ticket_price": main_data.get('p', 0)
-            }
+            return self._check_decoded(main_data, inner_data, redeem)
             
         except Exception as e:
             return False, f"Error verifying QR code: {str(e)}"
 
+    def verify_stream(self, frames, source=None, redeem=True, max_frames=None, timeout=None):
+        """Verify a ticket from an iterator of camera frames, stopping at the first verdict
+
+        frames may be RGB arrays (see stream_verify.capture_frames for OpenCV
+        VideoCapture) or encoded image buffers. Returns (is_valid, result) like
+        verify_composite_qr.
+        """
+        return StreamVerifier(self, source=source, redeem=redeem).verify(frames, max_frames, timeout)
+
+    def _decode_located_inner(self, image, geometry):
+        """Decode the inner QR from the homography-warped region, else the fixed crop"""
+        stage = self.instrumentation.stage
+        if geometry is not None:
+            try:
+                with stage('inner_locate'):
+                    region = self.locate_inner_qr(image, *geometry)
+            except Exception as e:
+                self._log(f"Error locating inner QR: {str(e)}")
+            else:
+                with stage('inner_decode'):
+                    inner_data = self.decode_inner_qr(image, region=region)
+                if inner_data is not None:
+                    self.instrumentation.count('inner_locator', method='homography')
+                    return inner_data
+        with stage('inner_decode'):
+            inner_data = self.decode_inner_qr(image)
+        if inner_data is not None:
+            self.instrumentation.count('inner_locator', method='center_crop')
+        return inner_data
+
+    def pool_initargs(self):
+        """Arguments for _init_pool_worker that rebuild this verifier in a worker process
+
+        Stores shared between processes (SQLite, log) are reopened in the worker so
+        its early replay check sees real redemptions; an in-memory store is not, and
+        the parent's settle_redemption stays the only check against it. Raises
+        ValueError for a verifier built with a decoder object, which workers
+        could not rebuild.
+        """
+        if self.decoder_spec is None:
+            raise ValueError("Process pools rebuild the QR decoder from its spec; pass decoder as a spec string")
+        return (self.secret_key, self.preprocess_profile, self.preprocess_budget_ms,
+                self.instrumentation.enabled, self.keyring, self.clock, self.ingest_min_side,
+                self.decoder_spec, self.redemptions if self.redemptions.shared else None)
+
+    def preferred_for(self, source):
+        """The remembered strategies for one source, to seed a pool worker with"""
+        with self._stats_lock:
+            return {key: strategy for key, strategy in self.preferred_strategies.items() if key[0] == source}
+
+    def take_decode_state(self, source=None):
+        """Decode statistics gathered since the last call, plus the source's strategies
+
+        Pool workers return this with every result and reset their counters, so
+        the parent's merge_decode_state keeps /metrics and per-gate strategy
+        memory whole however many processes did the decoding.
+        """
+        with self._stats_lock:
+            state = {
+                'preferred': {key: strategy for key, strategy in self.preferred_strategies.items()
+                              if key[0] == source},
+                'strategy_hits': dict(self.strategy_hits),
+                'preprocess': {profile: dict(stats, attempt_hits=dict(stats['attempt_hits']))
+                               for profile, stats in self.preprocess_stats.items()}
+            }
+            self.strategy_hits.clear()
+            self.preprocess_stats.clear()
+        return state
+
+    def merge_decode_state(self, state):
+        """Fold a worker's take_decode_state into this verifier"""
+        with self._stats_lock:
+            for key, strategy in state['preferred'].items():
+                self._remember_strategy(key, strategy)
+            self.strategy_hits.update(state['strategy_hits'])
+            for profile, delta in state['preprocess'].items():
+                stats = self.preprocess_stats[profile]
+                for name in ('images', 'decoded', 'total_ms', 'budget_exhausted'):
+                    stats[name] += delta[name]
+                stats['max_ms'] = max(stats['max_ms'], delta['max_ms'])
+                stats['attempt_hits'].update(delta['attempt_hits'])
+
+    def verify_many(self, paths, workers=None, redeem=False, chunksize=8):
+        """Verify many ticket images in parallel, yielding results in input order
+
+        Files are read and decoded on a process pool. Redemption never happens in the
+        workers: with redeem=True valid tickets are marked used here, one at a time,
+        so each ticket is redeemed exactly once; with the default redeem=False tickets
+        are only checked against the store, which suits audits.
+        Yields dicts with path, is_valid and result.
+        """
+        with multiprocessing.Pool(
+            processes=workers or os.cpu_count() or 1,
+            initializer=_init_pool_worker,
+            initargs=self.pool_initargs()
+        ) as pool:
+            for path, is_valid, result, events, state in pool.imap(_verify_bulk_path, paths, chunksize):
+                self.instrumentation.merge(events)
+                self.merge_decode_state(state)
+                is_valid, result = self.settle_redemption(is_valid, result, redeem)
+                yield {'path': path, 'is_valid': is_valid, 'result': result}
+
+
+
+_pool_verifier = None
+
+
+def _init_pool_worker(secret_key, preprocess_profile, preprocess_budget_ms, instrumented=True, keyring=None,
+                      clock=time.time, ingest_min_side=ingest.REDUCE_MIN_SIDE,
+                      decoder=qr_decoders.DEFAULT_DECODER, redemption_store=None):
+    """Build one quiet verifier per worker process"""
+    global _pool_verifier
+    _pool_verifier = TicketVerifier(
+        secret_key,
+        preprocess_profile=preprocess_profile,
+        preprocess_budget_ms=preprocess_budget_ms,
+        verbose=False,
+        instrumentation=Instrumentation(enabled=instrumented),
+        keyring=keyring,
+        clock=clock,
+        ingest_min_side=ingest_min_side,
+        decoder=decoder,
+        redemption_store=redemption_store
+    )
+
+
+def _verify_bulk_path(path):
+    with _pool_verifier.instrumentation.capture() as trace:
+        is_valid, result = _pool_verifier.verify_composite_qr(path, redeem=False)
+    return path, is_valid, result, trace.events, _pool_verifier.take_decode_state()
+
+
+def _verify_in_worker(image, source=None, preferred=None):
+    """Decode and check one image in a pool worker, leaving redemption to the caller
+
+    preferred is the parent's preferred_for(source). Returns (is_valid, result,
+    events, state); events are the worker's instrumentation for this image and
+    state its take_decode_state, both to be merged into the parent's.
+    """
+    if preferred:
+        _pool_verifier.merge_decode_state({'preferred': preferred, 'strategy_hits': {}, 'preprocess': {}})
+    with _pool_verifier.instrumentation.capture() as trace:
+        is_valid, result = _pool_verifier.verify_composite_qr(image, source=source, redeem=False)
+    return is_valid, result, trace.events, _pool_verifier.take_decode_state(source)
+
+
+def warm_up():
+    """Generate and verify one ticket per payload format under a throwaway key
+
+    Leaves this process with the imaging stack imported and zbar, OpenCV and
+    qr_template's templates initialised, without touching any real verifier's
+    counters or redemptions. Returns whether every ticket verified.
+    """
+    from ticket_generator import PAYLOAD_FORMATS, TicketGenerator
+    secret_key = secrets.token_bytes(32)
+    verifier = TicketVerifier(secret_key, verbose=False, instrumentation=Instrumentation(enabled=False))
+    verified = True
+    for payload_format in PAYLOAD_FORMATS:
+        generator = TicketGenerator(secret_key, instrumentation=Instrumentation(enabled=False),
+                                    payload_format=payload_format)
+        ticket_data = generator.generate_ticket_data("WARMUP0001")
+        inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+        is_valid, _ = verifier.verify_composite_qr(generator.render_composite(ticket_data, inner_data),
+                                                   redeem=False)
+        verified = verified and is_valid
+    return verified
+
 if __name__ == "__main__":
     # Demo usage
     from ticket_generator import TicketGenerator
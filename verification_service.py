@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import ticket_verifier
+
+
+# Smallest default queue, so a burst of concurrent scans on a one- or two-core box
+# is queued rather than turned away
+MIN_QUEUE = 16
+
+
+class ServiceOverloaded(Exception):
+    """Raised when the verification queue is full; callers should answer 429 at once"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a verification does not finish within its deadline; answer 503"""
+
+
+class VerificationService:
+    """Runs image verification on a process pool behind a bounded queue
+
+    Decoding happens in worker processes, so neither the asyncio event loop nor
+    request threads spend CPU on OpenCV/pyzbar. At most workers + max_queue
+    verifications are admitted at once; beyond that submissions fail fast with
+    ServiceOverloaded instead of queueing without bound. Redemption is applied
+    here, against the wrapped verifier's store, and only for results that came
+    back within their deadline.
+    """
+
+    def __init__(self, verifier, workers=None, max_queue=None, deadline=5.0, sample_size=1024):
+        self.verifier = verifier
+        # Checked here so a verifier the workers cannot rebuild fails at startup
+        self._initargs = verifier.pool_initargs()
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max(self.workers * 4, MIN_QUEUE) if max_queue is None else max_queue
+        self.deadline = deadline
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._service_times = deque(maxlen=sample_size)
+        self._counters = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'deadline_exceeded': 0,
+            'failed': 0
+        }
+
+    def _get_pool(self):
+        # Created on first use so the pool belongs to the process serving requests
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=ticket_verifier._init_pool_worker,
+                initargs=self._initargs
+            )
+        return self._pool
+
+    def submit(self, image, source=None):
+        """Queue an image (bytes, path or array) for decoding, or raise ServiceOverloaded
+
+        The future resolves to (is_valid, result, events, state) computed with
+        redeem=False; state is merged into the verifier when it arrives.
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._counters['rejected'] += 1
+                raise ServiceOverloaded("Verification queue is full")
+            self._pending += 1
+            self._counters['submitted'] += 1
+            pool = self._get_pool()
+
+        started = time.perf_counter()
+        try:
+            future = pool.submit(ticket_verifier._verify_in_worker, image, source,
+                                 self.verifier.preferred_for(source))
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda f: self._on_done(f, started))
+        return future
+
+    def _on_done(self, future, started):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._counters['failed'] += 1
+            else:
+                self._counters['completed'] += 1
+                self._service_times.append(time.perf_counter() - started)
+        if not future.cancelled() and future.exception() is None:
+            # Stage timings, counters and decode statistics recorded in the worker process
+            _, _, events, state = future.result()
+            self.verifier.instrumentation.merge(events)
+            self.verifier.merge_decode_state(state)
+            self.verifier.instrumentation.observe('service', time.perf_counter() - started)
+
+    def verify(self, image, source=None, deadline=None, redeem=True):
+        """Blocking verification for threaded servers such as Flask/gunicorn"""
+        future = self.submit(image, source)
+        try:
+            is_valid, result, _, _ = future.result(timeout=deadline or self.deadline)
+        except FutureTimeoutError:
+            self._deadline_exceeded(future)
+        return self.verifier.settle_redemption(is_valid, result, redeem)
+
+    async def verify_async(self, image, source=None, deadline=None, redeem=True):
+        """Await a verification without blocking the event loop"""
+        future = self.submit(image, source)
+        try:
+            is_valid, result, _, _ = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                timeout=deadline or self.deadline
+            )
+        except asyncio.TimeoutError:
+            self._deadline_exceeded(future)
+        return self.verifier.settle_redemption(is_valid, result, redeem)
+
+    def _deadline_exceeded(self, future):
+        # Drop it if still queued; a decode already running finishes but is never redeemed
+        future.cancel()
+        with self._lock:
+            self._counters['deadline_exceeded'] += 1
+        raise DeadlineExceeded("Verification did not finish within its deadline")
+
+    def metrics(self):
+        """Queue depth, counters and recent service-time percentiles (seconds)"""
+        with self._lock:
+            pending = self._pending
+            counters = dict(self._counters)
+            samples = sorted(self._service_times)
+        metrics = {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'in_flight': pending,
+            'queue_depth': max(0, pending - self.workers),
+            **counters
+        }
+        if samples:
+            metrics.update({
+                'service_time_p50': samples[len(samples) // 2],
+                'service_time_p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+                'service_time_max': samples[-1]
+            })
+        return metrics
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
@@ -1,11 +1,11 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context, url_for
 from flask_cors import CORS
 import os
 import sys
 import json
+import re
 import base64
 from io import BytesIO
-from PIL import Image
 import time
 from datetime import datetime, timedelta
 
@@ -16,16 +16,117 @@ PARENT_DIR = os.path.dirname(BASE_DIR)
 if PARENT_DIR not in sys.path:
     sys.path.append(PARENT_DIR)
 
+import ticket_payload
 from ticket_generator import TicketGenerator
 from ticket_verifier import TicketVerifier
+from redemption_store import FilteredRedemptionStore, open_redemption_store
+from verification_service import DeadlineExceeded, ServiceOverloaded, VerificationService
+from micro_batch import MicroBatchScheduler
+from instrumentation import Instrumentation, SamplingProfiler
+from signing_keys import Keyring
+from draw_index import DrawIndex
+from imposition import CONTENT_TYPES, SHEET_FORMATS, SheetImposer, SheetLayout
+from lazy_imports import preload
+from caches import ImageCache, ScanResultCache, content_key
+import qr_decoders
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 CORS(app)
 
 # Initialize generator and verifier with a fixed secret key
 SECRET_KEY = b'your-secret-key-here'  # Change this in production
-generator = TicketGenerator(SECRET_KEY)
-verifier = TicketVerifier(SECRET_KEY)
+# Stage timers and counters shared by generation and verification; INSTRUMENTATION=0 turns them off
+instrumentation = Instrumentation(enabled=os.environ.get('INSTRUMENTATION', '1') != '0')
+# Started and stopped at runtime through /debug/profiler when PROFILER_ENDPOINTS=1
+profiler = SamplingProfiler()
+# Rotating keys: KEYRING_PATH names a keyring file that workers reload when it changes;
+# SECRET_KEY still verifies tickets printed without a key ID
+KEYRING_PATH = os.environ.get('KEYRING_PATH')
+keyring = Keyring.from_file(KEYRING_PATH, legacy_key=SECRET_KEY) if KEYRING_PATH else None
+# Optional draw windows (see draw_index.DrawIndex.save); tickets for a listed draw are
+# valid until it closes. Workers reload the file when it changes, so closing a draw
+# is DrawIndex.load, close_draw (or archive_closed) and save on the same path
+DRAW_INDEX_PATH = os.environ.get('DRAW_INDEX_PATH')
+draw_index = DrawIndex.from_file(DRAW_INDEX_PATH) if DRAW_INDEX_PATH else None
+generator = TicketGenerator(SECRET_KEY, instrumentation=instrumentation,
+                            payload_format=os.environ.get('TICKET_PAYLOAD_FORMAT', 'json'),
+                            keyring=keyring, draw_index=draw_index)
+# Rendered ticket PNGs by content, for reprints; IMAGE_CACHE_DIR adds a tier shared by workers
+image_cache = ImageCache(
+    max_bytes=int(os.environ.get('IMAGE_CACHE_BYTES', 64 * 1024 * 1024)),
+    directory=os.environ.get('IMAGE_CACHE_DIR')
+)
+CONTENT_KEY = re.compile(r'[0-9a-f]{64}')
+# Verdicts of recent uploads by client request ID, for handhelds that retry on flaky Wi-Fi.
+# Kept in a database every gunicorn worker shares, since a retry may reach another worker;
+# SCAN_CACHE_PATH="" keeps them per process
+scan_cache = ScanResultCache(
+    ttl=float(os.environ.get('SCAN_CACHE_TTL_S', 120)),
+    max_items=int(os.environ.get('SCAN_CACHE_ITEMS', 10000)),
+    path=os.environ.get('SCAN_CACHE_PATH', os.path.join(BASE_DIR, 'scan_cache.db')) or None
+)
+# Redemptions are shared by every gunicorn worker through the store on disk
+REDEMPTION_STORE = os.environ.get('REDEMPTION_STORE', f"sqlite://{os.path.join(BASE_DIR, 'redemptions.db')}")
+
+redemption_store = open_redemption_store(REDEMPTION_STORE)
+
+# Optional Bloom filter snapshot in front of the store, memory-mapped and shared by workers
+REDEMPTION_FILTER = os.environ.get('REDEMPTION_FILTER')
+if REDEMPTION_FILTER:
+    redemption_store = FilteredRedemptionStore.from_snapshot(
+        redemption_store,
+        REDEMPTION_FILTER,
+        capacity=int(os.environ.get('REDEMPTION_FILTER_CAPACITY', 10_000_000))
+    )
+
+# QR decoder backend (see qr_decoders.py), e.g. "opencv" or "race:pyzbar,zxing"; "auto"
+# uses the choice of benchmarks/calibrate_decoders.py
+QR_DECODER = os.environ.get('QR_DECODER', qr_decoders.DEFAULT_DECODER)
+if QR_DECODER == 'auto':
+    QR_DECODER = qr_decoders.load_calibration(
+        os.environ.get('QR_DECODER_CALIBRATION', qr_decoders.DEFAULT_CALIBRATION))
+
+# Inner QR preprocessing profile ("fast", "balanced" or "robust"), tuned per venue
+verifier = TicketVerifier(
+    SECRET_KEY,
+    preprocess_profile=os.environ.get('INNER_QR_PROFILE', 'balanced'),
+    redemption_store=redemption_store,
+    instrumentation=instrumentation,
+    keyring=keyring,
+    draw_index=draw_index,
+    # Uploads at least twice this on their shorter side are decoded at reduced size; 0 disables
+    ingest_min_side=int(os.environ.get('INGEST_MIN_SIDE', 1500)) or None,
+    decoder=QR_DECODER
+)
+
+VERIFY_MAX_QUEUE = int(os.environ['VERIFY_MAX_QUEUE']) if 'VERIFY_MAX_QUEUE' in os.environ else None
+VERIFY_DEADLINE_S = float(os.environ.get('VERIFY_DEADLINE_S', 5.0))
+# Opt-in micro-batching for entry peaks: scans arriving within the window share one
+# preprocessing pass and are decoded together; a longer window favours throughput over p50
+VERIFY_BATCH_WINDOW_MS = os.environ.get('VERIFY_BATCH_WINDOW_MS')
+
+if VERIFY_BATCH_WINDOW_MS:
+    verification_service = MicroBatchScheduler(
+        verifier,
+        window_ms=float(VERIFY_BATCH_WINDOW_MS),
+        max_batch=int(os.environ.get('VERIFY_MAX_BATCH', 32)),
+        decode_threads=int(os.environ.get('VERIFY_WORKERS', 0)) or None,
+        max_pending=VERIFY_MAX_QUEUE,
+        deadline=VERIFY_DEADLINE_S
+    )
+else:
+    # Decoding runs on a bounded process pool; a full queue or a missed deadline fails fast
+    verification_service = VerificationService(
+        verifier,
+        workers=int(os.environ.get('VERIFY_WORKERS', 0)) or None,
+        max_queue=VERIFY_MAX_QUEUE,
+        deadline=VERIFY_DEADLINE_S
+    )
+
+# PRELOAD=1 imports and warms the imaging stack here, once. With gunicorn --preload the
+# workers fork from this process and share it copy-on-write instead of each paying for it
+if os.environ.get('PRELOAD') == '1':
+    print(f"Preloaded imaging stack: {preload(verifier, redemption_store)}")
 
 @app.route('/')
 def index():
@@ -35,6 +136,24 @@ def index():
 def serve_static(path):
     return send_from_directory(app.static_folder, path)
 
+# /generate serves 10x10mm at 300dpi: 0.3937 inches * 300 = 118 pixels
+PRINT_SIZE_PX = int(0.3937 * 300)
+
+def ticket_png(outer_payload, inner_payload):
+    """(content key, PNG bytes) of a ticket at print size, rendered at most once per cache"""
+    key = content_key('ticket-png', PRINT_SIZE_PX, outer_payload, inner_payload)
+    return key, image_cache.get_or_render(
+        key, lambda: generator.render_png(outer_payload, inner_payload, PRINT_SIZE_PX))
+
+def png_response(key, png):
+    # Keys are content hashes, so an image never changes under its URL. Tickets are
+    # bearer instruments though: browsers and terminals may keep them, shared caches not
+    response = Response(png, mimetype='image/png')
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['Content-Location'] = url_for('cached_ticket_image', key=key)
+    return response
+
 @app.route('/generate', methods=['POST'])
 def generate_ticket():
     try:
@@ -48,49 +167,162 @@ def generate_ticket():
         ticket_price = data.get('ticket_price')
         draw_number = data.get('draw_number')
 
-        # Create a BytesIO object to store the QR code
-        qr_buffer = BytesIO()
-        
-        # Generate the QR code
-        ticket_data = generator.generate_composite_qr(
-            ticket_id,
-            qr_buffer,
-            draw_date,
-            ticket_price,
-            draw_number
-        )
-        
-        # Get the QR code as base64
-        qr_buffer.seek(0)
-        qr_image = Image.open(qr_buffer)
-        
-        # Resize for 10x10mm at 300dpi
-        # 300 dpi = 300 pixels per inch
-        # 10mm = 0.3937 inches
-        # Therefore, size = 0.3937 * 300 = 118 pixels
-        target_size = int(0.3937 * 300)
-        qr_image = qr_image.resize((target_size, target_size), Image.Resampling.LANCZOS)
-        
-        # Save as PNG with maximum quality
-        output_buffer = BytesIO()
-        qr_image.save(output_buffer, format='PNG', optimize=False, quality=100)
-        qr_base64 = base64.b64encode(output_buffer.getvalue()).decode()
+        with generator.instrumentation.stage('generate'):
+            ticket_data = generator.generate_ticket_data(ticket_id, draw_date, ticket_price, draw_number)
+            inner_data, _ = generator.generate_inner_qr_data(ticket_data)
+            outer_payload, inner_payload = generator.encode_payloads(ticket_data, inner_data)
+            # Rendered straight to print size and kept for reprints (see /ticket-image)
+            key, png = ticket_png(outer_payload, inner_payload)
+        generator.instrumentation.count('tickets_generated')
+
+        # ?format=png returns the image itself instead of base64 inside JSON
+        if request.args.get('format') == 'png':
+            response = png_response(key, png)
+            response.headers['X-Ticket-Data'] = json.dumps(ticket_data)
+            return response
 
         return jsonify({
             'success': True,
-            'qr_code': qr_base64,
+            'qr_code': base64.b64encode(png).decode(),
             'ticket_data': ticket_data,
+            # What a reprint POSTs to /ticket-image
+            'payload': outer_payload,
+            'inner_payload': inner_payload,
+            'image_url': url_for('cached_ticket_image', key=key),
+            'etag': key,
             'size_info': {
                 'width_mm': 10,
                 'height_mm': 10,
                 'dpi': 300,
-                'pixels': target_size
+                'pixels': PRINT_SIZE_PX
             }
         })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/ticket-image', methods=['POST'])
+def ticket_image():
+    # Reprints: {"payload": ..., "inner_payload": ...} of an issued ticket gives its PNG,
+    # rendered once and then served from the cache
+    try:
+        data = request.get_json(silent=True) or {}
+        outer_payload, inner_payload = data.get('payload'), data.get('inner_payload')
+        if not isinstance(outer_payload, str) or not isinstance(inner_payload, str):
+            return jsonify({'error': 'payload and inner_payload are required'}), 400
+        ticket_data = ticket_payload.authentic_ticket(outer_payload, generator.keys)
+        if ticket_data is None:
+            return jsonify({'error': 'Invalid ticket payload'}), 403
+        # The inner code is unsigned; it must at least be the one this ticket was issued with
+        kind, inner_data = ticket_payload.parse_payload(inner_payload, generator.keys)
+        if kind != 'inner':
+            return jsonify({'error': 'Invalid inner QR data'}), 400
+        _, error = verifier.verify_inner_qr(inner_data, ticket_data['id'])
+        if error:
+            return jsonify({'error': error}), 400
+        return png_response(*ticket_png(outer_payload, inner_payload))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ticket-image/<key>')
+def cached_ticket_image(key):
+    # Terminals refresh with If-None-Match; a matching key is answered without a lookup
+    if not CONTENT_KEY.fullmatch(key):
+        return jsonify({'error': 'Unknown image'}), 404
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
+    png = image_cache.get(key)
+    if png is None:
+        return jsonify({'error': 'Image not cached; POST the payloads to /ticket-image'}), 404
+    return png_response(key, png)
+
+# Bounds for /generate-sheet, so one request cannot tie a worker up for hours or allocate
+# gigapixel pages; A4 at 600 dpi is a 35 MB page buffer
+SHEET_MAX_TICKETS = int(os.environ.get('SHEET_MAX_TICKETS', 100000))
+SHEET_LIMITS = {
+    'ticket_mm': (5.0, 50.0),
+    'gap_mm': (0.0, 20.0),
+    'margin_mm': (0.0, 20.0),
+    'dpi': (72, 600),
+    'roll_width_mm': (20.0, 300.0),
+    'rows': (1, 20),
+    'digits': (1, 20),
+}
+
+def sheet_option(data, name, default, cast=float):
+    """A /generate-sheet number, converted and checked against SHEET_LIMITS"""
+    value = cast(data.get(name, default))
+    low, high = SHEET_LIMITS[name]
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+@app.route('/generate-sheet', methods=['POST'])
+def generate_sheet():
+    # Print runs: tickets laid out on A4 or label-roll pages at the printer's DPI, streamed
+    # as multi-page PDF or TIFF. Tickets are {"ticket_ids": [...]} or a numbered range
+    # {"prefix": "LT", "start": 1, "count": 5000}; price, draw number and date apply to all.
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'JSON body required'}), 400
+        sheet_format = data.get('format', 'pdf')
+        if sheet_format not in SHEET_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(SHEET_FORMATS)}"}), 400
+
+        try:
+            if 'ticket_ids' in data:
+                ticket_ids = data['ticket_ids']
+                if not isinstance(ticket_ids, list) or not ticket_ids:
+                    return jsonify({'error': 'ticket_ids must be a non-empty list'}), 400
+                if len(ticket_ids) > SHEET_MAX_TICKETS:
+                    raise ValueError(f"At most {SHEET_MAX_TICKETS} tickets per sheet run")
+            elif 'count' in data:
+                prefix = data.get('prefix', '')
+                start = int(data.get('start', 1))
+                count = int(data['count'])
+                if not 1 <= count <= SHEET_MAX_TICKETS:
+                    raise ValueError(f"count must be between 1 and {SHEET_MAX_TICKETS}")
+                width = sheet_option(data, 'digits', 6, int)
+                ticket_ids = (f"{prefix}{number:0{width}d}" for number in range(start, start + count))
+            else:
+                return jsonify({'error': 'ticket_ids or count is required'}), 400
+
+            options = {
+                'ticket_mm': sheet_option(data, 'ticket_mm', 10),
+                'gap_mm': sheet_option(data, 'gap_mm', 2),
+                'margin_mm': sheet_option(data, 'margin_mm', 5),
+                'dpi': sheet_option(data, 'dpi', 300, int),
+            }
+            if data.get('roll_width_mm'):
+                layout = SheetLayout.roll(sheet_option(data, 'roll_width_mm', None),
+                                          sheet_option(data, 'rows', 1, int), **options)
+            else:
+                layout = SheetLayout.a4(**options)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+
+        shared = {key: data[key] for key in ('draw_date', 'ticket_price', 'draw_number') if key in data}
+        specs = ({'ticket_id': ticket_id, **shared} for ticket_id in ticket_ids)
+        imposer = SheetImposer(generator, layout)
+        chunks = imposer.stream(specs, sheet_format, workers=int(os.environ.get('IMPOSITION_WORKERS', 1)))
+        # Draw the first page before answering, so a bad request still gets a JSON error
+        first = next(chunks)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def body():
+        yield first
+        yield from chunks
+
+    return Response(
+        stream_with_context(body()),
+        mimetype=CONTENT_TYPES[sheet_format],
+        headers={'Content-Disposition': f'attachment; filename="tickets.{sheet_format}"'}
+    )
+
 @app.route('/verify', methods=['POST'])
 def verify_ticket():
     try:
@@ -102,15 +334,20 @@ def verify_ticket():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
         
-        # Save the image temporarily
-        temp_path = 'temp_qr.png'
-        file.save(temp_path)
-        
-        # Verify the QR code
-        is_valid, result = verifier.verify_composite_qr(temp_path)
+        # Frames from the same gate reuse the decode strategy that last worked there
+        gate_id = request.form.get('gate_id') or request.headers.get('X-Gate-Id')
         
-        # Clean up
-        os.remove(temp_path)
+        # Verify the QR code from the uploaded bytes, nothing is written to disk. A retry
+        # of the same request (same request ID and bytes) gets the first verdict back
+        image = file.read()
+        scan_key = scan_cache.key(request.form.get('request_id') or request.headers.get('X-Request-Id'), image)
+        try:
+            is_valid, result = scan_cache.get_or_verify(
+                scan_key, lambda: verification_service.verify(image, source=gate_id))
+        except ServiceOverloaded as e:
+            return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+        except DeadlineExceeded as e:
+            return jsonify({'error': str(e)}), 503
         
         return jsonify({
             'success': True,
@@ -121,10 +358,94 @@ def verify_ticket():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def payload_is_text(data):
+    # Payloads are the QR text; decoded dicts are never taken from clients
+    return isinstance(data.get('payload'), str) and isinstance(data.get('inner_payload'), (str, type(None)))
+
+@app.route('/verify-payload', methods=['POST'])
+def verify_payload():
+    # Clients that decode the QR on-device send its text instead of a photo:
+    # {"payload": ..., "inner_payload": ...} or {"tickets": [{...}, ...]}
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'JSON body required'}), 400
+        redeem = data.get('redeem', True) is not False
+        if 'tickets' in data:
+            tickets = data['tickets']
+            if not isinstance(tickets, list) or not all(isinstance(t, dict) for t in tickets):
+                return jsonify({'error': 'tickets must be a list of objects'}), 400
+            if not all(payload_is_text(t) for t in tickets):
+                return jsonify({'error': 'payload and inner_payload must be strings'}), 400
+            results = verifier.verify_tickets(
+                [(t['payload'], t.get('inner_payload')) for t in tickets], redeem=redeem)
+            return jsonify({
+                'success': True,
+                'results': [{'is_valid': is_valid, 'result': result} for is_valid, result in results]
+            })
+        if not data.get('payload'):
+            return jsonify({'error': 'payload is required'}), 400
+        if not payload_is_text(data):
+            return jsonify({'error': 'payload and inner_payload must be strings'}), 400
+        is_valid, result = verifier.verify_ticket(data['payload'], data.get('inner_payload'), redeem=redeem)
+        return jsonify({
+            'success': True,
+            'is_valid': is_valid,
+            'result': result
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health')
 def health_check():
     return jsonify({'status': 'healthy'})
 
+@app.route('/metrics')
+def metrics():
+    # Prometheus and OpenMetrics scrapers ask for text; everyone else gets JSON
+    accept = request.headers.get('Accept', '')
+    if 'openmetrics' in accept or 'text/plain' in accept or request.args.get('format') == 'openmetrics':
+        return Response(
+            instrumentation.render_openmetrics(
+                gauges={
+                    **{f'service_{name}': value for name, value in verification_service.metrics().items()},
+                    **{f'image_cache_{name}': value for name, value in image_cache.stats().items()},
+                    **{f'scan_cache_{name}': value for name, value in scan_cache.stats().items()},
+                }),
+            mimetype='application/openmetrics-text; version=1.0.0; charset=utf-8'
+        )
+    return jsonify({
+        'service': verification_service.metrics(),
+        'decoder': verifier.decoder.name,
+        'decode_strategies': dict(verifier.strategy_hits),
+        'inner_qr': verifier.preprocess_report(),
+        'image_cache': image_cache.stats(),
+        'scan_cache': scan_cache.stats(),
+        **instrumentation.snapshot()
+    })
+
+if os.environ.get('PROFILER_ENDPOINTS') == '1':
+    @app.route('/debug/profiler', methods=['GET', 'POST'])
+    def sampling_profiler():
+        if request.method == 'POST':
+            action = (request.get_json(silent=True) or {}).get('action') or request.args.get('action')
+            if action == 'start':
+                profiler.start()
+            elif action == 'stop':
+                profiler.stop()
+            elif action == 'reset':
+                profiler.reset()
+            else:
+                return jsonify({'error': 'action must be start, stop or reset'}), 400
+        if request.args.get('format') == 'collapsed':
+            return Response(profiler.collapsed() + '\n', mimetype='text/plain')
+        return jsonify({
+            'running': profiler.running,
+            'samples': profiler.sample_count,
+            'top': profiler.top()
+        })
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)